@@ -0,0 +1,148 @@
+import math
+from datetime import date, datetime
+
+from sqlalchemy import distinct, func, select
+
+from streaming import StreamingAggregator
+
+# Columns callers may filter or group on
+DIMENSIONS = ('commodity', 'market', 'state', 'district')
+
+
+def parse_date(value):
+    """Accept a date, an ISO string or a dd/mm/YYYY string"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {value}")
+
+
+class PriceAggregator:
+    """Price statistics computed by the database with GROUP BY.
+
+    The sample variance comes from the count, sum and sum of squares of the
+    prices, so it needs no pass of its own.
+
+    ``source`` is any selectable exposing ``id``, ``date``, ``price`` and the
+    ``DIMENSIONS`` as named columns. ``filters`` maps any of ``DIMENSIONS``
+    to a value or a list of values; ``start`` and ``end`` bound the date
+    window inclusively.
+    """
+
+    def __init__(self, session, source):
+        self.session = session
+        self.model = source.c
+
+    def _where(self, statement, start=None, end=None, filters=None):
+        model = self.model
+        for name, value in (filters or {}).items():
+            if name not in DIMENSIONS:
+                raise ValueError(f"Cannot filter on {name}")
+            if value is None or value == '':
+                continue
+            column = model[name]
+            if isinstance(value, (list, tuple, set)):
+                statement = statement.where(column.in_(list(value)))
+            else:
+                statement = statement.where(column == value)
+        if start is not None:
+            statement = statement.where(model.date >= parse_date(start))
+        if end is not None:
+            statement = statement.where(model.date <= parse_date(end))
+        return statement
+
+    def latest_date(self, filters=None):
+        statement = self._where(select(func.max(self.model.date)), filters=filters)
+        return self.session.execute(statement).scalar()
+
+    def _measures(self):
+        model = self.model
+        return (
+            func.count(model.id).label('count'),
+            func.avg(model.price).label('avg_price'),
+            func.min(model.price).label('min_price'),
+            func.max(model.price).label('max_price'),
+            func.count(model.price).label('priced'),
+            func.sum(model.price).label('price_sum'),
+            func.sum(model.price * model.price).label('price_sum_squares'),
+            func.count(distinct(model.commodity)).label('commodity_count'),
+            func.count(distinct(model.market)).label('market_count'),
+            func.count(distinct(model.state)).label('state_count')
+        )
+
+    def summary(self, start=None, end=None, filters=None):
+        """Totals over the whole window as one dict"""
+        statement = self._where(select(*self._measures()), start, end, filters)
+        row = self.session.execute(statement).one()
+        return self._row_dict(row)
+
+    def group(self, group_by=('commodity',), start=None, end=None, filters=None, order_by=None):
+        """One dict per group with count, avg/min/max price and distinct counts"""
+        group_columns = []
+        for name in group_by:
+            if name not in DIMENSIONS and name != 'date':
+                raise ValueError(f"Cannot group on {name}")
+            group_columns.append(self.model[name])
+
+        statement = select(*group_columns, *self._measures()).group_by(*group_columns)
+        statement = self._where(statement, start, end, filters)
+        statement = statement.order_by(*(self.model[name] for name in (order_by or group_by)))
+        return [self._row_dict(row) for row in self.session.execute(statement)]
+
+    def series(self, key='commodity', start=None, end=None, filters=None):
+        """Average price per day for every value of ``key``, as {value: [(date, avg), ...]}"""
+        result = {}
+        for row in self.group((key, 'date'), start, end, filters):
+            result.setdefault(row[key], []).append((row['date'], row['avg_price']))
+        return result
+
+    def stream(self, group_by=(), start=None, end=None, filters=None, quantiles=(), batch_size=1000):
+        """Per-group and overall statistics, as (groups, summary).
+
+        Everything but quantiles comes from ``group`` and ``summary``.
+        Quantiles such as ``p50_price``, which GROUP BY cannot compute
+        portably, are opt-in: asking for them adds one streamed pass over the
+        prices and the group columns.
+        """
+        groups = self.group(group_by, start, end, filters) if group_by else []
+        summary = self.summary(start, end, filters)
+        if not quantiles:
+            return groups, summary
+        model = self.model
+        statement = self._where(select(model.price, *(model[name] for name in group_by)), start, end, filters)
+        spreads = StreamingAggregator(group_by, 'price', quantiles=quantiles)
+        spreads.consume(self.session.execute(
+            statement.execution_options(stream_results=True, yield_per=batch_size)
+        ))
+        by_key = spreads.groups()
+        for group in groups:
+            self._add_quantiles(group, by_key.get(tuple(group[name] for name in group_by)), quantiles)
+        return groups, self._add_quantiles(summary, spreads.summary(), quantiles)
+
+    @staticmethod
+    def _add_quantiles(data, stats, quantiles):
+        for p in quantiles:
+            data[f"p{round(p * 100)}_price"] = stats['quantiles'][p] if stats else None
+        return data
+
+    @staticmethod
+    def _row_dict(row):
+        data = dict(row._mapping)
+        for name in ('avg_price', 'min_price', 'max_price'):
+            data[name] = float(data[name]) if data[name] is not None else 0.0
+        priced = data.pop('priced')
+        total = float(data.pop('price_sum') or 0.0)
+        squares = float(data.pop('price_sum_squares') or 0.0)
+        # Sample variance, zero until there are two prices; rounding can push it just below zero
+        variance = max((squares - total * total / priced) / (priced - 1), 0.0) if priced > 1 else 0.0
+        data['variance'] = variance
+        data['std_price'] = math.sqrt(variance)
+        return data
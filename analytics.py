@@ -0,0 +1,165 @@
+import numpy as np
+
+
+def _window_sums(values, window):
+    """Trailing sums over the last axis; NaN counts as 0. Also returns the non-NaN counts"""
+    present = ~np.isnan(values)
+    shape = values.shape[:-1] + (1,)
+    value_sums = np.concatenate([np.zeros(shape), np.cumsum(np.where(present, values, 0.0), axis=-1)], axis=-1)
+    counts = np.concatenate([np.zeros(shape), np.cumsum(present, axis=-1)], axis=-1)
+    ends = np.arange(1, values.shape[-1] + 1)
+    starts = np.maximum(ends - window, 0)
+    return value_sums[..., ends] - value_sums[..., starts], counts[..., ends] - counts[..., starts]
+
+
+def _divide(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), np.nan)
+
+
+def _shift(values, periods=1):
+    """Move values ``periods`` steps later along the last axis, filling with NaN"""
+    shifted = np.full_like(values, np.nan)
+    shifted[..., periods:] = values[..., :-periods]
+    return shifted
+
+
+class PriceMatrix:
+    """Daily prices as a commodity × market × date array.
+
+    Cells where a market did not report are NaN. Dates are the days that
+    have any price, so "day over day" means since the series' previous
+    report. Derived arrays are computed once per instance and kept, so a
+    matrix cached for one data version answers every later request for free.
+    """
+
+    def __init__(self, commodities, markets, dates, prices):
+        self.commodities = list(commodities)
+        self.markets = list(markets)
+        self.dates = list(dates)
+        self.prices = prices
+        self._commodity_index = {name: index for index, name in enumerate(self.commodities)}
+        self._market_index = {name: index for index, name in enumerate(self.markets)}
+        self._date_index = {day: index for index, day in enumerate(self.dates)}
+        self._memo = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (commodity, market, date, price) rows, at most one per cell"""
+        if not rows:
+            return cls([], [], [], np.empty((0, 0, 0)))
+        commodity_names, market_names, days, prices = zip(*rows)
+        commodities, commodity_codes = np.unique(np.array(commodity_names, dtype=object), return_inverse=True)
+        markets, market_codes = np.unique(np.array(market_names, dtype=object), return_inverse=True)
+        dates, date_codes = np.unique(np.array(days, dtype=object), return_inverse=True)
+        matrix = np.full((len(commodities), len(markets), len(dates)), np.nan)
+        matrix[commodity_codes, market_codes, date_codes] = np.array(prices, dtype=float)
+        return cls(commodities, markets, dates, matrix)
+
+    def _cached(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def filled(self):
+        """Prices carried forward over days a market did not report"""
+        def compute():
+            present = ~np.isnan(self.prices)
+            last_seen = np.where(present, np.arange(self.prices.shape[-1]), 0)
+            np.maximum.accumulate(last_seen, axis=-1, out=last_seen)
+            filled = np.take_along_axis(self.prices, last_seen, axis=-1)
+            # Days before the first report stay NaN
+            filled[np.cumsum(present, axis=-1) == 0] = np.nan
+            return filled
+        return self._cached('filled', compute)
+
+    def day_over_day(self):
+        """Percentage change of each reported price against the series' previous report"""
+        def compute():
+            previous = _shift(self.filled())
+            return _divide(self.prices - previous, previous) * 100
+        return self._cached('day_over_day', compute)
+
+    def rolling_mean(self, window=7):
+        """Mean of the reported prices in the trailing ``window`` days"""
+        def compute():
+            sums, counts = _window_sums(self.prices, window)
+            return _divide(sums, counts)
+        return self._cached(('rolling_mean', window), compute)
+
+    def rolling_volatility(self, window=7):
+        """Standard deviation of the day-over-day changes in the trailing ``window`` days"""
+        def compute():
+            changes = self.day_over_day()
+            sums, counts = _window_sums(changes, window)
+            squares, _ = _window_sums(changes * changes, window)
+            mean = _divide(sums, counts)
+            variance = _divide(squares, counts) - mean * mean
+            return np.where(counts > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+        return self._cached(('rolling_volatility', window), compute)
+
+    def zscores(self, window=7):
+        """Distance of each price from the previous ``window`` days, in standard deviations"""
+        def compute():
+            sums, counts = _window_sums(self.prices, window)
+            squares, _ = _window_sums(self.prices * self.prices, window)
+            mean = _shift(_divide(sums, counts))
+            std = _shift(np.sqrt(np.maximum(_divide(squares, counts) - _divide(sums, counts) ** 2, 0.0)))
+            counts = _shift(counts)
+            return np.where((counts > 1) & (std > 0), _divide(self.prices - mean, std), np.nan)
+        return self._cached(('zscores', window), compute)
+
+    def anomalies(self, window=7, threshold=3.0):
+        with np.errstate(invalid='ignore'):
+            return np.abs(self.zscores(window)) >= threshold
+
+    def spreads(self):
+        """Cross-market low, high, spread and spread relative to the mean, each commodity × date"""
+        def compute():
+            present = ~np.isnan(self.prices)
+            reported = present.any(axis=1)
+            low = np.where(reported, np.where(present, self.prices, np.inf).min(axis=1, initial=np.inf), np.nan)
+            high = np.where(reported, np.where(present, self.prices, -np.inf).max(axis=1, initial=-np.inf), np.nan)
+            mean = _divide(np.where(present, self.prices, 0.0).sum(axis=1), present.sum(axis=1))
+            return {'low': low, 'high': high, 'spread': high - low, 'relative': _divide(high - low, mean)}
+        return self._cached('spreads', compute)
+
+    def value(self, array, commodity, market, day):
+        """One cell of a commodity × market × date array, or None when missing"""
+        try:
+            cell = array[self._commodity_index[commodity], self._market_index[market], self._date_index[day]]
+        except KeyError:
+            return None
+        return None if np.isnan(cell) else float(cell)
+
+    def series_rows(self, start=None, window=7, threshold=3.0):
+        """Every reported cell from ``start`` on with its analytics, grouped per commodity.
+
+        Returns {commodity: [row, ...]} with rows ordered by date then market.
+        """
+        first = 0
+        if start is not None:
+            first = int(np.searchsorted(np.array(self.dates, dtype=object), start))
+        prices = self.prices[:, :, first:]
+        # Commodity, date, market order so nonzero() yields rows already sorted
+        order = (0, 2, 1)
+        cells = np.nonzero(~np.isnan(prices.transpose(order)))
+        columns = {
+            'price': prices.transpose(order)[cells],
+            'change': self.day_over_day()[:, :, first:].transpose(order)[cells],
+            'rolling_mean': self.rolling_mean(window)[:, :, first:].transpose(order)[cells],
+            'volatility': self.rolling_volatility(window)[:, :, first:].transpose(order)[cells],
+            'anomaly': self.anomalies(window, threshold)[:, :, first:].transpose(order)[cells],
+            'spread': self.spreads()['spread'][:, first:][cells[0], cells[1]]
+        }
+        columns = {
+            name: [None if value != value else value for value in values.tolist()]
+            for name, values in columns.items()
+        }
+        result = {}
+        for index, (commodity, day, market) in enumerate(zip(*cells)):
+            row = {name: values[index] for name, values in columns.items()}
+            row['date'] = self.dates[first + day]
+            row['market'] = self.markets[market]
+            result.setdefault(self.commodities[commodity], []).append(row)
+        return result
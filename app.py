@@ -1,11 +1,44 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+import base64
+import click
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, flash, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, inspect, select, tuple_, update
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.orm import aliased
+from sqlalchemy.ext.hybrid import hybrid_property
+from werkzeug.http import generate_etag
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
+from itertools import islice
+import json
 import logging
 import os
+import time
+
+from aggregation import PriceAggregator, parse_date
+from analytics import PriceMatrix
+from cache import LRUCache, ResponseCache
+from ingest import RECORD_KEY, RECORD_KEY_INDEX, IngestStats, dialect_insert, ensure_record_key, upsert_market_records
+from dimensions import DimensionEncoder
+from discovery import SpreadIndexer
+from encoding import compress_response
+from export import EXPORT_FORMATS, available_formats, column_types, iter_query_rows, stream_export
+from fanout import HostRateLimits, fan_out
+from forecast import ForecastMaintainer
+from lookup import MaterializedLookup
+from metrics import CONTENT_TYPE, QUERY_COUNT_BUCKETS, MetricsRegistry, QueryTracker, SamplingProfiler
+from migrations import detach_legacy_table, drop_table, ensure_indexes, iter_table_batches, migrate_market_dates
+from retention import purge_before
+from rollups import RollupMaintainer, period_end
+from scheduler import IngestionScheduler, retry_with_backoff
+from streaming import StreamingAggregator
+from storage import REPLICA_BIND, RoutingSession, describe_engine, engine_options, install_pragmas, sqlite_pragmas
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,12 +50,174 @@ logger = logging.getLogger(__name__)
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///market.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///market.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = '579b464db66ec23bdd000001ae581df7f2744e205d6478735786d3ae'
 
+# Upstream response cache settings
+app.config['MARKET_CACHE_TTL'] = int(os.environ.get('MARKET_CACHE_TTL', 300))
+app.config['MARKET_CACHE_NEGATIVE_TTL'] = int(os.environ.get('MARKET_CACHE_NEGATIVE_TTL', 60))
+app.config['MARKET_CACHE_MAX_ENTRIES'] = int(os.environ.get('MARKET_CACHE_MAX_ENTRIES', 256))
+app.config['MARKET_CACHE_SHARED_PATH'] = os.environ.get(
+    'MARKET_CACHE_SHARED_PATH', os.path.join(app.instance_path, 'market_cache.db')
+)
+
+# Look-back window used when today's market data is not yet published
+app.config['MARKET_LOOKBACK_DAYS'] = int(os.environ.get('MARKET_LOOKBACK_DAYS', 10))
+app.config['MARKET_LOOKBACK_WORKERS'] = int(os.environ.get('MARKET_LOOKBACK_WORKERS', 5))
+app.config['MARKET_LOOKBACK_DEADLINE'] = float(os.environ.get('MARKET_LOOKBACK_DEADLINE', 15))
+
+# Upstream pagination; pages beyond the first are prefetched in parallel
+app.config['MARKET_PAGE_SIZE'] = int(os.environ.get('MARKET_PAGE_SIZE', 1000))
+app.config['MARKET_PAGE_PREFETCH'] = int(os.environ.get('MARKET_PAGE_PREFETCH', 2))
+
+# Area shown by the pages when the query string does not pick one
+app.config['MARKET_STATE'] = os.environ.get('MARKET_STATE', 'Tamil Nadu')
+app.config['MARKET_DISTRICT'] = os.environ.get('MARKET_DISTRICT', 'Salem')
+
+# Upstream client: retries with backoff, then a circuit breaker that fails fast while it is down
+app.config['MARKET_API_URL'] = os.environ.get(
+    'MARKET_API_URL', 'https://api.data.gov.in/resource/35985678-0d79-46b4-9ed6-6f13308a1d24'
+)
+app.config['MARKET_RETRIES'] = int(os.environ.get('MARKET_RETRIES', 3))
+app.config['MARKET_RETRY_BACKOFF'] = float(os.environ.get('MARKET_RETRY_BACKOFF', 0.5))
+app.config['MARKET_RETRY_BACKOFF_CAP'] = float(os.environ.get('MARKET_RETRY_BACKOFF_CAP', 8))
+app.config['MARKET_CONNECT_TIMEOUT'] = float(os.environ.get('MARKET_CONNECT_TIMEOUT', 3.05))
+app.config['MARKET_READ_TIMEOUT'] = float(os.environ.get('MARKET_READ_TIMEOUT', 10))
+app.config['MARKET_BREAKER_THRESHOLD'] = int(os.environ.get('MARKET_BREAKER_THRESHOLD', 5))
+app.config['MARKET_BREAKER_RESET'] = float(os.environ.get('MARKET_BREAKER_RESET', 30))
+
+# Upstream requests per second allowed per host, shared by every thread
+app.config['MARKET_RATE_LIMIT'] = float(os.environ.get('MARKET_RATE_LIMIT', 5))
+app.config['MARKET_RATE_BURST'] = int(os.environ.get('MARKET_RATE_BURST', 10))
+
+# Background ingestion: slices are "State:District[:Commodity]" separated by ";",
+# or "*" to fan out over every state/district the upstream reports
+app.config['INGEST_SLICES'] = os.environ.get('INGEST_SLICES', '*')
+app.config['INGEST_WORKERS'] = int(os.environ.get('INGEST_WORKERS', 4))
+app.config['INGEST_INTERVAL'] = int(os.environ.get('INGEST_INTERVAL', 3600))
+app.config['INGEST_DAYS'] = int(os.environ.get('INGEST_DAYS', 2))
+app.config['INGEST_RETRIES'] = int(os.environ.get('INGEST_RETRIES', 4))
+# A fan-out run that failed or was interrupted is resumed under its run id by the next one, for up
+# to INGEST_CHECKPOINT_DAYS; the retention job deletes checkpoints of finished runs older than that
+app.config['INGEST_CHECKPOINT_DAYS'] = int(os.environ.get('INGEST_CHECKPOINT_DAYS', 7))
+app.config['RETENTION_INTERVAL'] = int(os.environ.get('RETENTION_INTERVAL', 86400))
+app.config['RETENTION_DAYS'] = int(os.environ.get('RETENTION_DAYS', 30))
+app.config['RETENTION_CHUNK_SIZE'] = int(os.environ.get('RETENTION_CHUNK_SIZE', 5000))
+# Expired rows are archived here before deletion ("csv" or "parquet"); empty disables
+app.config['RETENTION_ARCHIVE_DIR'] = os.environ.get('RETENTION_ARCHIVE_DIR', '')
+app.config['RETENTION_ARCHIVE_FORMAT'] = os.environ.get('RETENTION_ARCHIVE_FORMAT', 'csv')
+# Routes read from the local store only; enable to fetch live when it is empty
+app.config['MARKET_LIVE_FALLBACK'] = os.environ.get('MARKET_LIVE_FALLBACK', '0') == '1'
+# Rows fetched per round trip from the server-side cursor behind /reports/export
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+# Page size of /api/market-data when the client does not ask for one, and its upper bound
+app.config['API_PAGE_SIZE'] = int(os.environ.get('API_PAGE_SIZE', 100))
+app.config['API_MAX_PAGE_SIZE'] = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+# Trend analytics: trailing window in reported days and the z-score flagged as an anomaly
+app.config['ANALYTICS_WINDOW'] = int(os.environ.get('ANALYTICS_WINDOW', 7))
+app.config['ANALYTICS_ANOMALY_THRESHOLD'] = float(os.environ.get('ANALYTICS_ANOMALY_THRESHOLD', 3.0))
+# Seconds between checks of the lookup tables behind the autocomplete indexes
+app.config['LOOKUP_CHECK_INTERVAL'] = float(os.environ.get('LOOKUP_CHECK_INTERVAL', 1.0))
+# Cross-market spreads returned by /api/price-discovery when no limit is given, and its upper bound
+app.config['DISCOVERY_LIMIT'] = int(os.environ.get('DISCOVERY_LIMIT', 20))
+app.config['DISCOVERY_MAX_LIMIT'] = int(os.environ.get('DISCOVERY_MAX_LIMIT', 500))
+# Rendered dashboard pages and their data fragments kept per process, keyed on the data version
+app.config['PAGE_CACHE_ENTRIES'] = int(os.environ.get('PAGE_CACHE_ENTRIES', 128))
+app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 3600))
+# Price forecasts: days ahead, history fitted, weekly season, band coverage, and the reported
+# days a series needs; refits run in FORECAST_WORKERS processes daily at FORECAST_HOUR (local time).
+# By default one core is left to the web workers and at most 4 are used, as each holds numpy and a chunk
+app.config['FORECAST_HORIZON'] = int(os.environ.get('FORECAST_HORIZON', 7))
+app.config['FORECAST_HISTORY_DAYS'] = int(os.environ.get('FORECAST_HISTORY_DAYS', 120))
+app.config['FORECAST_SEASON'] = int(os.environ.get('FORECAST_SEASON', 7))
+app.config['FORECAST_CONFIDENCE'] = float(os.environ.get('FORECAST_CONFIDENCE', 0.8))
+app.config['FORECAST_MIN_OBSERVATIONS'] = int(os.environ.get('FORECAST_MIN_OBSERVATIONS', 7))
+app.config['FORECAST_WORKERS'] = int(os.environ.get('FORECAST_WORKERS', min(max((os.cpu_count() or 1) - 1, 1), 4)))
+app.config['FORECAST_HOUR'] = int(os.environ.get('FORECAST_HOUR', 2))
+# Requests taking at least this many seconds have their sampled stacks written to PROFILE_DIR
+# as folded flame-graph input; 0 disables the sampling profiler
+app.config['PROFILE_SLOW_REQUESTS'] = float(os.environ.get('PROFILE_SLOW_REQUESTS', 0))
+app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(app.instance_path, 'profiles'))
+# Metrics live in each process. Under several gunicorn workers (gunicorn.conf.py sets this) every
+# process snapshots its counters and histograms into METRICS_MULTIPROC_DIR each METRICS_FLUSH_INTERVAL
+# seconds and /metrics sums them, up to one interval behind; cache, circuit and database values stay
+# per process and carry a pid label. Left empty, /metrics reports only the process that answers
+app.config['METRICS_MULTIPROC_DIR'] = os.environ.get('METRICS_MULTIPROC_DIR', '')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Storage: connection pool for every backend, pragmas for SQLite, and an optional
+# read replica (e.g. a read-only copy of the SQLite file) that serves plain SELECTs
+app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL', '')
+app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+app.config['DATABASE_MAX_OVERFLOW'] = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+app.config['DATABASE_POOL_TIMEOUT'] = float(os.environ.get('DATABASE_POOL_TIMEOUT', 30))
+app.config['DATABASE_POOL_RECYCLE'] = int(os.environ.get('DATABASE_POOL_RECYCLE', 3600))
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+
+
+def storage_options(url):
+    return engine_options(
+        url,
+        pool_size=app.config['DATABASE_POOL_SIZE'],
+        max_overflow=app.config['DATABASE_MAX_OVERFLOW'],
+        pool_timeout=app.config['DATABASE_POOL_TIMEOUT'],
+        pool_recycle=app.config['DATABASE_POOL_RECYCLE'],
+        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT']
+    )
+
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = storage_options(app.config['SQLALCHEMY_DATABASE_URI'])
+if app.config['DATABASE_REPLICA_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {
+        REPLICA_BIND: {'url': app.config['DATABASE_REPLICA_URL'], **storage_options(app.config['DATABASE_REPLICA_URL'])}
+    }
+
+# Request, upstream, database and ingestion metrics served at /metrics
+metrics = MetricsRegistry(app.config['METRICS_MULTIPROC_DIR'] or None, app.config['METRICS_FLUSH_INTERVAL'])
+query_tracker = QueryTracker()
+request_latency = metrics.histogram(
+    'http_request_duration_seconds', 'Time to build the response, by route', ('route', 'method')
+)
+request_count = metrics.counter('http_requests_total', 'Responses by route and status', ('route', 'method', 'status'))
+request_queries = metrics.histogram(
+    'http_request_db_queries', 'Database statements per request', ('route',), buckets=QUERY_COUNT_BUCKETS
+)
+request_query_time = metrics.histogram(
+    'http_request_db_seconds', 'Time spent in the database per request', ('route',)
+)
+upstream_latency = metrics.histogram(
+    'upstream_request_duration_seconds', 'Upstream page requests, by days before today requested', ('days_back',)
+)
+upstream_count = metrics.counter(
+    'upstream_requests_total', 'Upstream page requests by days back and status or error', ('days_back', 'status')
+)
+ingest_queries = metrics.histogram(
+    'ingest_page_db_queries', 'Database statements per stored upstream page', buckets=QUERY_COUNT_BUCKETS
+)
+ingested_records = metrics.counter('ingested_records_total', 'Upstream records stored, by outcome', ('outcome',))
+slow_request_profiler = SamplingProfiler(
+    app.config['PROFILE_SLOW_REQUESTS'], app.config['PROFILE_INTERVAL'], app.config['PROFILE_DIR']
+) if app.config['PROFILE_SLOW_REQUESTS'] > 0 else None
+
 # Initialize database and login manager
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+with app.app_context():
+    for bind_key, bind_engine in db.engines.items():
+        install_pragmas(bind_engine, sqlite_pragmas(
+            journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+            synchronous=app.config['SQLITE_SYNCHRONOUS'],
+            cache_size_kb=app.config['SQLITE_CACHE_SIZE_KB'],
+            mmap_size=app.config['SQLITE_MMAP_SIZE'],
+            busy_timeout=app.config['SQLITE_BUSY_TIMEOUT'],
+            read_only=bind_key == REPLICA_BIND
+        ))
+        query_tracker.install(bind_engine)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -34,171 +229,361 @@ class User(db.Model, UserMixin):
     password = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
 
+class State(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+class District(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('state_id', 'name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    state_id = db.Column(db.Integer, db.ForeignKey('state.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    state = db.relationship('State', lazy='joined')
+
+class Market(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('district_id', 'name'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    district_id = db.Column(db.Integer, db.ForeignKey('district.id'), nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    district = db.relationship('District', lazy='joined')
+
+class Commodity(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    code = db.Column(db.String(20))
+
 class MarketData(db.Model):
+    __table_args__ = (
+        db.Index(RECORD_KEY_INDEX, *RECORD_KEY, unique=True),
+        db.Index('ix_market_data_market_date', 'market_id', 'date'),
+        db.Index('ix_market_data_commodity_date', 'commodity_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    commodity = db.Column(db.String(100))
-    market = db.Column(db.String(100))
-    price = db.Column(db.Float)
-    date = db.Column(db.String(20))
-    state = db.Column(db.String(100))
-    district = db.Column(db.String(100))
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False)
+    commodity_id = db.Column(db.Integer, db.ForeignKey('commodity.id'), nullable=False)
+    date = db.Column(db.Date)
+    # Part of the record key, so '' rather than NULL when the upstream leaves them out
+    variety = db.Column(db.String(100), nullable=False, default='', server_default='')
+    grade = db.Column(db.String(50), nullable=False, default='', server_default='')
+    # Upstream prices are per quintal; price is the modal price per kg
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    modal_price = db.Column(db.Float)
 
-# Create database tables
-with app.app_context():
-    db.create_all()
-    # Create a test user if none exists
-    if not User.query.filter_by(username='admin').first():
-        test_user = User(
-            username='admin',
-            password='admin123',
-            email='admin@example.com'
-        )
-        db.session.add(test_user)
-        db.session.commit()
-        logger.info("Admin user created successfully")
+    market_ref = db.relationship('Market', lazy='joined')
+    commodity_ref = db.relationship('Commodity', lazy='joined')
+
+    @hybrid_property
+    def price(self):
+        return self.modal_price / 100.0 if self.modal_price is not None else None
+
+    @price.setter
+    def price(self, value):
+        self.modal_price = value * 100.0
+
+    @price.expression
+    def price(cls):
+        return cls.modal_price / 100.0
+
+    @property
+    def market(self):
+        return self.market_ref.name
+
+    @property
+    def commodity(self):
+        return self.commodity_ref.name
+
+    @property
+    def district(self):
+        return self.market_ref.district.name
+
+    @property
+    def state(self):
+        return self.market_ref.district.state.name
+
+class PriceRollup(db.Model):
+    __table_args__ = (
+        db.Index('uq_price_rollup', 'grain', 'period_start', 'market_id', 'commodity_id', unique=True),
+        db.Index('ix_price_rollup_market', 'grain', 'market_id', 'period_start'),
+        # Markets of one commodity on one day, cheapest first
+        db.Index('ix_price_rollup_ladder', 'grain', 'period_start', 'commodity_id', 'avg_price'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    grain = db.Column(db.String(10), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False)
+    commodity_id = db.Column(db.Integer, db.ForeignKey('commodity.id'), nullable=False)
+    record_count = db.Column(db.Integer)
+    price_sum = db.Column(db.Float)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    avg_price = db.Column(db.Float)
+    last_date = db.Column(db.Date)
+    last_price = db.Column(db.Float)
+
+class PriceSpread(db.Model):
+    __table_args__ = (
+        db.Index('uq_price_spread', 'state_id', 'commodity_id', 'date', unique=True),
+        db.Index('ix_price_spread_day', 'state_id', 'date', 'spread'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    state_id = db.Column(db.Integer, db.ForeignKey('state.id'), nullable=False)
+    commodity_id = db.Column(db.Integer, db.ForeignKey('commodity.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    market_count = db.Column(db.Integer)
+    buy_market_id = db.Column(db.Integer, db.ForeignKey('market.id'))
+    buy_price = db.Column(db.Float)
+    sell_market_id = db.Column(db.Integer, db.ForeignKey('market.id'))
+    sell_price = db.Column(db.Float)
+    spread = db.Column(db.Float)
+    relative_spread = db.Column(db.Float)
+    mean_price = db.Column(db.Float)
+    std_price = db.Column(db.Float)
+
+class IngestCheckpoint(db.Model):
+    __table_args__ = (
+        db.Index('uq_ingest_checkpoint', 'run_id', 'state', 'district', 'date', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(100), nullable=False)
+    state = db.Column(db.String(100), nullable=False)
+    district = db.Column(db.String(100), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20))
+    records = db.Column(db.Integer)
+    error = db.Column(db.String(500))
+    finished_at = db.Column(db.DateTime)
+
+class IngestRun(db.Model):
+    """A region fan-out run; it stays open, and is resumed, until it finishes without failures"""
+    run_id = db.Column(db.String(100), primary_key=True)
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, index=True)
+
+class DataVersion(db.Model):
+    """Single-row counter bumped in the same transaction as every write to the market data"""
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class ForecastSeries(db.Model):
+    """Fit of one market's commodity series and the fingerprint of the raw rows it was fitted on"""
+    __table_args__ = (
+        db.Index('uq_forecast_series', 'market_id', 'commodity_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False)
+    commodity_id = db.Column(db.Integer, db.ForeignKey('commodity.id'), nullable=False)
+    # Raw rows behind the fit, one per variety and grade reported each day
+    observations = db.Column(db.Integer)
+    last_date = db.Column(db.Date)
+    price_total = db.Column(db.Float)
+    # None when the series has too little history to forecast
+    model = db.Column(db.String(20))
+    rmse = db.Column(db.Float)
+    fitted_at = db.Column(db.DateTime)
+
+class PriceForecast(db.Model):
+    __table_args__ = (
+        db.Index('uq_price_forecast', 'market_id', 'commodity_id', 'target_date', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    market_id = db.Column(db.Integer, db.ForeignKey('market.id'), nullable=False)
+    commodity_id = db.Column(db.Integer, db.ForeignKey('commodity.id'), nullable=False)
+    target_date = db.Column(db.Date, nullable=False)
+    # Prices per kg; lower and upper bound the FORECAST_CONFIDENCE band
+    forecast = db.Column(db.Float)
+    lower = db.Column(db.Float)
+    upper = db.Column(db.Float)
+
+class JobRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), index=True)
+    started_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)
+    status = db.Column(db.String(20))
+    error = db.Column(db.String(500))
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
+# Shared by every MarketAPI instance so hits survive across requests
+response_cache = ResponseCache(
+    ttl=app.config['MARKET_CACHE_TTL'],
+    negative_ttl=app.config['MARKET_CACHE_NEGATIVE_TTL'],
+    max_entries=app.config['MARKET_CACHE_MAX_ENTRIES'],
+    shared_path=app.config['MARKET_CACHE_SHARED_PATH'] or None
+)
+
+def _table_version(model):
+    return tuple(db.session.execute(select(db.func.count(model.id), db.func.max(model.id))).one())
+
+def _commodity_entries():
+    statement = select(Commodity.id, Commodity.name, Commodity.code)
+    return [{'id': row.id, 'name': row.name, 'code': row.code or ''} for row in db.session.execute(statement)]
+
+def _market_entries():
+    statement = select(Market.id, Market.name, District.name.label('district'), State.name.label('state')) \
+        .join(District, Market.district_id == District.id) \
+        .join(State, District.state_id == State.id)
+    return [dict(row._mapping) for row in db.session.execute(statement)]
+
+# Autocomplete indexes over the lookup tables; ids are the tables' own primary keys
+commodity_lookup = MaterializedLookup(
+    _commodity_entries, lambda: _table_version(Commodity), app.config['LOOKUP_CHECK_INTERVAL']
+)
+market_lookup = MaterializedLookup(
+    _market_entries, lambda: _table_version(Market), app.config['LOOKUP_CHECK_INTERVAL']
+)
+
+# Every upstream request waits for a token from its host's bucket
+upstream_limits = HostRateLimits(app.config['MARKET_RATE_LIMIT'], app.config['MARKET_RATE_BURST'])
+
+# One pooled keep-alive client shared by every MarketAPI instance, look-back and fan-out thread
+upstream_client = UpstreamClient(
+    app.config['MARKET_API_URL'],
+    timeout=(app.config['MARKET_CONNECT_TIMEOUT'], app.config['MARKET_READ_TIMEOUT']),
+    retries=app.config['MARKET_RETRIES'],
+    backoff_base=app.config['MARKET_RETRY_BACKOFF'],
+    backoff_cap=app.config['MARKET_RETRY_BACKOFF_CAP'],
+    breaker=CircuitBreaker(app.config['MARKET_BREAKER_THRESHOLD'], app.config['MARKET_BREAKER_RESET']),
+    limiter=upstream_limits
+)
+
+class MarketAPIError(Exception):
+    """Raised when the upstream resource answers with an error status"""
+
+
 class MarketAPI:
-    BASE_URL = "https://api.data.gov.in/resource/35985678-0d79-46b4-9ed6-6f13308a1d24"
     API_KEY = "579b464db66ec23bdd000001ae581df7f2744e205d6478735786d3ae"
+
+    def __init__(self, cache=None, client=None):
+        self.cache = cache if cache is not None else response_cache
+        self.client = client or upstream_client
     
     def fetch_market_data(self, state=None, district=None, date=None, commodity=None):
-        """Fetch market data with fallback to yesterday if today's data not found"""
-        today = datetime.now().strftime('%d/%m/%Y')
-        data = self.fetch_data_for_date(today, state, district, commodity)
-        
-        if not data.get('records'):
-            yesterday = (datetime.now() - timedelta(days=1)).strftime('%d/%m/%Y')
-            data = self.fetch_data_for_date(yesterday, state, district, commodity)
-            
-            if not data.get('records'):
-                for days_back in range(2, 10):
-                    previous_date = (datetime.now() - timedelta(days=days_back)).strftime('%d/%m/%Y')
-                    data = self.fetch_data_for_date(previous_date, state, district, commodity)
-                    if data.get('records'):
-                        logger.info(f"Using data from {previous_date}")
-                        break
-        
+        """Fetch the most recent day with market data inside the look-back window"""
+        dates = [
+            (datetime.now() - timedelta(days=days_back)).strftime('%d/%m/%Y')
+            for days_back in range(max(app.config['MARKET_LOOKBACK_DAYS'], 1))
+        ]
+        if app.config['MARKET_LOOKBACK_WORKERS'] > 1:
+            return self._fetch_latest_concurrent(dates, state, district, commodity)
+        return self._fetch_latest_sequential(dates, state, district, commodity)
+
+    def _fetch_latest_sequential(self, dates, state, district, commodity):
+        """Walk the look-back window one day at a time, newest first"""
+        deadline = time.monotonic() + app.config['MARKET_LOOKBACK_DEADLINE']
+        data = {'records': [], 'total': 0}
+        for day in dates:
+            if time.monotonic() >= deadline:
+                logger.warning(f"Look-back deadline reached before {day}")
+                break
+            data = self.fetch_data_for_date(day, state, district, commodity)
+            if data.get('records'):
+                if day != dates[0]:
+                    logger.info(f"Using data from {day}")
+                break
         return data
 
+    def _fetch_latest_concurrent(self, dates, state, district, commodity):
+        """Request the whole look-back window at once and keep the newest non-empty day"""
+        deadline = time.monotonic() + app.config['MARKET_LOOKBACK_DEADLINE']
+        executor = ThreadPoolExecutor(
+            max_workers=min(app.config['MARKET_LOOKBACK_WORKERS'], len(dates)),
+            thread_name_prefix='lookback'
+        )
+        data = {'records': [], 'total': 0}
+        try:
+            futures = [
+                executor.submit(self._fetch_in_app_context, day, state, district, commodity)
+                for day in dates
+            ]
+            # Results are consumed newest first, so an older day is only used
+            # once every more recent day is known to be empty
+            for day, future in zip(dates, futures):
+                try:
+                    data = future.result(timeout=max(deadline - time.monotonic(), 0))
+                except FuturesTimeoutError:
+                    logger.warning(f"Look-back deadline reached while waiting for {day}")
+                    return {'records': [], 'total': 0, 'error': 'Look-back deadline exceeded'}
+                if data.get('records'):
+                    if day != dates[0]:
+                        logger.info(f"Using data from {day}")
+                    return data
+            return data
+        finally:
+            # Drop requests for older days that have not started yet; the ones
+            # already in flight finish in the background and land in the cache
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_in_app_context(self, date, state, district, commodity):
+        with app.app_context():
+            return self.fetch_data_for_date(date, state, district, commodity)
+
     def fetch_data_for_date(self, date, state=None, district=None, commodity=None):
-        """Fetch market data for a specific date and store in database"""
+        """Fetch market data for a specific date, served from the response cache when fresh.
+
+        A state or district left out is not filtered on.
+        """
+        if not self.cache:
+            return self._fetch_data_for_date(date, state, district, commodity)
+        return self.cache.get_or_load(
+            (date, state, district, commodity),
+            lambda: self._fetch_data_for_date(date, state, district, commodity)
+        )
+
+    def _fetch_data_for_date(self, date, state, district, commodity=None):
+        """Fetch every page of market data for a specific date and store it in the database"""
         try:
             logger.info(f"Fetching market data for date: {date}")
-            params = {
-                'api-key': self.API_KEY,
-                'format': 'json',
-                'filters[Arrival_Date]': date,
-                'limit': 1000
-            }
-            
-            # Add optional filters with defaults
-            if state:
-                params['filters[State]'] = state
-            else:
-                params['filters[State]'] = 'Tamil Nadu'
-                
-            if district:
-                params['filters[District]'] = district
-            else:
-                params['filters[District]'] = 'Salem'
-                
-            if commodity:
-                params['filters[Commodity]'] = commodity
-
-            # Make API request
-            logger.info(f"API request params: {params}")
-            response = requests.get(
-                self.BASE_URL,
-                headers={'Accept': 'application/json'},
-                params=params,
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"API error: Status {response.status_code}, Response: {response.text[:200]}")
-                return {'records': [], 'total': 0, 'error': f"API returned status code {response.status_code}"}
-                
-            data = response.json()
-
-            if data and 'records' in data:
-                # Transform records and store in database
-                transformed_records = []
-                for index, record in enumerate(data['records']):
-                    try:
-                        # Parse the date to ensure consistent format
-                        arrival_date = datetime.strptime(record['Arrival_Date'], '%d/%m/%Y')
-                        formatted_date = arrival_date.strftime('%d/%m/%Y')
-                        
-                        # Create transformed record
-                        transformed_record = {
-                            'id': index,
-                            'state': record.get('State', ''),
-                            'district': record.get('District', ''),
-                            'market': record.get('Market', ''),
-                            'commodity': record.get('Commodity', ''),
-                            'variety': record.get('Variety', ''),
-                            'grade': record.get('Grade', ''),
-                            'arrival_date': arrival_date.strftime('%Y-%m-%d'),
-                            'min_price': float(record.get('Min_Price', 0)),
-                            'max_price': float(record.get('Max_Price', 0)),
-                            'modal_price': float(record.get('Modal_Price', 0)),
-                            'min_price_per_kg': float(record.get('Min_Price', 0)) / 100.0,
-                            'max_price_per_kg': float(record.get('Max_Price', 0)) / 100.0,
-                            'modal_price_per_kg': float(record.get('Modal_Price', 0)) / 100.0,
-                            'price_per_kg': float(record.get('Modal_Price', 0)) / 100.0,
-                            'commodity_code': record.get('Commodity_Code', ''),
-                            'date': formatted_date,
-                            'price_change': 0
-                        }
-                        transformed_records.append(transformed_record)
-                        
-                        # Store in database - check if record already exists
-                        existing_record = MarketData.query.filter_by(
-                            commodity=transformed_record['commodity'],
-                            market=transformed_record['market'],
-                            date=formatted_date,
-                            state=transformed_record['state'],
-                            district=transformed_record['district']
-                        ).first()
-                        
-                        if not existing_record:
-                            # Create new record
-                            new_record = MarketData(
-                                commodity=transformed_record['commodity'],
-                                market=transformed_record['market'],
-                                price=transformed_record['price_per_kg'],
-                                date=formatted_date,
-                                state=transformed_record['state'],
-                                district=transformed_record['district']
-                            )
-                            db.session.add(new_record)
-                        else:
-                            # Update existing record if price has changed
-                            if existing_record.price != transformed_record['price_per_kg']:
-                                existing_record.price = transformed_record['price_per_kg']
-                
-                    except (KeyError, ValueError) as e:
-                        logger.warning(f"Error transforming record: {str(e)}")
-                        continue
-            
-                # Commit all database changes
+            data = None
+            transformed_records = []
+            stats = IngestStats()
+            for page in self.iter_record_pages(date, state, district, commodity):
+                if data is None:
+                    data = page
+                page_records = self._transform_records(page['records'], offset=len(transformed_records))
                 try:
-                    db.session.commit()
-                    logger.info(f"Successfully stored {len(transformed_records)} records in database")
-                except Exception as e:
-                    db.session.rollback()
+                    stats.merge(self._store_records(page_records))
+                except SQLAlchemyError as e:
+                    # The page is still served; background ingestion stores it later
                     logger.error(f"Database error: {str(e)}")
-            
-                data['records'] = transformed_records
-                return data
-            else:
+                transformed_records.extend(page_records)
+
+            if not transformed_records:
                 logger.warning(f"No records found for date {date}")
                 return {'records': [], 'total': 0}
 
+            logger.info(
+                f"Stored {len(transformed_records)} records in database: "
+                f"{stats.inserted} inserted, {stats.updated} updated, "
+                f"{stats.unchanged} unchanged ({stats.rows_per_second:.0f} rows/s)"
+            )
+            data['records'] = transformed_records
+            data['count'] = len(transformed_records)
+            return data
+
+        except MarketAPIError as e:
+            return {'records': [], 'total': 0, 'error': str(e)}
+        except CircuitOpenError as e:
+            # Fail fast with whatever is stored locally; responses with an error are never cached
+            records = load_stored_records(parse_date(date), state, district, commodity)
+            logger.warning(f"Serving {len(records)} stored records for {date}: {str(e)}")
+            return {'records': records, 'total': len(records), 'stale': True, 'error': str(e)}
         except requests.exceptions.RequestException as e:
             logger.error(f"Data fetch error: {str(e)}")
             return {'records': [], 'total': 0, 'error': str(e)}
@@ -206,26 +591,934 @@ class MarketAPI:
             logger.error(f"Unexpected error: {str(e)}")
             return {'records': [], 'total': 0, 'error': str(e)}
 
-def cleanup_old_market_data():
-    """Remove market data older than 30 days to keep database size manageable"""
+    def ingest_date(self, date, state=None, district=None, commodity=None):
+        """Stream every page for a date straight into the database without keeping the records"""
+        stats = IngestStats()
+        for page in self.iter_record_pages(date, state, district, commodity):
+            stats.merge(self._store_records(self._transform_records(page['records'])))
+        logger.info(f"Ingested {date} for {state or 'all states'}/{district or 'all districts'}: {stats.as_dict()}")
+        return stats
+
+    def discover_regions(self, date):
+        """(state, district) pairs the upstream has records for on a date"""
+        regions = set()
+        for page in self.iter_record_pages(date, None, None, fields='State,District'):
+            for record in page['records']:
+                if record.get('State') and record.get('District'):
+                    regions.add((record['State'], record['District']))
+        return sorted(regions)
+
+    def iter_record_pages(self, date, state, district, commodity=None, page_size=None, prefetch=None, fields=None):
+        """Yield the upstream response one page at a time, following offset until total is reached.
+
+        With ``prefetch`` above one, up to that many of the following pages
+        are requested in parallel while the current one is consumed.
+        """
+        page_size = page_size or app.config['MARKET_PAGE_SIZE']
+        prefetch = prefetch or app.config['MARKET_PAGE_PREFETCH']
+
+        first = self._request_page(date, state, district, commodity, 0, page_size, fields)
+        if not first.get('records'):
+            return
+        yield first
+
+        total = int(first.get('total') or 0)
+        if not total:
+            # Without a total, keep reading until a short page comes back
+            offset = page_size
+            page = first
+            while len(page['records']) >= page_size:
+                page = self._request_page(date, state, district, commodity, offset, page_size, fields)
+                if not page.get('records'):
+                    return
+                yield page
+                offset += page_size
+            return
+
+        offsets = list(range(page_size, total, page_size))
+        if prefetch <= 1:
+            for offset in offsets:
+                page = self._request_page(date, state, district, commodity, offset, page_size, fields)
+                if not page.get('records'):
+                    return
+                yield page
+            return
+
+        with ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='prefetch') as executor:
+            pending = deque()
+            remaining = iter(offsets)
+            try:
+                for offset in islice(remaining, prefetch):
+                    pending.append(executor.submit(
+                        self._request_page, date, state, district, commodity, offset, page_size, fields
+                    ))
+                while pending:
+                    page = pending.popleft().result()
+                    for offset in islice(remaining, 1):
+                        pending.append(executor.submit(
+                            self._request_page, date, state, district, commodity, offset, page_size, fields
+                        ))
+                    if not page.get('records'):
+                        return
+                    yield page
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _request_page(self, date, state, district, commodity, offset, limit, fields=None):
+        """Request a single page of records from the upstream resource"""
+        params = {
+            'api-key': self.API_KEY,
+            'format': 'json',
+            'filters[Arrival_Date]': date,
+            'offset': offset,
+            'limit': limit
+        }
+        if state:
+            params['filters[State]'] = state
+        if district:
+            params['filters[District]'] = district
+        if commodity:
+            params['filters[Commodity]'] = commodity
+        if fields:
+            params['fields'] = fields
+
+        # The key stays out of the logs
+        logged_params = {name: value for name, value in params.items() if name != 'api-key'}
+        logger.debug(f"API request params: {logged_params}")
+        days_back = upstream_days_back(date)
+        started = time.perf_counter()
+        try:
+            response = self.client.get(params=params, headers={'Accept': 'application/json'})
+        except requests.exceptions.RequestException as e:
+            observe_upstream(days_back, type(e).__name__, time.perf_counter() - started)
+            raise
+        observe_upstream(days_back, response.status_code, time.perf_counter() - started)
+
+        if response.status_code != 200:
+            logger.error(f"API error: Status {response.status_code}, Response: {response.text[:200]}")
+            raise MarketAPIError(f"API returned status code {response.status_code}")
+
+        data = response.json() or {}
+        data.setdefault('records', [])
+        return data
+
+    @staticmethod
+    def _transform_records(records, offset=0):
+        """Normalise raw upstream records, skipping any that cannot be parsed"""
+        transformed_records = []
+        for index, record in enumerate(records, start=offset):
+            try:
+                # Parse the date to ensure consistent format
+                arrival_date = datetime.strptime(record['Arrival_Date'], '%d/%m/%Y')
+
+                transformed_records.append({
+                    'id': index,
+                    'state': record.get('State', ''),
+                    'district': record.get('District', ''),
+                    'market': record.get('Market', ''),
+                    'commodity': record.get('Commodity', ''),
+                    'variety': record.get('Variety', ''),
+                    'grade': record.get('Grade', ''),
+                    'arrival_date': arrival_date.strftime('%Y-%m-%d'),
+                    'min_price': float(record.get('Min_Price', 0)),
+                    'max_price': float(record.get('Max_Price', 0)),
+                    'modal_price': float(record.get('Modal_Price', 0)),
+                    'min_price_per_kg': float(record.get('Min_Price', 0)) / 100.0,
+                    'max_price_per_kg': float(record.get('Max_Price', 0)) / 100.0,
+                    'modal_price_per_kg': float(record.get('Modal_Price', 0)) / 100.0,
+                    'price_per_kg': float(record.get('Modal_Price', 0)) / 100.0,
+                    'commodity_code': record.get('Commodity_Code', ''),
+                    'date': arrival_date.strftime('%d/%m/%Y'),
+                    'price_change': 0
+                })
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Error transforming record: {str(e)}")
+                continue
+        return transformed_records
+
+    @staticmethod
+    def _store_records(transformed_records):
+        """Upsert one page of transformed records in a single transaction; storage errors propagate"""
+        with query_tracker.scope() as queries:
+            stats = store_market_records(transformed_records)
+        if transformed_records:
+            ingest_queries.observe(queries.queries)
+        return stats
+
+def upstream_days_back(date):
+    """Metric label for how many days before today a dd/mm/YYYY date is, bounded by the look-back window"""
     try:
-        thirty_days_ago = (datetime.now() - timedelta(days=30)).strftime('%d/%m/%Y')
-        old_records = MarketData.query.filter(
-            MarketData.date < thirty_days_ago
-        ).all()
-        
-        if old_records:
-            for record in old_records:
-                db.session.delete(record)
-            
-            db.session.commit()
-            logger.info(f"Removed {len(old_records)} old market data records")
-    except Exception as e:
+        days = (datetime.now().date() - datetime.strptime(date, '%d/%m/%Y').date()).days
+    except (TypeError, ValueError):
+        return 'unknown'
+    if days < 0:
+        return 'future'
+    return str(days) if days < max(app.config['MARKET_LOOKBACK_DAYS'], 1) else 'older'
+
+def observe_upstream(days_back, status, elapsed):
+    upstream_latency.observe(elapsed, days_back=days_back)
+    upstream_count.inc(days_back=days_back, status=status)
+
+def store_market_records(records, refresh=True):
+    """Dictionary-encode and upsert transformed records, committing once.
+
+    With ``refresh`` off the rollups of the changed rows are left alone,
+    for bulk loads that rebuild them once at the end.
+    """
+    if not records:
+        return IngestStats()
+    try:
+        encoder = DimensionEncoder(db.session, State, District, Market, Commodity)
+        rows = []
+        for record, (market_id, commodity_id) in zip(records, encoder.encode(records)):
+            rows.append({
+                'commodity_id': commodity_id,
+                'market_id': market_id,
+                'date': parse_date(record['arrival_date']),
+                'variety': record.get('variety') or '',
+                'grade': record.get('grade') or '',
+                'min_price': record.get('min_price'),
+                'max_price': record.get('max_price'),
+                'modal_price': record.get('modal_price')
+            })
+        stats = upsert_market_records(
+            db.session, MarketData.__table__, rows, on_changed=refresh_rollups if refresh else None
+        )
+        db.session.commit()
+        for outcome in ('inserted', 'updated', 'unchanged'):
+            ingested_records.inc(getattr(stats, outcome), outcome=outcome)
+        return stats
+    except Exception:
         db.session.rollback()
-        logger.error(f"Error cleaning up old market data: {str(e)}")
+        raise
+
+def refresh_rollups(rows):
+    """Recompute the day/week/month rollups touched by changed raw rows or records"""
+    keys = []
+    for row in rows:
+        if isinstance(row, dict):
+            keys.append((row['market_id'], row['commodity_id'], row['date']))
+        else:
+            keys.append((row.market_id, row.commodity_id, row.date))
+    groups = RollupMaintainer(db.session, MarketData, PriceRollup).refresh(keys)
+    spread_indexer().refresh(keys)
+    bump_data_version()
+    return groups
+
+def spread_indexer():
+    return SpreadIndexer(db.session, PriceRollup, PriceSpread, Market, District)
+
+def forecast_maintainer(workers=None):
+    return ForecastMaintainer(
+        db.session, MarketData, ForecastSeries, PriceForecast,
+        horizon=app.config['FORECAST_HORIZON'],
+        history_days=app.config['FORECAST_HISTORY_DAYS'],
+        season=app.config['FORECAST_SEASON'],
+        confidence=app.config['FORECAST_CONFIDENCE'],
+        min_observations=app.config['FORECAST_MIN_OBSERVATIONS'],
+        workers=workers or app.config['FORECAST_WORKERS']
+    )
+
+def market_data_source():
+    """MarketData joined to its lookup tables, with the names exposed as columns"""
+    return select(
+        MarketData.id,
+        MarketData.date,
+        MarketData.market_id,
+        MarketData.commodity_id,
+        State.name.label('state'),
+        District.name.label('district'),
+        Market.name.label('market'),
+        Commodity.name.label('commodity'),
+        Commodity.code.label('commodity_code'),
+        MarketData.variety,
+        MarketData.grade,
+        MarketData.min_price,
+        MarketData.max_price,
+        MarketData.modal_price,
+        MarketData.price.label('price')
+    ).join(Market, MarketData.market_id == Market.id) \
+        .join(District, Market.district_id == District.id) \
+        .join(State, District.state_id == State.id) \
+        .join(Commodity, MarketData.commodity_id == Commodity.id) \
+        .subquery('market_data_named')
+
+def _rollup_area(statement, grain, state, district):
+    statement = statement.join(Market, PriceRollup.market_id == Market.id) \
+        .join(District, Market.district_id == District.id) \
+        .join(State, District.state_id == State.id) \
+        .where(PriceRollup.grain == grain, State.name == state)
+    return statement.where(District.name == district) if district is not None else statement
+
+def latest_rollup_period(grain, state, district):
+    statement = _rollup_area(select(db.func.max(PriceRollup.period_start)), grain, state, district)
+    return db.session.execute(statement).scalar()
+
+def load_rollups(grain, state, district, start=None, end=None):
+    """Rollup rows for an area with market and commodity names, oldest period first"""
+    statement = _rollup_area(select(
+        PriceRollup.period_start,
+        PriceRollup.record_count,
+        PriceRollup.price_sum,
+        PriceRollup.min_price,
+        PriceRollup.max_price,
+        PriceRollup.avg_price,
+        PriceRollup.last_price,
+        PriceRollup.market_id,
+        PriceRollup.commodity_id,
+        Market.name.label('market'),
+        Commodity.name.label('commodity')
+    ), grain, state, district).join(Commodity, PriceRollup.commodity_id == Commodity.id)
+    if start is not None:
+        statement = statement.where(PriceRollup.period_start >= start)
+    if end is not None:
+        statement = statement.where(PriceRollup.period_start <= end)
+    statement = statement.order_by(PriceRollup.period_start, Commodity.name, Market.name)
+    return db.session.execute(statement).all()
+
+# Price matrices keyed by area, window and data version; a write changes the version
+analytics_cache = LRUCache(max_entries=32)
+# Rendered pages keyed by endpoint, query string and data version, and the data behind them
+page_cache = LRUCache(max_entries=app.config['PAGE_CACHE_ENTRIES'])
+fragment_cache = LRUCache(max_entries=app.config['PAGE_CACHE_ENTRIES'])
+
+def load_spreads(state, day, limit, commodity=None, min_markets=2):
+    """Widest cross-market spreads of a state on one day, with market and commodity names"""
+    buy_market = aliased(Market)
+    sell_market = aliased(Market)
+    statement = select(
+        PriceSpread,
+        Commodity.name.label('commodity'),
+        buy_market.name.label('buy_market'),
+        sell_market.name.label('sell_market')
+    ).join(State, PriceSpread.state_id == State.id) \
+        .join(Commodity, PriceSpread.commodity_id == Commodity.id) \
+        .join(buy_market, PriceSpread.buy_market_id == buy_market.id) \
+        .join(sell_market, PriceSpread.sell_market_id == sell_market.id) \
+        .where(State.name == state, PriceSpread.date == day, PriceSpread.market_count >= min_markets)
+    if commodity:
+        statement = statement.where(Commodity.name == commodity)
+    statement = statement.order_by(PriceSpread.spread.desc()).limit(limit)
+    return db.session.execute(statement).all()
+
+def load_price_ladder(state, day, commodity):
+    """Daily average price of one commodity in every market of a state, cheapest first"""
+    statement = _rollup_area(select(
+        Market.name.label('market'),
+        PriceRollup.avg_price,
+        PriceRollup.record_count
+    ), 'day', state, None).join(Commodity, PriceRollup.commodity_id == Commodity.id) \
+        .where(PriceRollup.period_start == day, Commodity.name == commodity) \
+        .order_by(PriceRollup.avg_price, Market.name)
+    return db.session.execute(statement).all()
+
+def load_forecasts(state, district, commodity=None, market=None):
+    """Stored forecast points for the markets of an area with their series' fit, by commodity, market and date"""
+    statement = select(
+        Commodity.name.label('commodity'),
+        Market.name.label('market'),
+        ForecastSeries.model,
+        ForecastSeries.rmse,
+        ForecastSeries.last_date,
+        ForecastSeries.fitted_at,
+        PriceForecast.target_date,
+        PriceForecast.forecast,
+        PriceForecast.lower,
+        PriceForecast.upper
+    ).select_from(PriceForecast) \
+        .join(Market, PriceForecast.market_id == Market.id) \
+        .join(District, Market.district_id == District.id) \
+        .join(State, District.state_id == State.id) \
+        .join(Commodity, PriceForecast.commodity_id == Commodity.id) \
+        .join(ForecastSeries, and_(
+            ForecastSeries.market_id == PriceForecast.market_id,
+            ForecastSeries.commodity_id == PriceForecast.commodity_id
+        )) \
+        .where(State.name == state, District.name == district)
+    if commodity:
+        statement = statement.where(Commodity.name == commodity)
+    if market:
+        statement = statement.where(Market.name == market)
+    statement = statement.order_by(Commodity.name, Market.name, PriceForecast.target_date)
+    return db.session.execute(statement).all()
+
+def data_version():
+    """(version, updated_at) of the market data; every write path bumps it"""
+    row = db.session.execute(
+        select(DataVersion.version, DataVersion.updated_at).where(DataVersion.id == 1)
+    ).first()
+    return (row.version, row.updated_at) if row is not None else (0, None)
+
+def bump_data_version():
+    """Mark the market data as changed, inside the caller's transaction"""
+    db.session.execute(
+        update(DataVersion).where(DataVersion.id == 1)
+        .values(version=DataVersion.version + 1, updated_at=datetime.utcnow())
+    )
 
-# Call this function periodically, e.g., once a day
-# You could add a route for this or call it from a scheduled task
+def price_matrix(state, district, start, end):
+    """Memoized commodity × market × date matrix of daily average prices for an area"""
+    key = (state, district, start, end, data_version()[0])
+    found, matrix = analytics_cache.get(key)
+    analytics_cache.stats.incr('hits' if found else 'misses')
+    if not found:
+        rows = load_rollups('day', state, district, start=start, end=end)
+        matrix = PriceMatrix.from_rows([
+            (rollup.commodity, rollup.market, rollup.period_start, rollup.avg_price) for rollup in rows
+        ])
+        analytics_cache.set(key, matrix, 3600)
+    return matrix
+
+def trend_matrix(state, district, latest, days):
+    """Price matrix for the ``days`` up to ``latest`` plus one analytics window of history"""
+    start = latest - timedelta(days=days - 1 + app.config['ANALYTICS_WINDOW'])
+    return price_matrix(state, district, start, latest)
+
+def pending_upgrades():
+    """Upgrade steps an older database still needs before it can be served; empty once ``flask upgrade-db`` ran"""
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    pending = []
+    for model in (MarketData, PriceRollup):
+        if model.__tablename__ in tables and 'commodity' in {
+            column['name'] for column in inspector.get_columns(model.__tablename__)
+        }:
+            pending.append(f"old {model.__tablename__} layout")
+    if 'market_data_legacy' in tables:
+        pending.append('legacy market data copy')
+    if pending:
+        return pending
+    if RECORD_KEY_INDEX not in {index['name'] for index in inspector.get_indexes(MarketData.__tablename__)}:
+        pending.append('market data record key')
+    # Spreads are derived from the daily rollups; databases from before they existed get them once
+    if PriceSpread.query.first() is None and PriceRollup.query.filter_by(grain='day').first() is not None:
+        pending.append('price spreads')
+    return pending
+
+def create_tables():
+    db.create_all(bind_key=None)
+    insert = dialect_insert(db.engine.dialect.name)
+    db.session.execute(insert(DataVersion.__table__).values(
+        id=1, version=0, updated_at=datetime.utcnow()
+    ).on_conflict_do_nothing())
+    db.session.commit()
+
+def create_database():
+    """Create missing tables and indexes; converting an older database is left to ``flask upgrade-db``.
+
+    Runs at import in every worker, so only cheap, idempotent steps belong
+    here. Returns the upgrades that are still pending.
+    """
+    create_tables()
+    pending = pending_upgrades()
+    if pending:
+        logger.warning(f"Database needs `flask upgrade-db` before it can be served: {', '.join(pending)}")
+        return pending
+    ensure_indexes(db.engine, MarketData.__table__)
+    ensure_indexes(db.engine, PriceRollup.__table__)
+    return pending
+
+def upgrade_database(batch_size=5000, pause=0.0):
+    """Bring a database written by an older version up to date"""
+    engine = db.engine
+    detach_legacy_table(engine, MarketData.__tablename__, 'market_data_legacy', 'commodity')
+    # Rollups are derived data; the old layout is dropped and rebuilt by the copy below
+    if detach_legacy_table(engine, PriceRollup.__tablename__, 'price_rollup_legacy', 'commodity'):
+        drop_table(engine, 'price_rollup_legacy')
+    create_tables()
+
+    if 'market_data_legacy' in inspect(engine).get_table_names():
+        migrate_market_dates(engine, 'market_data_legacy', batch_size, pause)
+        copied = IngestStats()
+        for rows in iter_table_batches(engine, 'market_data_legacy', batch_size):
+            copied.merge(store_market_records([{
+                'state': row['state'] or '',
+                'district': row['district'] or '',
+                'market': row['market'] or '',
+                'commodity': row['commodity'] or '',
+                'arrival_date': row['date'],
+                'modal_price': row['price'] * 100.0 if row['price'] is not None else None
+            } for row in rows if row['date']], refresh=False))
+            if pause:
+                time.sleep(pause)
+        drop_table(engine, 'market_data_legacy')
+        logger.info(f"Copied legacy market data into the encoded layout: {copied.as_dict()}")
+        # Rollups and spreads are built once from the copied rows rather than refreshed per batch
+        RollupMaintainer(db.session, MarketData, PriceRollup).rebuild(commit=db.session.commit)
+        PriceSpread.query.delete()
+        bump_data_version()
+        db.session.commit()
+
+    ensure_record_key(engine, MarketData.__table__)
+    ensure_indexes(engine, MarketData.__table__)
+    ensure_indexes(engine, PriceRollup.__table__)
+    if PriceSpread.query.first() is None and PriceRollup.query.filter_by(grain='day').first() is not None:
+        spread_indexer().rebuild(commit=db.session.commit)
+        db.session.commit()
+
+def cleanup_old_market_data():
+    """Remove market data older than the retention window, archiving it first if configured.
+
+    Rollups and spreads of the purged periods go with it; the week and
+    month around the cutoff are recomputed from the rows that remain.
+    Forecast series whose rows changed are refitted, or dropped, by the
+    next forecast run, which compares their fingerprints. Ingest
+    checkpoints older than INGEST_CHECKPOINT_DAYS are deleted as well.
+    """
+    cutoff = (datetime.now() - timedelta(days=app.config['RETENTION_DAYS'])).date()
+    report = purge_before(
+        db.engine,
+        MarketData.__tablename__,
+        cutoff,
+        chunk_size=app.config['RETENTION_CHUNK_SIZE'],
+        archive_dir=app.config['RETENTION_ARCHIVE_DIR'] or None,
+        archive_format=app.config['RETENTION_ARCHIVE_FORMAT'],
+        archive_source=market_data_source()
+    )
+    checkpoint_cutoff = datetime.now() - timedelta(days=app.config['INGEST_CHECKPOINT_DAYS'])
+    checkpoints = IngestCheckpoint.query.filter(
+        IngestCheckpoint.finished_at < checkpoint_cutoff,
+        IngestCheckpoint.run_id != ingest_run_id()
+    ).delete(synchronize_session=False)
+    IngestRun.query.filter(IngestRun.started_at < checkpoint_cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    if checkpoints:
+        logger.info(f"Removed {checkpoints} old ingest checkpoints")
+    if report.rows:
+        rollups = RollupMaintainer(db.session, MarketData, PriceRollup).prune_before(cutoff)
+        spreads = spread_indexer().prune_before(cutoff)
+        bump_data_version()
+        db.session.commit()
+        logger.info(f"Removed {report.rows} old market data records, {rollups} rollups and {spreads} spreads: "
+                    f"{report.as_dict()}")
+    return report
+
+def parse_ingest_slices(value):
+    """Parse "State:District[:Commodity];..." into (state, district, commodity) tuples"""
+    slices = []
+    for item in value.split(';'):
+        parts = [part.strip() for part in item.split(':')]
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            continue
+        slices.append((parts[0], parts[1], parts[2] if len(parts) > 2 and parts[2] else None))
+    return slices
+
+def ingest_configured_slices():
+    """Ingest the most recent days of every configured slice into the local store"""
+    if app.config['INGEST_SLICES'].strip() == '*':
+        report = ingest_all_regions()
+        if report.failed:
+            raise RuntimeError(f"Ingestion failed for {len(report.failed)} regions")
+        return report.stats
+    api = MarketAPI(cache=False)
+    total = IngestStats()
+    failed = []
+    for state, district, commodity in parse_ingest_slices(app.config['INGEST_SLICES']):
+        for days_back in range(app.config['INGEST_DAYS']):
+            day = (datetime.now() - timedelta(days=days_back)).strftime('%d/%m/%Y')
+            try:
+                stats = retry_with_backoff(
+                    lambda: api.ingest_date(day, state, district, commodity),
+                    attempts=app.config['INGEST_RETRIES'],
+                    retry_on=(MarketAPIError, requests.exceptions.RequestException, OperationalError)
+                )
+                total.merge(stats)
+            except Exception as e:
+                logger.error(f"Ingestion of {state}/{district} for {day} failed: {str(e)}")
+                failed.append(f"{state}/{district}/{day}")
+
+    # Raising marks the job failed, so the scheduler retries it after its failure backoff
+    if failed:
+        raise RuntimeError(f"Ingestion failed for {', '.join(failed)}")
+    logger.info(f"Ingestion run complete: {total.as_dict()}")
+    return total
+
+def ingest_region(api, task):
+    """Ingest one (state, district, date) task from a fan-out worker thread"""
+    state, district, day = task
+    with app.app_context():
+        return retry_with_backoff(
+            lambda: api.ingest_date(day.strftime('%d/%m/%Y'), state, district),
+            attempts=app.config['INGEST_RETRIES'],
+            # OperationalError covers a write lock held by another worker ("database is locked")
+            retry_on=(MarketAPIError, requests.exceptions.RequestException, OperationalError)
+        )
+
+def record_checkpoint(run_id, task, stats, error):
+    """Remember how one fan-out task ended so a resumed run can skip it"""
+    state, district, day = task
+    checkpoint = IngestCheckpoint.query.filter_by(run_id=run_id, state=state, district=district, date=day).first()
+    if checkpoint is None:
+        checkpoint = IngestCheckpoint(run_id=run_id, state=state, district=district, date=day)
+        db.session.add(checkpoint)
+    checkpoint.status = 'failed' if error else 'ok'
+    checkpoint.records = stats.received if stats else 0
+    checkpoint.error = str(error)[:500] if error else None
+    checkpoint.finished_at = datetime.now()
+    db.session.commit()
+
+def ingest_run_id(now=None):
+    """Id of the latest unfinished fan-out run to resume, or a fresh one once the last run completed"""
+    now = now or datetime.now()
+    unfinished = IngestRun.query.filter(
+        IngestRun.finished_at.is_(None),
+        IngestRun.started_at >= now - timedelta(days=app.config['INGEST_CHECKPOINT_DAYS'])
+    ).order_by(IngestRun.started_at.desc()).first()
+    if unfinished is not None:
+        return unfinished.run_id
+    return f"regions-{now:%Y%m%d%H%M%S%f}"
+
+def ingest_all_regions(run_id=None, days=None, workers=None):
+    """Fan ingestion out over every state/district the upstream reports for the recent days.
+
+    Regions are ingested in parallel by ``INGEST_WORKERS`` threads sharing
+    the pooled session and the per-host rate limit. Each finished region is
+    checkpointed under ``run_id``, by default that of the last run if it did
+    not finish; running again with the same id skips the regions that
+    already succeeded. The run is marked finished once no region failed.
+    """
+    api = MarketAPI(cache=False)
+    run_id = run_id or ingest_run_id()
+    run = db.session.get(IngestRun, run_id) or IngestRun(run_id=run_id, started_at=datetime.now())
+    run.finished_at = None
+    db.session.add(run)
+    db.session.commit()
+    tasks = []
+    for days_back in range(days or app.config['INGEST_DAYS']):
+        day = (datetime.now() - timedelta(days=days_back)).date()
+        regions = retry_with_backoff(
+            lambda: api.discover_regions(day.strftime('%d/%m/%Y')),
+            attempts=app.config['INGEST_RETRIES'],
+            retry_on=(MarketAPIError, requests.exceptions.RequestException)
+        )
+        logger.info(f"Discovered {len(regions)} regions reporting on {day}")
+        tasks.extend((state, district, day) for state, district in regions)
+
+    done = {
+        (checkpoint.state, checkpoint.district, checkpoint.date)
+        for checkpoint in IngestCheckpoint.query.filter_by(run_id=run_id, status='ok')
+    }
+    report = fan_out(
+        run_id, tasks,
+        lambda task: ingest_region(api, task),
+        workers=workers or app.config['INGEST_WORKERS'],
+        done=done,
+        on_result=lambda task, stats, error: record_checkpoint(run_id, task, stats, error)
+    )
+    if not report.failed:
+        run.finished_at = datetime.now()
+        db.session.commit()
+    logger.info(f"Region fan-out complete: {report.as_dict()}")
+    return report
+
+def record_job_run(job, started_at, duration, error):
+    """Persist the timing of one scheduler job run"""
+    db.session.add(JobRun(
+        job=job.name,
+        started_at=datetime.fromtimestamp(started_at),
+        duration=duration,
+        status='failed' if error else 'ok',
+        error=error[:500] if error else None
+    ))
+    db.session.commit()
+
+def refit_forecasts(full=False, workers=None):
+    """Refit the forecasts of every series whose raw rows changed since its last fit"""
+    run = forecast_maintainer(workers).refit(full=full, commit=db.session.commit)
+    db.session.commit()
+    logger.info(f"Forecast refit complete: {run.as_dict()}")
+    return run
+
+def build_scheduler():
+    scheduler = IngestionScheduler(on_run=record_job_run)
+    scheduler.add_job('ingest', app.config['INGEST_INTERVAL'], ingest_configured_slices)
+    scheduler.add_job('retention', app.config['RETENTION_INTERVAL'], cleanup_old_market_data)
+    # Off-peak: once a day at FORECAST_HOUR, retried with backoff within the day if it fails
+    scheduler.add_job('forecast', 86400, refit_forecasts, run_at_start=False, hour=app.config['FORECAST_HOUR'])
+    return scheduler
+
+@app.cli.command('upgrade-db')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows rewritten per transaction.')
+@click.option('--pause', default=0.0, show_default=True, help='Seconds to sleep between batches.')
+def upgrade_db_command(batch_size, pause):
+    """Convert legacy dates and the old string layout, then add missing indexes."""
+    upgrade_database(batch_size, pause)
+    click.echo("Database is up to date")
+
+@app.cli.command('rebuild-rollups')
+@click.option('--start', help='First raw date to include (YYYY-MM-DD).')
+@click.option('--end', help='Last raw date to include (YYYY-MM-DD).')
+def rebuild_rollups_command(start, end):
+    """Recompute day/week/month price rollups and cross-market spreads from the raw market data."""
+    maintainer = RollupMaintainer(db.session, MarketData, PriceRollup)
+    groups = maintainer.rebuild(parse_date(start), parse_date(end), commit=db.session.commit)
+    db.session.commit()
+    spreads = spread_indexer().rebuild(parse_date(start), parse_date(end), commit=db.session.commit)
+    bump_data_version()
+    db.session.commit()
+    click.echo(f"Rebuilt {groups} rollup groups and {spreads} spread groups")
+
+@app.cli.command('ingest-regions')
+@click.option('--run-id', help='Checkpoint id; reuse it to resume an interrupted run.')
+@click.option('--days', type=int, help='Number of recent days to ingest (defaults to INGEST_DAYS).')
+@click.option('--workers', type=int, help='Regions ingested in parallel (defaults to INGEST_WORKERS).')
+def ingest_regions_command(run_id, days, workers):
+    """Ingest every state and district the upstream reports, resuming a checkpointed run."""
+    run_id = run_id or ingest_run_id()
+    click.echo(f"Run id: {run_id}")
+    report = ingest_all_regions(run_id, days, workers)
+    click.echo(json.dumps(report.as_dict(), indent=2))
+
+@app.cli.command('purge-old-data')
+@click.option('--days', type=int, help='Keep this many days (defaults to RETENTION_DAYS).')
+@click.option('--archive-dir', help='Archive expired rows here before deleting them.')
+@click.option('--archive-format', type=click.Choice(['csv', 'parquet']), help='Archive file format.')
+def purge_old_data_command(days, archive_dir, archive_format):
+    """Delete expired market data in chunks."""
+    if days is not None:
+        app.config['RETENTION_DAYS'] = days
+    if archive_dir is not None:
+        app.config['RETENTION_ARCHIVE_DIR'] = archive_dir
+    if archive_format is not None:
+        app.config['RETENTION_ARCHIVE_FORMAT'] = archive_format
+    report = cleanup_old_market_data()
+    click.echo(json.dumps(report.as_dict(), indent=2))
+
+@app.cli.command('refit-forecasts')
+@click.option('--full', is_flag=True, help='Refit every series, not only those with new data.')
+@click.option('--workers', type=int, help='Fitting processes (defaults to FORECAST_WORKERS).')
+def refit_forecasts_command(full, workers):
+    """Fit price forecasts for the series that got new market data."""
+    run = refit_forecasts(full, workers)
+    click.echo(json.dumps(run.as_dict(), indent=2))
+
+@app.cli.command('run-scheduler')
+@click.option('--once', is_flag=True, help='Run every job once and exit.')
+def run_scheduler_command(once):
+    """Run background ingestion and retention jobs."""
+    pending = pending_upgrades()
+    if pending:
+        raise click.ClickException(f"Run `flask upgrade-db` first: {', '.join(pending)}")
+    scheduler = build_scheduler()
+    if once:
+        scheduler.run_all()
+        if metrics.multiprocess_dir:
+            metrics.write_snapshot()
+        return
+    # With a shared METRICS_MULTIPROC_DIR the web workers' /metrics includes the ingestion counters
+    metrics.start_writer()
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        scheduler.stop()
+
+def _area_conditions(source, state, district, commodity):
+    conditions = []
+    for name, value in (('state', state), ('district', district), ('commodity', commodity)):
+        if value:
+            conditions.append(source.c[name] == value)
+    return conditions
+
+def load_stored_records(day, state=None, district=None, commodity=None):
+    """Stored records of one day, shaped like MarketAPI.fetch_data_for_date records"""
+    source = market_data_source()
+    statement = select(source).where(*_area_conditions(source, state, district, commodity), source.c.date == day)
+    return [market_record(row) for row in db.session.execute(statement.order_by(source.c.id))]
+
+def market_record(row):
+    """API shape of one row of market_data_source()"""
+    return {
+        'id': row.id,
+        'state': row.state,
+        'district': row.district,
+        'market': row.market,
+        'commodity': row.commodity,
+        'variety': row.variety or '',
+        'grade': row.grade or '',
+        'commodity_code': row.commodity_code or '',
+        'min_price': row.min_price,
+        'max_price': row.max_price,
+        'modal_price': row.modal_price,
+        'price_per_kg': float(row.price),
+        'date': row.date.strftime('%d/%m/%Y'),
+        'price_change': 0
+    }
+
+MARKET_RECORD_FIELDS = (
+    'id', 'state', 'district', 'market', 'commodity', 'variety', 'grade', 'commodity_code',
+    'min_price', 'max_price', 'modal_price', 'price_per_kg', 'date', 'price_change'
+)
+
+def encode_cursor(day, record_id):
+    return base64.urlsafe_b64encode(json.dumps([day.isoformat(), record_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(value):
+    """(date, id) of the last row of the previous page"""
+    try:
+        day, record_id = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        return parse_date(day), int(record_id)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {value}")
+
+def market_data_conditions(source, state=None, district=None):
+    """WHERE conditions for the name and date filters in the query string.
+
+    Name filters may be repeated to match any of several values. ``date``
+    selects one day; ``start`` and ``end`` bound the window inclusively.
+    """
+    conditions = []
+    defaults = {'state': state, 'district': district}
+    for name in ('state', 'district', 'market', 'commodity'):
+        values = [value for value in request.args.getlist(name) if value]
+        if not values and defaults.get(name):
+            values = [defaults[name]]
+        if len(values) == 1:
+            conditions.append(source.c[name] == values[0])
+        elif values:
+            conditions.append(source.c[name].in_(values))
+    day = parse_date(request.args.get('date'))
+    start = parse_date(request.args.get('start')) or day
+    end = parse_date(request.args.get('end')) or day
+    if start is not None:
+        conditions.append(source.c.date >= start)
+    if end is not None:
+        conditions.append(source.c.date <= end)
+    return conditions, start, end
+
+def selected_area():
+    """State and district picked in the query string, defaulting to the configured area"""
+    return (request.args.get('state') or app.config['MARKET_STATE'],
+            request.args.get('district') or app.config['MARKET_DISTRICT'])
+
+def analysis_window(aggregator):
+    """Filters and date window from the query string, defaulting to the latest stored day"""
+    state, district = selected_area()
+    filters = {
+        'state': state,
+        'district': district,
+        'commodity': request.args.get('commodity'),
+        'market': request.args.get('market')
+    }
+    end = parse_date(request.args.get('end')) or aggregator.latest_date(filters)
+    start = parse_date(request.args.get('start'))
+    if start is None and end is not None:
+        start = end - timedelta(days=max(request.args.get('days', 1, type=int), 1) - 1)
+    return filters, start, end
+
+EXPORT_COLUMNS = (
+    'date', 'state', 'district', 'market', 'commodity', 'commodity_code',
+    'variety', 'grade', 'min_price', 'max_price', 'modal_price', 'price'
+)
+
+def export_statement():
+    """Named market data matching the export filters in the query string, in id order"""
+    source = market_data_source()
+    conditions, start, end = market_data_conditions(source)
+    statement = select(*(source.c[name] for name in EXPORT_COLUMNS)).where(*conditions)
+    return statement.order_by(source.c.id), start, end
+
+# Create database tables
+with app.app_context():
+    database_upgrades = create_database()
+    # Create a test user if none exists
+    if not User.query.filter_by(username='admin').first():
+        test_user = User(
+            username='admin',
+            password='admin123',
+            email='admin@example.com'
+        )
+        db.session.add(test_user)
+        db.session.commit()
+        logger.info("Admin user created successfully")
+
+@app.before_request
+def start_request_metrics():
+    metrics.start_writer()
+    g.metrics_started = time.perf_counter()
+    g.query_scope = query_tracker.begin()
+    if slow_request_profiler is not None:
+        g.profile = slow_request_profiler.begin()
+
+@app.before_request
+def require_upgraded_database():
+    """Refuse to serve an older database until ``flask upgrade-db`` has converted it"""
+    if not database_upgrades:
+        return None
+    # Re-checked on each request, so workers start serving once the upgrade has run
+    database_upgrades[:] = pending_upgrades()
+    if database_upgrades:
+        return jsonify({'error': f"Database upgrade pending: {', '.join(database_upgrades)}"}), 503
+    ensure_indexes(db.engine, MarketData.__table__)
+    ensure_indexes(db.engine, PriceRollup.__table__)
+    return None
+
+@app.after_request
+def remember_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(error):
+    """Latency, status and database time of the finished request, keyed on its URL rule"""
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    queries = query_tracker.end(g.pop('query_scope'))
+    # Unmatched paths share one label so scanners cannot grow the series without bound
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_latency.observe(elapsed, route=route, method=request.method)
+    request_count.inc(route=route, method=request.method, status=g.pop('response_status', 500))
+    request_queries.observe(queries.queries, route=route)
+    request_query_time.observe(queries.seconds, route=route)
+    profile = g.pop('profile', None)
+    if profile is not None:
+        slow_request_profiler.end(profile, elapsed, f"{request.method} {route}")
+
+@metrics.register_collector
+def cache_metrics():
+    caches = {
+        'upstream': (response_cache.stats, response_cache.local),
+        'pages': (page_cache.stats, page_cache),
+        'fragments': (fragment_cache.stats, fragment_cache),
+        'analytics': (analytics_cache.stats, analytics_cache)
+    }
+    counts = {name: stats.as_dict() for name, (stats, _) in caches.items()}
+    for field in ('hits', 'misses', 'evictions'):
+        yield f"cache_{field}_total", 'counter', f"Cache {field}", [
+            ({'cache': name}, values[field]) for name, values in counts.items()
+        ]
+    yield 'cache_hit_ratio', 'gauge', 'Hits over lookups since start', [
+        ({'cache': name}, values['hit_ratio']) for name, values in counts.items()
+    ]
+    yield 'cache_entries', 'gauge', 'Entries held in process', [
+        ({'cache': name}, len(entries)) for name, (_, entries) in caches.items()
+    ]
+
+@metrics.register_collector
+def upstream_metrics():
+    info = upstream_client.metrics.as_dict()
+    circuit = upstream_client.breaker.state
+    yield 'upstream_retries_total', 'counter', 'Upstream attempts retried after a failure', [({}, info['retries'])]
+    yield 'upstream_short_circuited_total', 'counter', 'Upstream calls refused by the open circuit', [
+        ({}, info['short_circuited'])
+    ]
+    yield 'upstream_circuit_state', 'gauge', 'Circuit breaker state (1 for the current one)', [
+        ({'state': state}, int(state == circuit))
+        for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)
+    ]
+
+@metrics.register_collector
+def database_metrics():
+    yield 'db_queries_total', 'counter', 'Database statements executed', [({}, query_tracker.total.queries)]
+    yield 'db_query_seconds_total', 'counter', 'Time spent executing database statements', [
+        ({}, query_tracker.total.seconds)
+    ]
+    if slow_request_profiler is not None:
+        yield 'slow_request_profiles_total', 'counter', 'Slow requests whose stacks were dumped', [
+            ({}, slow_request_profiler.dumps)
+        ]
 
 # Routes
 @app.route('/')
@@ -294,108 +1587,128 @@ def logout():
     flash('You have been logged out', 'success')
     return redirect(url_for('login'))
 
-@app.route('/dashboard')
+def dashboard_fragment(state, district):
+    """Table rows, summary stats and export link of the dashboard for an area"""
+    export_url = url_for('export_reports', state=state, district=district)
+    # Latest two stored days, read from the daily rollups
+    latest = latest_rollup_period('day', state, district)
+    if latest is None and app.config['MARKET_LIVE_FALLBACK'] and not MarketData.query.first():
+        MarketAPI().fetch_market_data(state=state, district=district)
+        latest = latest_rollup_period('day', state, district)
+
+    rollups = []
+    if latest is not None:
+        rollups = load_rollups('day', state, district, start=latest - timedelta(days=1))
+        export_url = url_for('export_reports', state=state, district=district,
+                             start=(latest - timedelta(days=1)).isoformat(), end=latest.isoformat())
+        rollups.sort(key=lambda rollup: rollup.period_start, reverse=True)
+
+    # One pass builds the template rows and folds every rollup into the statistics
+    changes = trend_matrix(state, district, latest, 2) if latest is not None else None
+    totals = StreamingAggregator(distinct=('commodity',))
+    dashboard_data = []
+    for rollup in rollups:
+        change = changes.value(changes.day_over_day(), rollup.commodity, rollup.market, rollup.period_start)
+        dashboard_data.append({
+            'commodity': rollup.commodity,
+            'market': rollup.market,
+            'price_per_kg': float(rollup.avg_price),
+            'date': rollup.period_start.strftime('%d/%m/%Y'),
+            'price_change': round(change, 2) if change is not None else 0
+        })
+        totals.add_summary(rollup, rollup.record_count, rollup.price_sum, rollup.min_price, rollup.max_price)
+
+    summary = totals.summary()
+    stats = {
+        'total_records': summary['count'],
+        'avg_price': summary['mean'] or 0,
+        'max_price': summary['max'] or 0,
+        'min_price': summary['min'] or 0,
+        'commodities_count': summary['distinct']['commodity']
+    }
+    return {'market_data': dashboard_data, 'stats': stats, 'export_url': export_url}
+
+def page_response(body, etag, last_modified):
+    """HTML response for a cached page that answers conditional GETs with a bodiless 304"""
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # Browsers revalidate every visit; an unchanged page costs a 304
+    response.cache_control.no_cache = True
+    response.make_conditional(request)
+    return compress_response(response, request.accept_encodings)
 
+@app.route('/dashboard')
 def dashboard():
-    try:
-        # First check if we have recent data in the database
-        today = datetime.now().strftime('%Y-%m-%d')
-        yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-        
-        # Try to get data from database first
-        market_data = MarketData.query.filter(
-            MarketData.state == 'Tamil Nadu',
-            MarketData.district == 'Salem',
-            (MarketData.date == today) | (MarketData.date == yesterday)
-        ).all()
-        
-        # If no recent data in database, fetch from API
-        if not market_data:
-            api = MarketAPI()
-            data = api.fetch_market_data(state='Tamil Nadu', district='Salem')
-            # The API method will now store data in the database
-            
-            # Refresh market data from database
-            market_data = MarketData.query.filter(
-                MarketData.state == 'Tamil Nadu',
-                MarketData.district == 'Salem'
-            ).order_by(MarketData.date.desc()).all()
-        
-        # Convert database objects to dictionaries for the template
-        dashboard_data = []
-        for data in market_data:
-            dashboard_data.append({
-                'commodity': data.commodity,
-                'market': data.market,
-                'price_per_kg': float(data.price),
-                'date': data.date,
-                'price_change': 0  # Calculate this as needed
-            })
-        
-        # Calculate statistics
-        stats = {
-            'total_records': len(dashboard_data),
-            'avg_price': sum(d['price_per_kg'] for d in dashboard_data) / len(dashboard_data) if dashboard_data else 0,
-            'max_price': max((d['price_per_kg'] for d in dashboard_data), default=0),
-            'min_price': min((d['price_per_kg'] for d in dashboard_data), default=0),
-            'commodities_count': len(set(d['commodity'] for d in dashboard_data))
-        }
-        
-    except Exception as e:
-        logger.error(f"Error in dashboard: {str(e)}")
-        dashboard_data = []
-        stats = {
-            'total_records': 0,
-            'avg_price': 0,
-            'max_price': 0,
-            'min_price': 0,
-            'commodities_count': 0
-        }
-    
-    return render_template('dashboard.html',
-                         market_data=dashboard_data,
-                         stats=stats,
-                         current_date=datetime.now().strftime('%Y-%m-%d'))
+    # Pages and fragments are keyed on the data version, so they stay valid until a write bumps it
+    version, updated_at = data_version()
+    # The page shows today's date, so it is also keyed on the day
+    today = datetime.now().strftime('%Y-%m-%d')
+    page_key = ('dashboard', request.query_string, version, today)
+    found, page = page_cache.get(page_key)
+    page_cache.stats.incr('hits' if found else 'misses')
+    if found:
+        return page_response(*page, updated_at)
+
+    state, district = selected_area()
+    fragment_key = ('dashboard', state, district, version)
+    found, fragment = fragment_cache.get(fragment_key)
+    fragment_cache.stats.incr('hits' if found else 'misses')
+    if not found:
+        try:
+            fragment = dashboard_fragment(state, district)
+        except Exception as e:
+            logger.error(f"Error in dashboard: {str(e)}")
+            return render_template('dashboard.html',
+                                 market_data=[],
+                                 stats={
+                                     'total_records': 0,
+                                     'avg_price': 0,
+                                     'max_price': 0,
+                                     'min_price': 0,
+                                     'commodities_count': 0
+                                 },
+                                 state=state,
+                                 district=district,
+                                 export_url=url_for('export_reports', state=state, district=district),
+                                 current_date=today)
+        fragment_cache.set(fragment_key, fragment, app.config['PAGE_CACHE_TTL'])
+
+    body = render_template('dashboard.html',
+                         state=state,
+                         district=district,
+                         current_date=today,
+                         **fragment)
+    page = (body, generate_etag(body.encode()))
+    page_cache.set(page_key, page, app.config['PAGE_CACHE_TTL'])
+    return page_response(*page, updated_at)
 
 @app.route('/market-analysis')
 def market_analysis():
     try:
-        api = MarketAPI()
-        data = api.fetch_market_data(state='Tamil Nadu', district='Salem')
-        
+        aggregator = PriceAggregator(db.session, market_data_source())
+        filters, start, end = analysis_window(aggregator)
+
         commodity_stats = []
-        markets = set()
-        
-        if data and 'records' in data:
-            commodities = {}
-            
-            for record in data['records']:
-                commodity = record['commodity']
-                price = record['price_per_kg']
-                market = record['market']
-                
-                if commodity not in commodities:
-                    commodities[commodity] = {
-                        'prices': [],
-                        'markets': set()
-                    }
-                
-                commodities[commodity]['prices'].append(price)
-                commodities[commodity]['markets'].add(market)
-                markets.add(market)
-            
-            for commodity, data in commodities.items():
-                prices = data['prices']
+        total_markets = 0
+        if end is not None:
+            trends = aggregator.series('commodity', start, end, filters)
+            # Per-commodity statistics and the totals, plus one streamed pass for the medians
+            groups, summary = aggregator.stream(('commodity',), start, end, filters, quantiles=(0.5,))
+            for group in groups:
                 commodity_stats.append({
-                    'name': commodity,
-                    'avg_price': sum(prices) / len(prices) if prices else 0,
-                    'max_price': max(prices) if prices else 0,
-                    'min_price': min(prices) if prices else 0,
-                    'market_count': len(data['markets']),
-                    'price_trend': prices
+                    'name': group['commodity'],
+                    'avg_price': group['avg_price'],
+                    'max_price': group['max_price'],
+                    'min_price': group['min_price'],
+                    'std_price': group['std_price'],
+                    'median_price': group['p50_price'],
+                    'market_count': group['market_count'],
+                    'price_trend': [price for _, price in trends.get(group['commodity'], [])]
                 })
-        
-        total_markets = len(markets)
+            total_markets = summary['market_count']
+
         logger.info(f"Market analysis: {len(commodity_stats)} commodities, {total_markets} markets")
         
     except Exception as e:
@@ -410,25 +1723,32 @@ def market_analysis():
 @app.route('/price-trends')
 def price_trends():
     try:
-        api = MarketAPI()
-        data = api.fetch_market_data(state='Tamil Nadu', district='Salem')
+        days = max(request.args.get('days', 30, type=int), 1)
+        state, district = selected_area()
+        latest = latest_rollup_period('day', state, district)
         
         trends = {}
-        if data and 'records' in data:
-            for record in data['records']:
-                commodity = record['commodity']
-                if commodity not in trends:
-                    trends[commodity] = []
-                
-                trends[commodity].append({
-                    'date': record['date'],
-                    'price': record['price_per_kg'],
-                    'market': record['market']
-                })
+        if latest is not None:
+            matrix = trend_matrix(state, district, latest, days)
+            trends = matrix.series_rows(
+                start=latest - timedelta(days=days - 1),
+                window=app.config['ANALYTICS_WINDOW'],
+                threshold=app.config['ANALYTICS_ANOMALY_THRESHOLD']
+            )
+            for rows in trends.values():
+                for row in rows:
+                    row['date'] = row['date'].strftime('%d/%m/%Y')
         
-        # Sort each commodity's data by date
-        for commodity in trends:
-            trends[commodity].sort(key=lambda x: datetime.strptime(x['date'], '%d/%m/%Y'))
+        forecasts = {}
+        for row in load_forecasts(state, district):
+            forecasts.setdefault(row.commodity, []).append({
+                'date': row.target_date.strftime('%d/%m/%Y'),
+                'market': row.market,
+                'forecast': row.forecast,
+                'lower': row.lower,
+                'upper': row.upper,
+                'model': row.model
+            })
         
         commodities = list(trends.keys())
         logger.info(f"Price trends: {len(commodities)} commodities")
@@ -436,82 +1756,174 @@ def price_trends():
     except Exception as e:
         logger.error(f"Error in price trends: {str(e)}")
         trends = {}
+        forecasts = {}
         commodities = []
     
     return render_template('price_trends.html', 
                          trends=trends,
+                         forecasts=forecasts,
                          commodities=commodities)
 
+REPORT_GRAINS = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}
+
 @app.route('/reports')
 def reports():
+    state, district = selected_area()
+    export_url = url_for('export_reports', state=state, district=district)
     try:
         report_type = request.args.get('type', 'daily')
-        api = MarketAPI()
-        data = api.fetch_market_data(state='Tamil Nadu', district='Salem')
+        grain = REPORT_GRAINS.get(report_type, 'day')
+        latest = latest_rollup_period(grain, state, district)
         
         reports = []
-        if data and 'records' in data:
-            for record in data['records']:
+        if latest is not None:
+            export_url = url_for('export_reports', state=state, district=district,
+                                 start=latest.isoformat(), end=period_end(grain, latest).isoformat())
+            for rollup in load_rollups(grain, state, district, start=latest, end=latest):
                 reports.append({
-                    'date': record['date'],
-                    'commodity': record['commodity'],
-                    'market': record['market'],
-                    'price': record['price_per_kg']
+                    'date': rollup.period_start.strftime('%d/%m/%Y'),
+                    'commodity': rollup.commodity,
+                    'market': rollup.market,
+                    'price': rollup.avg_price,
+                    'min_price': rollup.min_price,
+                    'max_price': rollup.max_price,
+                    'records': rollup.record_count
                 })
         
         logger.info(f"Reports: {len(reports)} records, type: {report_type}")
         
     except Exception as e:
         logger.error(f"Error in reports: {str(e)}")
+        report_type = 'daily'
         reports = []
     
     return render_template('reports.html', 
                          reports=reports,
+                         report_type=report_type,
+                         export_url=export_url,
+                         export_formats=available_formats(),
                          current_date=datetime.now().strftime('%Y-%m-%d'))
 
-@app.route('/api/market-data')
-def get_market_data():
-    """Get market data with optional filters"""
+@app.route('/reports/export')
+def export_reports():
+    """Stream stored market data as CSV, NDJSON or Parquet"""
+    fmt = request.args.get('format', 'csv')
+    compress = request.args.get('gzip') == '1' and fmt != 'parquet'
     try:
-        # Get query parameters
-        state = request.args.get('state', 'Tamil Nadu')
-        district = request.args.get('district', 'Salem')
-        date = request.args.get('date')
+        statement, start, end = export_statement()
+        rows = iter_query_rows(db.engines.get(REPLICA_BIND, db.engine), statement, app.config['EXPORT_BATCH_SIZE'])
+        chunks = stream_export(fmt, list(EXPORT_COLUMNS), rows, column_types(statement), compress)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"market_data_{start or 'all'}_{end or 'latest'}.{extension}"
+    if compress:
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    logger.info(f"Streaming {fmt} export {filename}")
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/price-discovery')
+def get_price_discovery():
+    """Best market to buy and to sell each commodity in a state, widest spreads first"""
+    try:
+        state = request.args.get('state') or app.config['MARKET_STATE']
         commodity = request.args.get('commodity')
-        
-        # Fetch data
-        api = MarketAPI()
-        data = api.fetch_market_data(state, district, date, commodity)
-        
+        limit = min(max(request.args.get('limit', app.config['DISCOVERY_LIMIT'], type=int), 1),
+                    app.config['DISCOVERY_MAX_LIMIT'])
+        min_markets = max(request.args.get('min_markets', 2, type=int), 1)
+        day = parse_date(request.args.get('date'))
+        if day is None:
+            day = db.session.execute(
+                select(db.func.max(PriceSpread.date)).join(State, PriceSpread.state_id == State.id)
+                .where(State.name == state)
+            ).scalar()
+
+        spreads = []
+        if day is not None:
+            for row in load_spreads(state, day, limit, commodity, min_markets):
+                spread = row.PriceSpread
+                spreads.append({
+                    'commodity': row.commodity,
+                    'buy_market': row.buy_market,
+                    'buy_price': spread.buy_price,
+                    'sell_market': row.sell_market,
+                    'sell_price': spread.sell_price,
+                    'spread': spread.spread,
+                    'relative_spread': spread.relative_spread,
+                    'mean_price': spread.mean_price,
+                    'std_price': spread.std_price,
+                    'market_count': spread.market_count
+                })
+
+        data = {'state': state, 'date': day.isoformat() if day else None, 'spreads': spreads}
+        if commodity and day is not None:
+            data['markets'] = [
+                {'market': row.market, 'price': row.avg_price, 'records': row.record_count}
+                for row in load_price_ladder(state, day, commodity)
+            ]
         return jsonify(data)
-    
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error in price discovery: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/market-data')
+def get_market_data():
+    """Page through stored market data, newest first, with optional filters"""
+    try:
+        fields = [name for name in request.args.get('fields', '').split(',') if name]
+        unknown = [name for name in fields if name not in MARKET_RECORD_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        limit = min(max(request.args.get('limit', app.config['API_PAGE_SIZE'], type=int), 1),
+                    app.config['API_MAX_PAGE_SIZE'])
+
+        source = market_data_source()
+        conditions, _, _ = market_data_conditions(source, *selected_area())
+        cursor = request.args.get('cursor')
+        if cursor:
+            # Keyset pagination: continue strictly after the last row already sent
+            conditions.append(tuple_(source.c.date, source.c.id) < decode_cursor(cursor))
+        statement = select(source).where(*conditions) \
+            .order_by(source.c.date.desc(), source.c.id.desc()).limit(limit + 1)
+        rows = db.session.execute(statement).all()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching market data: {str(e)}")
         return jsonify({
             "error": str(e)
         }), 500
 
+    next_cursor = encode_cursor(rows[limit - 1].date, rows[limit - 1].id) if len(rows) > limit else None
+    records = []
+    for row in rows[:limit]:
+        record = market_record(row)
+        if fields:
+            record = {name: record[name] for name in fields}
+        records.append(record)
+
+    response = jsonify({'records': records, 'count': len(records), 'next_cursor': next_cursor})
+    # Clients revalidate every poll; an unchanged page costs a 304 with no body
+    response.cache_control.no_cache = True
+    response.add_etag(weak=True)
+    response.make_conditional(request)
+    return compress_response(response, request.accept_encodings)
+
 @app.route('/api/commodities')
 def get_commodities():
-    """Get list of unique commodities from current market data"""
+    """Commodities with stable ids, optionally narrowed by a name prefix or fragment"""
     try:
-        # Fetch market data
-        api = MarketAPI()
-        data = api.fetch_market_data()
-        
-        # Extract unique commodities
-        commodities = []
-        seen = set()
-        for record in data.get('records', []):
-            if record['commodity'] not in seen:
-                seen.add(record['commodity'])
-                commodities.append({
-                    "id": record['commodity_code'],
-                    "name": record['commodity'],
-                    "variety": record['variety']
-                })
-        
-        return jsonify(commodities)
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 20 if query else None, type=int)
+        return jsonify(commodity_lookup.get().search(query, limit))
     
     except Exception as e:
         logger.error(f"Error fetching commodities: {str(e)}")
@@ -521,27 +1933,17 @@ def get_commodities():
 
 @app.route('/api/markets')
 def get_markets():
-    """Get list of unique markets from current market data"""
+    """Markets with stable ids, optionally narrowed by state, district and a name prefix or fragment"""
     try:
-        # Fetch market data
-        api = MarketAPI()
-        data = api.fetch_market_data()
-        
-        # Extract unique markets
-        markets = []
-        seen = set()
-        for record in data.get('records', []):
-            market_key = f"{record['market']}_{record['district']}_{record['state']}"
-            if market_key not in seen:
-                seen.add(market_key)
-                markets.append({
-                    "id": f"MKT{len(seen):03d}",
-                    "name": record['market'],
-                    "district": record['district'],
-                    "state": record['state']
-                })
-        
-        return jsonify(markets)
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 20 if query else None, type=int)
+        state = request.args.get('state')
+        district = request.args.get('district')
+        where = None
+        if state or district:
+            def where(entry):
+                return (not state or entry['state'] == state) and (not district or entry['district'] == district)
+        return jsonify(market_lookup.get().search(query, limit, where))
     
     except Exception as e:
         logger.error(f"Error fetching markets: {str(e)}")
@@ -553,12 +1955,11 @@ def get_markets():
 def get_market_stats():
     """Get market statistics summary"""
     try:
-        # Fetch market data
-        api = MarketAPI()
-        data = api.fetch_market_data()
-        records = data.get('records', [])
+        aggregator = PriceAggregator(db.session, market_data_source())
+        filters, start, end = analysis_window(aggregator)
+        summary = aggregator.stream((), start, end, filters, quantiles=(0.5, 0.9))[1] if end is not None else None
         
-        if not records:
+        if not summary or not summary['count']:
             return jsonify({
                 "total_records": 0,
                 "commodities": 0,
@@ -566,56 +1967,101 @@ def get_market_stats():
                 "states": 0,
                 "avg_price": 0,
                 "min_price": 0,
-                "max_price": 0
+                "max_price": 0,
+                "std_price": 0,
+                "median_price": 0,
+                "p90_price": 0
             })
         
-        # Calculate statistics
-        commodities = set(record['commodity'] for record in records)
-        markets = set(record['market'] for record in records)
-        states = set(record['state'] for record in records)
-        
-        prices = [record['price_per_kg'] for record in records]
-        avg_price = sum(prices) / len(prices) if prices else 0
-        min_price = min(prices) if prices else 0
-        max_price = max(prices) if prices else 0
-        
         return jsonify({
-            "total_records": len(records),
-            "commodities": len(commodities),
-            "markets": len(markets),
-            "states": len(states),
-            "avg_price": round(avg_price, 2),
-            "min_price": round(min_price, 2),
-            "max_price": round(max_price, 2),
+            "total_records": summary['count'],
+            "commodities": summary['commodity_count'],
+            "markets": summary['market_count'],
+            "states": summary['state_count'],
+            "avg_price": round(summary['avg_price'], 2),
+            "min_price": round(summary['min_price'], 2),
+            "max_price": round(summary['max_price'], 2),
+            "std_price": round(summary['std_price'], 2),
+            "median_price": round(summary['p50_price'] or 0, 2),
+            "p90_price": round(summary['p90_price'] or 0, 2),
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
             "last_updated": datetime.now().isoformat()
         })
     
+    except ValueError as e:
+        return jsonify({
+            "error": str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error generating market statistics: {str(e)}")
         return jsonify({
             "error": str(e)
         }), 500
 
+@app.route('/api/forecast')
+def get_forecast():
+    """Precomputed price forecasts for the markets of an area, one entry per commodity and market"""
+    try:
+        state, district = selected_area()
+        series = {}
+        for row in load_forecasts(state, district, request.args.get('commodity'), request.args.get('market')):
+            entry = series.get((row.commodity, row.market))
+            if entry is None:
+                entry = series[(row.commodity, row.market)] = {
+                    'commodity': row.commodity,
+                    'market': row.market,
+                    'model': row.model,
+                    'rmse': row.rmse,
+                    'last_observed': row.last_date.isoformat(),
+                    'fitted_at': row.fitted_at.isoformat(),
+                    'points': []
+                }
+            entry['points'].append({
+                'date': row.target_date.isoformat(),
+                'forecast': round(row.forecast, 2),
+                'lower': round(row.lower, 2),
+                'upper': round(row.upper, 2)
+            })
+        return jsonify({
+            'state': state,
+            'district': district,
+            'confidence': app.config['FORECAST_CONFIDENCE'],
+            'forecasts': list(series.values())
+        })
+    except Exception as e:
+        logger.error(f"Error loading forecasts: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/add-market-data', methods=['GET', 'POST'])
 def add_market_data():
     if request.method == 'POST':
         try:
+            encoder = DimensionEncoder(db.session, State, District, Market, Commodity)
+            market_id, commodity_id = encoder.encode_one(
+                request.form.get('state') or app.config['MARKET_STATE'],
+                request.form.get('district') or app.config['MARKET_DISTRICT'],
+                request.form['market'],
+                request.form['commodity']
+            )
             new_data = MarketData(
-                state='Tamil Nadu',
-                district='Salem',
-                market=request.form['market'],
-                commodity=request.form['commodity'],
+                market_id=market_id,
+                commodity_id=commodity_id,
                 price=float(request.form['price']),
-                date=datetime.now().strftime('%d/%m/%Y')
+                date=datetime.now().date()
             )
             db.session.add(new_data)
+            refresh_rollups([new_data])
             db.session.commit()
             flash('Market data added successfully!', 'success')
             return redirect(url_for('dashboard'))
         except Exception as e:
+            db.session.rollback()
             flash(f'Error adding market data: {str(e)}', 'error')
     
-    return render_template('add_market_data.html')
+    return render_template('add_market_data.html',
+                         state=app.config['MARKET_STATE'],
+                         district=app.config['MARKET_DISTRICT'])
 
 @app.route('/edit-market-data/<int:id>', methods=['GET', 'POST'])
 def edit_market_data(id):
@@ -623,13 +2069,19 @@ def edit_market_data(id):
     
     if request.method == 'POST':
         try:
-            data.market = request.form['market']
-            data.commodity = request.form['commodity']
+            # The old market and commodity lose this row, so their rollups and spreads change too
+            previous = {'market_id': data.market_id, 'commodity_id': data.commodity_id, 'date': data.date}
+            encoder = DimensionEncoder(db.session, State, District, Market, Commodity)
+            data.market_id, data.commodity_id = encoder.encode_one(
+                data.state, data.district, request.form['market'], request.form['commodity']
+            )
             data.price = float(request.form['price'])
+            refresh_rollups([data, previous])
             db.session.commit()
             flash('Market data updated successfully!', 'success')
             return redirect(url_for('dashboard'))
         except Exception as e:
+            db.session.rollback()
             flash(f'Error updating market data: {str(e)}', 'error')
     
     return render_template('edit_market_data.html', data=data)
@@ -639,18 +2091,48 @@ def delete_market_data(id):
     try:
         data = MarketData.query.get_or_404(id)
         db.session.delete(data)
+        refresh_rollups([data])
         db.session.commit()
         flash('Market data deleted successfully!', 'success')
     except Exception as e:
+        db.session.rollback()
         flash(f'Error deleting market data: {str(e)}', 'error')
     
     return redirect(url_for('dashboard'))
 
+@app.route('/api/cache-stats')
+def get_cache_stats():
+    """Upstream response, rendered page and page fragment cache counters"""
+    info = response_cache.info()
+    info['pages'] = {**page_cache.stats.as_dict(), 'entries': len(page_cache)}
+    info['fragments'] = {**fragment_cache.stats.as_dict(), 'entries': len(fragment_cache)}
+    return jsonify(info)
+
+@app.route('/api/upstream-stats')
+def get_upstream_stats():
+    """Upstream client latency, retry and circuit breaker counters"""
+    return jsonify(upstream_client.info())
+
+@app.route('/metrics')
+def get_metrics():
+    """Request, upstream, database, cache and ingestion metrics in the Prometheus text format"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/api/storage-stats')
+def get_storage_stats():
+    """Database backends, connection pools and effective SQLite pragmas"""
+    try:
+        return jsonify({bind_key or 'primary': describe_engine(bind_engine) for bind_key, bind_engine in db.engines.items()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/health')
 def health_check():
     """API health check endpoint"""
+    circuit = upstream_client.breaker.state
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if circuit == CircuitBreaker.CLOSED else "degraded",
+        "upstream_circuit": circuit,
         "version": "1.0.0",
         "timestamp": datetime.now().isoformat()
     })
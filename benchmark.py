@@ -0,0 +1,284 @@
+"""Benchmark suite: ingestion throughput, route latency and memory at several database sizes.
+
+A local stub of data.gov.in serves deterministic synthetic records. For
+every size in ``--days`` a fresh subprocess ingests that many days into
+its own scratch database, then times every route cold (caches cleared
+before each request) and warm, and reports its memory high-water marks.
+Results are printed and optionally written as one JSON document; with
+``--compare`` the run fails when a metric regressed past ``--tolerance``.
+
+    python benchmark.py --days 7,30 --output bench.json
+    python benchmark.py --days 7,30 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+from synthetic import StubUpstream, SyntheticMarket
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ROUTES = (
+    '/dashboard',
+    '/market-analysis?days=7',
+    '/price-trends',
+    '/reports',
+    '/reports/export',
+    '/api/market-data',
+    '/api/commodities?q=to',
+    '/api/markets',
+    '/api/market-stats?days=7',
+    '/api/price-discovery'
+)
+# Differences below these floors are noise, however large relative to the baseline
+NOISE_FLOORS = {'ms': 2.0, 'kb': 8192, 'rows_per_second': 0}
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def latency_summary(latencies):
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(milliseconds),
+        'p50_ms': round(percentile(milliseconds, 0.50), 3),
+        'p99_ms': round(percentile(milliseconds, 0.99), 3),
+        'mean_ms': round(sum(milliseconds) / len(milliseconds), 3),
+        'max_ms': round(max(milliseconds), 3)
+    }
+
+
+def run_child(config):
+    """One database size: ingest, time the routes, report memory; runs in its own process"""
+    import logging
+    import resource
+
+    def high_water_kb():
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+
+    started = time.perf_counter()
+    import app as market_app
+    logging.disable(logging.INFO)
+    result = {'days': config['days'], 'import_seconds': round(time.perf_counter() - started, 3)}
+    memory = {'after_import_kb': high_water_kb()}
+
+    app = market_app.app
+    with app.app_context():
+        api = market_app.MarketAPI(cache=False)
+        rows = 0
+        started = time.perf_counter()
+        for day in config['dates']:
+            data = api.fetch_data_for_date(day)
+            if data.get('error'):
+                raise RuntimeError(f"Ingesting {day} failed: {data['error']}")
+            rows += data.get('count', 0)
+        elapsed = time.perf_counter() - started
+        result['ingest'] = {
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed, 1)
+        }
+
+        # The newest day again: every row is already stored and unchanged
+        started = time.perf_counter()
+        rows = api.fetch_data_for_date(config['dates'][0]).get('count', 0)
+        elapsed = time.perf_counter() - started
+        result['reingest'] = {'rows': rows, 'seconds': round(elapsed, 3), 'rows_per_second': round(rows / elapsed, 1)}
+
+        report = market_app.ingest_all_regions(f"bench-{config['days']}", days=1, workers=config['workers'])
+        result['fanout'] = {
+            'regions': report.completed,
+            'failed': len(report.failed),
+            'rows': report.stats.received,
+            'seconds': round(report.elapsed, 3),
+            'rows_per_second': round(report.stats.received / report.elapsed, 1) if report.elapsed else None
+        }
+        memory['after_ingest_kb'] = high_water_kb()
+        result['database'] = {
+            'market_data_rows': market_app.MarketData.query.count(),
+            'rollup_rows': market_app.PriceRollup.query.count(),
+            'file_bytes': os.path.getsize(config['database'])
+        }
+
+    def clear_caches():
+        for cache in (market_app.page_cache, market_app.fragment_cache, market_app.analytics_cache,
+                      market_app.response_cache):
+            cache.clear()
+        market_app.commodity_lookup.invalidate()
+        market_app.market_lookup.invalidate()
+
+    client = app.test_client()
+    routes = {}
+    for route in ROUTES:
+        timings = {}
+        for mode in ('cold', 'warm'):
+            latencies = []
+            for _ in range(config['requests']):
+                if mode == 'cold':
+                    clear_caches()
+                started = time.perf_counter()
+                response = client.get(route)
+                body = response.get_data()
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{route} answered {response.status_code}")
+            timings[mode] = latency_summary(latencies)
+        timings['bytes'] = len(body)
+        routes[route] = timings
+    result['routes'] = routes
+    memory['after_routes_kb'] = high_water_kb()
+    result['memory'] = memory
+    return result
+
+
+def run_size(days, args, market, upstream_url, scratch):
+    database = os.path.join(scratch, f"bench_{days}.db")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{database}",
+        MARKET_API_URL=upstream_url,
+        MARKET_CACHE_SHARED_PATH=os.path.join(scratch, f"bench_{days}_cache.db"),
+        MARKET_CACHE_TTL='0',
+        MARKET_CACHE_NEGATIVE_TTL='0',
+        MARKET_RATE_LIMIT='0',
+        MARKET_RETRIES='0',
+        MARKET_LIVE_FALLBACK='0',
+        MARKET_STATE=market.state_name(0),
+        MARKET_DISTRICT=market.district_name(0, 0),
+        INGEST_SLICES='*'
+    )
+    config = {
+        'days': days,
+        'dates': [day.strftime('%d/%m/%Y') for day in market.dates[:days]],
+        'database': database,
+        'requests': args.requests,
+        'workers': args.workers
+    }
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', json.dumps(config)],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark for {days} days failed:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metrics(report):
+    """Flatten a report into {name: (value, unit, higher_is_better)}"""
+    flat = {}
+    for result in report['results']:
+        prefix = f"{result['days']}d"
+        for scenario in ('ingest', 'reingest', 'fanout'):
+            flat[f"{prefix}.{scenario}.rows_per_second"] = (result[scenario]['rows_per_second'], 'rows_per_second', True)
+        for route, timings in result['routes'].items():
+            for mode in ('cold', 'warm'):
+                for name in ('p50_ms', 'p99_ms'):
+                    flat[f"{prefix}.{route}.{mode}.{name}"] = (timings[mode][name], 'ms', False)
+        for name, value in result['memory'].items():
+            flat[f"{prefix}.memory.{name}"] = (value, 'kb', False)
+    return flat
+
+
+def compare(report, baseline, tolerance):
+    """Metrics that got worse than the baseline by more than ``tolerance`` and the noise floor"""
+    current = metrics(report)
+    regressions = []
+    for name, (before, unit, higher_is_better) in metrics(baseline).items():
+        if name not in current or before is None or current[name][0] is None:
+            continue
+        after = current[name][0]
+        worse_by = before - after if higher_is_better else after - before
+        if before and worse_by / abs(before) > tolerance and worse_by > NOISE_FLOORS[unit]:
+            regressions.append({
+                'metric': name,
+                'baseline': before,
+                'current': after,
+                'change': round(worse_by / abs(before), 3)
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', default='7,30', help='Comma separated database sizes, in days of history')
+    parser.add_argument('--states', type=int, default=3)
+    parser.add_argument('--districts', type=int, default=4, help='Districts per state')
+    parser.add_argument('--markets', type=int, default=5, help='Markets per district')
+    parser.add_argument('--commodities', type=int, default=20)
+    parser.add_argument('--varieties', type=int, default=2, help='Varieties reported per commodity')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=20, help='Requests per route and cache mode')
+    parser.add_argument('--workers', type=int, default=4, help='Fan-out ingestion threads')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds the stub upstream takes per call')
+    parser.add_argument('--output', help='Write the JSON results to this file')
+    parser.add_argument('--compare', help='Baseline results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown before failing')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return 0
+
+    sizes = sorted({int(days) for days in args.days.split(',')})
+    market = SyntheticMarket(args.states, args.districts, args.markets, args.commodities,
+                             days=max(sizes), end=date.today(), seed=args.seed, varieties=args.varieties)
+    with StubUpstream(market, delay=args.delay) as upstream, tempfile.TemporaryDirectory() as scratch:
+        results = [run_size(days, args, market, upstream.url, scratch) for days in sizes]
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'config': {
+            'states': args.states,
+            'districts': args.districts,
+            'markets': args.markets,
+            'commodities': args.commodities,
+            'varieties': market.varieties,
+            'records_per_day': market.records_per_day,
+            'seed': args.seed,
+            'requests': args.requests,
+            'workers': args.workers,
+            'delay': args.delay
+        },
+        'results': results
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(report, json.load(f), args.tolerance)
+
+    document = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(document + '\n')
+    print(document)
+    return 1 if report.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
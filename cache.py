@@ -0,0 +1,264 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Thread-safe hit/miss/eviction counters for a cache"""
+
+    FIELDS = ('hits', 'misses', 'shared_hits', 'negative_hits', 'stores',
+              'evictions', 'expirations', 'collapsed', 'load_errors')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def incr(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def as_dict(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_ratio'] = round(counts['hits'] / lookups, 4) if lookups else 0.0
+        return counts
+
+
+class LRUCache:
+    """In-process LRU cache where every entry carries its own expiry time"""
+
+    def __init__(self, max_entries=256, stats=None):
+        self.max_entries = max_entries
+        self.stats = stats or CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value) for a key, dropping it if it has expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.stats.incr('expirations')
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.incr('evictions')
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """Cache tier kept in a SQLite file so every worker process shares hits"""
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries
+                        (key TEXT PRIMARY KEY,
+                         value TEXT NOT NULL,
+                         expires_at REAL NOT NULL)''')
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return (found, value, expires_at) for a key that has not yet expired; expires_at is a time.time()"""
+        try:
+            row = self._connection().execute(
+                'SELECT value, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?',
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {str(e)}")
+            return False, None, None
+        if row is None:
+            return False, None, None
+        return True, json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl):
+        conn = self._connection()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    def delete(self, key):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+        conn.commit()
+
+    def purge_expired(self):
+        """Delete expired entries and return how many were removed"""
+        conn = self._connection()
+        cursor = conn.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (time.time(),))
+        conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM cache_entries')
+        conn.commit()
+
+
+class _Flight:
+    """A load in progress that concurrent callers for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """Two-tier TTL cache for upstream responses.
+
+    Lookups go to the in-process LRU first and then to the optional shared
+    SQLite tier. Concurrent misses for the same key are collapsed so that
+    only one loader call is in flight per key. Responses without records
+    are cached for ``negative_ttl`` and responses carrying an ``error`` are
+    never cached.
+    """
+
+    def __init__(self, ttl=300, negative_ttl=60, max_entries=256, shared_path=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = CacheStats()
+        self.local = LRUCache(max_entries, stats=self.stats)
+        self.shared = SQLiteCacheStore(shared_path) if shared_path else None
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(parts):
+        return '|'.join('' if part is None else str(part) for part in parts)
+
+    def _ttl_for(self, value):
+        if not value.get('records'):
+            return self.negative_ttl
+        return self.ttl
+
+    def get_or_load(self, parts, loader):
+        """Return the cached response for ``parts`` or call ``loader`` once to fill it"""
+        key = self.make_key(parts)
+
+        found, value = self.local.get(key)
+        if found:
+            self.stats.incr('hits')
+            if not value.get('records'):
+                self.stats.incr('negative_hits')
+            return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            self.stats.incr('collapsed')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = self._load(key, loader)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _load(self, key, loader):
+        if self.shared is not None:
+            found, value, expires_at = self.shared.get(key)
+            if found:
+                self.stats.incr('hits')
+                self.stats.incr('shared_hits')
+                # The local copy expires with the shared entry, not a full TTL after this read
+                self.local.set(key, value, min(expires_at - time.time(), self._ttl_for(value)))
+                return value
+
+        self.stats.incr('misses')
+        try:
+            value = loader()
+        except Exception:
+            self.stats.incr('load_errors')
+            raise
+
+        if value.get('error'):
+            self.stats.incr('load_errors')
+            return value
+
+        ttl = self._ttl_for(value)
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+        self.stats.incr('stores')
+        return value
+
+    def invalidate(self, parts):
+        key = self.make_key(parts)
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def info(self):
+        info = self.stats.as_dict()
+        info['local_entries'] = len(self.local)
+        info['shared'] = self.shared is not None
+        return info
@@ -1,7 +1,50 @@
+"""Standalone store for the flat market_prices table.
+
+    python database.py load dumps/2024-06-01.csv dumps/2024-06-02.json
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
 import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+
+from storage import apply_pragmas, sqlite_pragmas
+
+DATABASE_PATH = 'market_data.db'
+
+# Records written per transaction by the batch API
+DEFAULT_CHUNK_SIZE = 1000
+
+COLUMNS = ('state', 'district', 'market', 'commodity', 'price', 'date')
+# One row per observation; loading a record again replaces its price
+KEY_COLUMNS = ('state', 'district', 'market', 'commodity', 'date')
+KEY_INDEX = 'uq_market_prices_observation'
+INSERT_SQL = (
+    f"INSERT INTO market_prices ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+    f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET price = excluded.price"
+)
+# dd/mm/YYYY and dd-mm-YYYY dates, which older versions stored as they arrived
+LEGACY_DATE_PATTERNS = ('__/__/____', '__-__-____')
 
-def init_db():
-    conn = sqlite3.connect('market_data.db')
+_local = threading.local()
+
+def get_connection():
+    """This thread's connection, opened once with WAL and the tuned pragmas"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH, timeout=5.0)
+        apply_pragmas(conn, sqlite_pragmas())
+        _local.conn = conn
+    return conn
+
+def init_db(conn=None):
+    conn = conn or get_connection()
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS market_prices
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -12,15 +55,205 @@ def init_db():
                   price REAL,
                   date TEXT)''')
     conn.commit()
-    conn.close()
+    ensure_observation_key(conn)
 
-def insert_market_data(data):
-    conn = sqlite3.connect('market_data.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO market_prices 
-                 (state, district, market, commodity, price, date)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-                 (data['state'], data['district'], data['market'],
-                  data['commodity'], data['price'], data['date']))
-    conn.commit()
-    conn.close()
+def ensure_observation_key(conn):
+    """Create the unique index on the observation key, converting older tables first.
+
+    Dates stored as they arrived are rewritten as YYYY-MM-DD, then the
+    latest row of each observation is kept and the rest are removed.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (KEY_INDEX,)
+    ).fetchone()
+    if exists:
+        return
+    key_columns = ', '.join(KEY_COLUMNS)
+    with conn:
+        for pattern in LEGACY_DATE_PATTERNS:
+            conn.execute(
+                "UPDATE market_prices SET date = substr(date, 7, 4) || '-' || substr(date, 4, 2) "
+                "|| '-' || substr(date, 1, 2) WHERE date LIKE ?", (pattern,)
+            )
+        conn.execute(
+            f"DELETE FROM market_prices WHERE id NOT IN "
+            f"(SELECT MAX(id) FROM market_prices GROUP BY {key_columns})"
+        )
+        conn.execute(f"CREATE UNIQUE INDEX {KEY_INDEX} ON market_prices ({key_columns})")
+
+def insert_market_data(data, conn=None):
+    """Store one record, normalised like the batch API, replacing an earlier price for it"""
+    conn = conn or get_connection()
+    with conn:
+        conn.execute(INSERT_SQL, normalize_record(data))
+
+
+class BatchStats:
+    """Counters for one chunk written by the batch API"""
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.received = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            'batch': self.batch,
+            'received': self.received,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'elapsed': round(self.elapsed, 4)
+        }
+
+
+def _field_name(name):
+    # data.gov.in CSV headers encode spaces as _x0020_ ("Modal_x0020_Price")
+    return name.strip().replace('_x0020_', '_').replace(' ', '_').lower()
+
+def _iso_date(value):
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(value.strip(), fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {value}")
+
+def normalize_record(record):
+    """Map a market_prices dict or a raw data.gov.in record onto the table's columns.
+
+    Raw records carry the modal price per quintal; like the app, the
+    stored price is per kg. Dates are stored as YYYY-MM-DD.
+    """
+    fields = {_field_name(key): value for key, value in record.items() if key}
+    if fields.get('price') not in (None, ''):
+        price = float(fields['price'])
+    else:
+        price = float(fields['modal_price']) / 100.0
+    return (
+        fields['state'].strip(),
+        fields['district'].strip(),
+        fields['market'].strip(),
+        fields['commodity'].strip(),
+        price,
+        _iso_date(fields.get('date') or fields['arrival_date'])
+    )
+
+def iter_insert_batches(records, chunk_size=DEFAULT_CHUNK_SIZE, conn=None):
+    """Insert records from any iterable, one transaction per chunk, yielding each chunk's BatchStats.
+
+    Records that cannot be parsed are counted and skipped. Each chunk is
+    upserted on the observation key with a single executemany and a single
+    commit, so a record repeating one already stored, in this chunk or an
+    earlier load, replaces its price; repeats within a chunk count as
+    duplicates.
+    """
+    conn = conn or get_connection()
+    iterator = iter(records)
+    batch = 0
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        batch += 1
+        stats = BatchStats(batch)
+        stats.received = len(chunk)
+        started = time.perf_counter()
+        rows = {}
+        for record in chunk:
+            try:
+                row = normalize_record(record)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                stats.invalid += 1
+                continue
+            key = row[:4] + row[5:]
+            if key in rows:
+                stats.duplicates += 1
+            rows[key] = row
+        with conn:
+            conn.executemany(INSERT_SQL, list(rows.values()))
+        stats.inserted = len(rows)
+        stats.elapsed = time.perf_counter() - started
+        yield stats
+
+def insert_market_data_batch(records, chunk_size=DEFAULT_CHUNK_SIZE, conn=None):
+    """Insert records in chunked transactions and return the list of per-chunk BatchStats"""
+    return list(iter_insert_batches(records, chunk_size, conn))
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+def _dump_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if extension == '.json':
+        return 'json'
+    raise ValueError(f"Cannot tell the format of {path}; pass --format")
+
+def iter_dump_records(path, fmt=None):
+    """Stream records from a data.gov.in CSV, JSON or NDJSON dump, optionally gzipped.
+
+    JSON dumps may be a list of records or an API response with a
+    ``records`` list; CSV and NDJSON are read one line at a time.
+    """
+    fmt = fmt or _dump_format(path)
+    with _open_text(path) as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        elif fmt == 'ndjson':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif fmt == 'json':
+            data = json.load(f)
+            yield from data.get('records', []) if isinstance(data, dict) else data
+        else:
+            raise ValueError(f"Unknown dump format: {fmt}")
+
+
+def main():
+    global DATABASE_PATH
+    parser = argparse.ArgumentParser(description='Manage the market_prices table.')
+    parser.add_argument('--db', default=DATABASE_PATH, help='SQLite database file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('init', help='Create the market_prices table')
+    load = commands.add_parser('load', help='Bulk-load data.gov.in CSV/JSON dumps into market_prices')
+    load.add_argument('paths', nargs='+', help='Dump files (.csv, .json, .ndjson, optionally .gz)')
+    load.add_argument('--format', choices=('csv', 'json', 'ndjson'), help='Override the format from the extension')
+    load.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Records per transaction')
+    load.add_argument('--quiet', action='store_true', help='Only print the totals')
+    args = parser.parse_args()
+
+    DATABASE_PATH = args.db
+    init_db()
+    if args.command == 'init':
+        return
+
+    totals = {'files': 0, 'batches': 0, 'received': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0}
+    started = time.perf_counter()
+    for path in args.paths:
+        for stats in iter_insert_batches(iter_dump_records(path, args.format), args.chunk_size):
+            if not args.quiet:
+                print(json.dumps({'file': path, **stats.as_dict()}), file=sys.stderr)
+            totals['batches'] += 1
+            for key in ('received', 'inserted', 'duplicates', 'invalid'):
+                totals[key] += getattr(stats, key)
+        totals['files'] += 1
+    elapsed = time.perf_counter() - started
+    totals['elapsed'] = round(elapsed, 3)
+    totals['rows_per_second'] = round(totals['inserted'] / elapsed, 1) if elapsed else None
+    print(json.dumps(totals, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Concurrent read/write benchmark for the SQLite storage profiles.
+
+Writer threads insert batches of price rows while reader threads run the
+aggregate and point queries the pages issue, against a scratch database
+opened once per profile:
+
+    baseline  rollback journal, synchronous=FULL, a new connection per
+              operation (how database.py used to work)
+    tuned     the storage layer's WAL pragmas and connection pool
+
+Results are printed as one JSON document.
+
+    python dbbench.py --writers 2 --readers 8 --duration 10
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from storage import engine_options, install_pragmas, sqlite_pragmas
+
+COMMODITIES = ('Tomato', 'Onion', 'Potato', 'Brinjal', 'Carrot', 'Cabbage', 'Beans', 'Banana')
+START = date(2024, 1, 1)
+
+SCHEMA = (
+    '''CREATE TABLE market_prices
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        market TEXT, commodity TEXT, price REAL, date TEXT)''',
+    'CREATE INDEX ix_market_prices_commodity_date ON market_prices (commodity, date)'
+)
+INSERT = text('INSERT INTO market_prices (market, commodity, price, date) VALUES (:market, :commodity, :price, :date)')
+READS = (
+    text('SELECT commodity, AVG(price), MIN(price), MAX(price), COUNT(*) FROM market_prices '
+         'WHERE date >= :since GROUP BY commodity'),
+    text('SELECT date, price FROM market_prices WHERE commodity = :commodity AND date >= :since '
+         'ORDER BY date DESC LIMIT 50')
+)
+
+
+def make_engine(profile, url, args):
+    if profile == 'baseline':
+        engine = create_engine(url, poolclass=NullPool, connect_args={'timeout': args.busy_timeout / 1000})
+        install_pragmas(engine, [('journal_mode', 'DELETE'), ('synchronous', 'FULL')])
+    elif profile == 'tuned':
+        engine = create_engine(url, **engine_options(
+            url, pool_size=args.writers + args.readers, busy_timeout=args.busy_timeout
+        ))
+        install_pragmas(engine, sqlite_pragmas(busy_timeout=args.busy_timeout))
+    else:
+        raise ValueError(f"Unknown profile: {profile}")
+    return engine
+
+
+def make_rows(rng, count, days):
+    return [{
+        'market': f"Market {rng.randrange(40)}",
+        'commodity': rng.choice(COMMODITIES),
+        'price': round(rng.uniform(5, 120), 2),
+        'date': (START + timedelta(days=rng.randrange(days))).isoformat()
+    } for _ in range(count)]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * fraction), len(values) - 1)] * 1000, 3)
+
+
+def run_profile(profile, args, scratch):
+    url = f"sqlite:///{os.path.join(scratch, f'{profile}.db')}"
+    engine = make_engine(profile, url, args)
+    rng = random.Random(args.seed)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(INSERT, make_rows(rng, args.rows, args.days))
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    counts = {'write_batches': 0, 'rows_written': 0, 'reads': 0, 'write_errors': 0, 'read_errors': 0}
+    write_latencies = []
+    read_latencies = []
+
+    def writer(seed):
+        local = random.Random(seed)
+        while not stop.is_set():
+            rows = make_rows(local, args.batch, args.days)
+            started = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(INSERT, rows)
+            except OperationalError:
+                with lock:
+                    counts['write_errors'] += 1
+                continue
+            with lock:
+                write_latencies.append(time.perf_counter() - started)
+                counts['write_batches'] += 1
+                counts['rows_written'] += len(rows)
+
+    def reader(seed):
+        local = random.Random(seed)
+        while not stop.is_set():
+            params = {
+                'since': (START + timedelta(days=local.randrange(args.days))).isoformat(),
+                'commodity': local.choice(COMMODITIES)
+            }
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(local.choice(READS), params).all()
+            except OperationalError:
+                with lock:
+                    counts['read_errors'] += 1
+                continue
+            with lock:
+                read_latencies.append(time.perf_counter() - started)
+                counts['reads'] += 1
+
+    threads = [threading.Thread(target=writer, args=(args.seed + index,)) for index in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(args.seed + 1000 + index,)) for index in range(args.readers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    return {
+        'profile': profile,
+        'elapsed': round(elapsed, 3),
+        **counts,
+        'rows_written_per_second': round(counts['rows_written'] / elapsed, 1),
+        'reads_per_second': round(counts['reads'] / elapsed, 1),
+        'write_p50_ms': percentile(write_latencies, 0.50),
+        'write_p99_ms': percentile(write_latencies, 0.99),
+        'read_p50_ms': percentile(read_latencies, 0.50),
+        'read_p99_ms': percentile(read_latencies, 0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', default='baseline,tuned', help='Comma separated storage profiles to compare')
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds each profile runs')
+    parser.add_argument('--rows', type=int, default=50000, help='Rows loaded before the run')
+    parser.add_argument('--batch', type=int, default=200, help='Rows per write transaction')
+    parser.add_argument('--days', type=int, default=90, help='Distinct dates spread over the rows')
+    parser.add_argument('--busy-timeout', type=int, default=5000, help='Milliseconds to wait on a locked database')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        results = [run_profile(profile, args, scratch) for profile in args.profiles.split(',')]
+
+    report = {'writers': args.writers, 'readers': args.readers, 'results': results}
+    by_profile = {result['profile']: result for result in results}
+    if 'baseline' in by_profile and 'tuned' in by_profile:
+        baseline, tuned = by_profile['baseline'], by_profile['tuned']
+        report['speedup'] = {
+            key: round(tuned[key] / baseline[key], 2) if baseline[key] else None
+            for key in ('rows_written_per_second', 'reads_per_second')
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
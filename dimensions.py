@@ -0,0 +1,79 @@
+from sqlalchemy import select, tuple_
+
+from ingest import dialect_insert
+
+
+class DimensionEncoder:
+    """Dictionary-encodes state, district, market and commodity names as integer ids.
+
+    Missing lookup rows are created with INSERT ... ON CONFLICT DO NOTHING so
+    concurrent writers agree on one id per name. Ids are cached for the
+    lifetime of the encoder only, which should not outlive its transaction.
+    """
+
+    def __init__(self, session, state_model, district_model, market_model, commodity_model):
+        self.session = session
+        self.state_model = state_model
+        self.district_model = district_model
+        self.market_model = market_model
+        self.commodity_model = commodity_model
+        self._states = {}
+        self._districts = {}
+        self._markets = {}
+        self._commodities = {}
+
+    def encode(self, records):
+        """Return (market_id, commodity_id) for each record holding the four names"""
+        states = self._resolve(self.state_model, ('name',), {(r['state'],) for r in records}, self._states)
+        districts = self._resolve(
+            self.district_model, ('state_id', 'name'),
+            {(states[(r['state'],)], r['district']) for r in records},
+            self._districts
+        )
+        markets = self._resolve(
+            self.market_model, ('district_id', 'name'),
+            {(districts[(states[(r['state'],)], r['district'])], r['market']) for r in records},
+            self._markets
+        )
+        codes = {r['commodity']: r.get('commodity_code') or None for r in records}
+        commodities = self._resolve(
+            self.commodity_model, ('name',), {(name,) for name in codes}, self._commodities,
+            extra=lambda key: {'code': codes[key[0]]}
+        )
+
+        encoded = []
+        for r in records:
+            district_id = districts[(states[(r['state'],)], r['district'])]
+            encoded.append((markets[(district_id, r['market'])], commodities[(r['commodity'],)]))
+        return encoded
+
+    def encode_one(self, state, district, market, commodity):
+        return self.encode([{'state': state, 'district': district, 'market': market, 'commodity': commodity}])[0]
+
+    def _resolve(self, model, key_names, wanted, cache, extra=None):
+        missing = [key for key in wanted if key not in cache]
+        if missing:
+            self._load(model, key_names, missing, cache)
+            still_missing = [key for key in missing if key not in cache]
+            if still_missing:
+                insert = dialect_insert(self.session.get_bind().dialect.name)
+                rows = []
+                for key in still_missing:
+                    row = dict(zip(key_names, key))
+                    if extra is not None:
+                        row.update(extra(key))
+                    rows.append(row)
+                self.session.execute(insert(model.__table__).on_conflict_do_nothing(), rows)
+                self._load(model, key_names, still_missing, cache)
+        return cache
+
+    def _load(self, model, key_names, keys, cache):
+        columns = [getattr(model, name) for name in key_names]
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            if len(columns) == 1:
+                condition = columns[0].in_([key[0] for key in chunk])
+            else:
+                condition = tuple_(*columns).in_(chunk)
+            for row in self.session.execute(select(model.id, *columns).where(condition)):
+                cache[tuple(row[1:])] = row[0]
@@ -0,0 +1,127 @@
+import logging
+import math
+import time
+from datetime import timedelta
+
+from sqlalchemy import delete, func, insert, select, tuple_
+
+from rollups import period_end, period_start
+
+logger = logging.getLogger(__name__)
+
+
+class SpreadIndexer:
+    """Keeps per-day cross-market price spreads in step with the daily rollups.
+
+    For every (state, commodity, day) the markets' daily average prices are
+    ranked; the cheapest market is the best place to buy, the dearest the
+    best place to sell. One row per group stores both ends, the spread and
+    the dispersion, indexed by (state, date, spread) so the widest spreads
+    of a day are an index scan. Refreshes run inside the caller's
+    transaction, after the rollups they read have been refreshed.
+    """
+
+    def __init__(self, session, rollup_model, spread_model, market_model, district_model, chunk_size=400):
+        self.session = session
+        self.rollup = rollup_model
+        self.spread = spread_model
+        self.market = market_model
+        self.district = district_model
+        self.chunk_size = chunk_size
+
+    def _state_ids(self, market_ids):
+        market_ids = list(market_ids)
+        states = {}
+        for start in range(0, len(market_ids), self.chunk_size):
+            statement = select(self.market.id, self.district.state_id) \
+                .join(self.district, self.market.district_id == self.district.id) \
+                .where(self.market.id.in_(market_ids[start:start + self.chunk_size]))
+            states.update(self.session.execute(statement).all())
+        return states
+
+    def refresh(self, keys):
+        """Recompute the spreads touched by (market_id, commodity_id, date) keys"""
+        keys = [key for key in keys if key[2] is not None]
+        if not keys:
+            return 0
+        states = self._state_ids({key[0] for key in keys})
+        touched = list({(states[market_id], commodity_id, day)
+                        for market_id, commodity_id, day in keys if market_id in states})
+
+        rollup = self.rollup
+        group_key = [self.district.state_id, rollup.commodity_id, rollup.period_start]
+        spread_key = [self.spread.state_id, self.spread.commodity_id, self.spread.date]
+        rows = []
+        for start in range(0, len(touched), self.chunk_size):
+            chunk = touched[start:start + self.chunk_size]
+            ladders = {}
+            statement = select(*group_key, rollup.market_id, rollup.avg_price) \
+                .join(self.market, rollup.market_id == self.market.id) \
+                .join(self.district, self.market.district_id == self.district.id) \
+                .where(rollup.grain == 'day', rollup.avg_price.is_not(None), tuple_(*group_key).in_(chunk))
+            for state_id, commodity_id, day, market_id, price in self.session.execute(statement):
+                ladders.setdefault((state_id, commodity_id, day), []).append((price, market_id))
+            self.session.execute(delete(self.spread).where(tuple_(*spread_key).in_(chunk)))
+            rows.extend(self._row(key, sorted(ladder)) for key, ladder in ladders.items())
+
+        if rows:
+            self.session.execute(insert(self.spread), rows)
+        return len(rows)
+
+    @staticmethod
+    def _row(key, ladder):
+        prices = [price for price, _ in ladder]
+        count = len(prices)
+        mean = sum(prices) / count
+        std = math.sqrt(max(sum(price * price for price in prices) / count - mean * mean, 0.0))
+        (buy_price, buy_market), (sell_price, sell_market) = ladder[0], ladder[-1]
+        return {
+            'state_id': key[0],
+            'commodity_id': key[1],
+            'date': key[2],
+            'market_count': count,
+            'buy_market_id': buy_market,
+            'buy_price': buy_price,
+            'sell_market_id': sell_market,
+            'sell_price': sell_price,
+            'spread': sell_price - buy_price,
+            'relative_spread': (sell_price - buy_price) / mean if mean else 0.0,
+            'mean_price': mean,
+            'std_price': std
+        }
+
+    def prune_before(self, cutoff):
+        """Delete the spreads of days before ``cutoff``, whose daily rollups are purged with the raw rows"""
+        return self.session.execute(delete(self.spread).where(self.spread.date < cutoff)).rowcount
+
+    def rebuild(self, start=None, end=None, commit=None):
+        """Recompute all spreads for daily rollups in the window, one month at a time"""
+        rollup = self.rollup
+        bounds = select(func.min(rollup.period_start), func.max(rollup.period_start)).where(rollup.grain == 'day')
+        if start is not None:
+            bounds = bounds.where(rollup.period_start >= start)
+        if end is not None:
+            bounds = bounds.where(rollup.period_start <= end)
+        low, high = self.session.execute(bounds).one()
+        if low is None:
+            return 0
+
+        started = time.perf_counter()
+        groups = 0
+        month = period_start('month', low)
+        while month <= high:
+            month_end = period_end('month', month)
+            keys = self.session.execute(
+                select(rollup.market_id, rollup.commodity_id, rollup.period_start).where(
+                    rollup.grain == 'day',
+                    rollup.period_start >= max(month, low),
+                    rollup.period_start <= min(month_end, high)
+                )
+            ).all()
+            groups += self.refresh(keys)
+            if commit is not None:
+                commit()
+            month = month_end + timedelta(days=1)
+
+        logger.info(f"Spread rebuild wrote {groups} groups in {time.perf_counter() - started:.2f}s")
+        return groups
@@ -0,0 +1,39 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Brotli responses are optional
+    brotli = None
+
+# Bodies smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 512
+
+
+def available_encodings():
+    """Content codings this process can produce, preferred first"""
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress_response(response, accept_encodings, min_size=MIN_COMPRESS_SIZE):
+    """Compress a buffered response body with the best coding the client accepts.
+
+    ``accept_encodings`` is the request's parsed Accept-Encoding header.
+    Streamed, already encoded and small responses are left alone.
+    """
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+        return response
+    if response.status_code != 200:
+        return response
+    encoding = accept_encodings.best_match(available_encodings())
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+    if encoding == 'br':
+        response.set_data(brotli.compress(body, quality=5))
+    else:
+        response.set_data(gzip.compress(body, compresslevel=6))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet exports are optional
+    pyarrow = None
+
+# Format name -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+def available_formats():
+    """Export formats this install can produce; Parquet needs pyarrow"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pyarrow is not None]
+
+
+def iter_query_rows(engine, statement, batch_size=1000):
+    """Yield result rows from a server-side cursor held open for the whole iteration"""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for partition in result.partitions():
+            yield from partition
+
+
+def column_types(statement):
+    """Python type of every selected column, str where the type does not say"""
+    types = []
+    for column in statement.selected_columns:
+        try:
+            types.append(column.type.python_type)
+        except NotImplementedError:
+            types.append(str)
+    return types
+
+
+def _text(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def iter_csv(columns, rows, flush_rows=500):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([_text(value) for value in row])
+        pending += 1
+        if pending >= flush_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(columns, rows, flush_rows=500):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({column: _text(value) for column, value in zip(columns, row)}))
+        if len(lines) >= flush_rows:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _ChunkSink:
+    """Write-only file object that hands out what was written since the last pop"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(python_type):
+    if python_type is int:
+        return pyarrow.int64()
+    if python_type is float:
+        return pyarrow.float64()
+    if python_type is date:
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+def iter_parquet(columns, rows, python_types, row_group_size=50000):
+    """Parquet file bytes, emitted one row group at a time.
+
+    ``python_types`` gives the Python type of every column so the schema is
+    fixed before the first row is seen.
+    """
+    if pyarrow is None:
+        raise ValueError("Parquet exports need pyarrow to be installed")
+    schema = pyarrow.schema([(column, _arrow_type(kind)) for column, kind in zip(columns, python_types)])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), schema, compression='zstd')
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                writer.write_table(pyarrow.Table.from_arrays(
+                    [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)],
+                    schema=schema
+                ))
+                batch = []
+                yield sink.pop()
+        if batch:
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)],
+                schema=schema
+            ))
+    finally:
+        writer.close()
+    yield sink.pop()
+
+
+def gzip_stream(chunks, level=6):
+    """Compress a stream of byte chunks into one gzip member as it goes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(fmt, columns, rows, python_types=None, compress=False, flush_rows=500):
+    """Byte chunks of ``rows`` in the requested format.
+
+    Nothing is buffered beyond one flush of ``flush_rows`` rows (one row
+    group for Parquet), so memory stays flat however many rows the query
+    returns. ``compress`` gzips the text formats; Parquet is always
+    compressed internally and ignores it.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if fmt == 'parquet':
+        if pyarrow is None:
+            raise ValueError("Parquet exports need pyarrow to be installed")
+        return iter_parquet(columns, rows, python_types or [str] * len(columns))
+    chunks = iter_csv(columns, rows, flush_rows) if fmt == 'csv' else iter_ndjson(columns, rows, flush_rows)
+    return gzip_stream(chunks) if compress else chunks
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from ingest import IngestStats
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` calls per second with bursts of up to ``burst``"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed; a rate of zero or less never blocks"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_for = (1 - self._tokens) / self.rate
+            self.sleep(wait_for)
+
+
+class HostRateLimits:
+    """One shared RateLimiter per upstream host"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = RateLimiter(self.rate, self.burst)
+        limiter.acquire()
+
+
+class FanOutReport:
+    """Outcome of one fan-out run"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.completed = 0
+        self.skipped = 0
+        self.failed = []
+        self.stats = IngestStats()
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            'run_id': self.run_id,
+            'completed': self.completed,
+            'skipped': self.skipped,
+            'failed': len(self.failed),
+            'elapsed': round(self.elapsed, 2),
+            'stats': self.stats.as_dict()
+        }
+
+
+def fan_out(run_id, tasks, worker, workers=4, done=(), on_result=None):
+    """Run ``worker(task)`` for every task not in ``done`` with at most ``workers`` in flight.
+
+    Tasks are submitted as slots free up, so a run over thousands of
+    regions never queues more than ``workers`` futures. ``on_result(task,
+    result, error)`` is called in the calling thread as each task finishes,
+    which is where progress should be checkpointed; an interrupted run
+    then resumes by passing the checkpointed tasks back in as ``done``.
+    Workers return IngestStats.
+    """
+    report = FanOutReport(run_id)
+    started = time.perf_counter()
+    done = set(done)
+    remaining = deque()
+    for task in tasks:
+        if task in done:
+            report.skipped += 1
+        else:
+            remaining.append(task)
+
+    executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='fanout')
+    pending = {}
+    try:
+        while remaining or pending:
+            while remaining and len(pending) < max(workers, 1):
+                task = remaining.popleft()
+                pending[executor.submit(worker, task)] = task
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = pending.pop(future)
+                error = future.exception()
+                result = None if error else future.result()
+                if error:
+                    report.failed.append((task, str(error)))
+                    logger.error(f"Fan-out task {task} failed: {str(error)}")
+                else:
+                    report.completed += 1
+                    report.stats.merge(result)
+                if on_result is not None:
+                    on_result(task, result, error)
+    finally:
+        # On interrupt, drop queued work; tasks in flight finish but are not checkpointed
+        executor.shutdown(wait=True, cancel_futures=True)
+        report.elapsed = time.perf_counter() - started
+    return report
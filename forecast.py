@@ -0,0 +1,320 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, select, tuple_
+
+logger = logging.getLogger(__name__)
+
+# Candidate models, simplest first; on equal error the simpler one wins
+MODELS = ('naive', 'seasonal_naive', 'ses', 'holt')
+# Smoothing parameters tried for simple exponential smoothing
+SES_ALPHAS = np.linspace(0.05, 1.0, 20)
+# (alpha, beta, phi) tried for damped-trend Holt; beta is a fraction of alpha so it never exceeds it
+HOLT_GRID = np.array([
+    (alpha, alpha * share, phi)
+    for alpha in (0.1, 0.3, 0.5, 0.7, 0.9)
+    for share in (0.05, 0.2, 0.5)
+    for phi in (0.8, 0.9, 0.98)
+])
+
+
+def calendar_series(points):
+    """Daily prices from the first to the last reported day of (date ordinal, price) points.
+
+    Reports of several varieties or grades on one day are averaged. Days
+    without a report carry the previous price over, so a seasonal lag of
+    seven always means the same weekday.
+    """
+    ordinals = np.array([point[0] for point in points], dtype=np.int64)
+    first = int(ordinals.min())
+    offsets = ordinals - first
+    length = int(offsets.max()) + 1
+    totals = np.bincount(offsets, weights=[point[1] for point in points], minlength=length)
+    counts = np.bincount(offsets, minlength=length)
+    values = np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+    filled = np.where(~np.isnan(values), np.arange(len(values)), 0)
+    return first, values[np.maximum.accumulate(filled)]
+
+
+def _naive(values, start, horizon):
+    errors = values[start:] - values[start - 1:-1]
+    steps = np.arange(1, horizon + 1)
+    return errors, np.full(horizon, values[-1]), np.sqrt(steps)
+
+
+def _seasonal_naive(values, start, horizon, season):
+    errors = values[start:] - values[start - season:len(values) - season]
+    steps = np.arange(horizon)
+    return errors, values[len(values) - season + steps % season], np.sqrt(steps // season + 1)
+
+
+def _ses(values, start, horizon):
+    """Simple exponential smoothing, every alpha of the grid run side by side"""
+    level = np.full(len(SES_ALPHAS), values[0])
+    errors = np.empty((len(values) - start, len(SES_ALPHAS)))
+    for t in range(1, len(values)):
+        error = values[t] - level
+        if t >= start:
+            errors[t - start] = error
+        level = level + SES_ALPHAS * error
+    best = int(np.argmin((errors ** 2).sum(axis=0)))
+    alpha = SES_ALPHAS[best]
+    scale = np.sqrt(1 + np.arange(horizon) * alpha * alpha)
+    return errors[:, best], np.full(horizon, level[best]), scale
+
+
+def _holt(values, start, horizon):
+    """Damped additive trend in error-correction form, every grid point run side by side"""
+    alphas, betas, phis = HOLT_GRID.T
+    level = np.full(len(HOLT_GRID), values[1])
+    trend = np.full(len(HOLT_GRID), values[1] - values[0])
+    errors = np.empty((len(values) - start, len(HOLT_GRID)))
+    for t in range(2, len(values)):
+        damped = phis * trend
+        error = values[t] - (level + damped)
+        if t >= start:
+            errors[t - start] = error
+        level = level + damped + alphas * error
+        trend = damped + betas * error
+    best = int(np.argmin((errors ** 2).sum(axis=0)))
+    alpha, beta, phi = HOLT_GRID[best]
+    damping = np.cumsum(phi ** np.arange(1, horizon + 1))
+    # h-step variance grows by (alpha + beta * (phi + ... + phi^j))^2 for each step j before h
+    growth = (alpha + beta * damping[:-1]) ** 2
+    scale = np.sqrt(1 + np.concatenate([[0.0], np.cumsum(growth)]))
+    return errors[:, best], level[best] + damping * trend[best], scale
+
+
+def fit_series(task):
+    """Pick the model with the lowest one-step error over a series and forecast from it.
+
+    ``task`` is (key, [(date ordinal, price), ...], horizon, season,
+    confidence, min_observations). Returns (key, result) where result is
+    None for series with too little history, else a dict with the model,
+    its RMSE and (ordinal, forecast, lower, upper) points for the
+    ``horizon`` days after the last report.
+    Module-level so a process pool can run it.
+    """
+    key, history, horizon, season, confidence, min_observations = task
+    if len({point[0] for point in history}) < max(min_observations, 3):
+        return key, None
+    first, values = calendar_series(history)
+    if len(values) < 3:
+        return key, None
+
+    seasonal = season > 1 and len(values) >= 2 * season
+    # Every candidate is scored on the same days, after the longest warm-up
+    start = season if seasonal else 2
+    candidates = {
+        'naive': _naive(values, start, horizon),
+        'ses': _ses(values, start, horizon),
+        'holt': _holt(values, start, horizon)
+    }
+    if seasonal:
+        candidates['seasonal_naive'] = _seasonal_naive(values, start, horizon, season)
+    rmse = {name: float(np.sqrt(np.mean(candidates[name][0] ** 2))) for name in candidates}
+    model = min((name for name in MODELS if name in candidates), key=lambda name: (rmse[name], MODELS.index(name)))
+
+    _, forecast, scale = candidates[model]
+    width = NormalDist().inv_cdf(0.5 + confidence / 2) * rmse[model] * scale
+    last = first + len(values) - 1
+    points = [
+        (last + step, round(float(value), 4), round(max(float(value - spread), 0.0), 4), round(float(value + spread), 4))
+        for step, (value, spread) in enumerate(zip(forecast, width), start=1)
+    ]
+    return key, {'model': model, 'rmse': round(rmse[model], 4), 'points': points}
+
+
+def fitting_pool(workers):
+    """Process pool for ``fit_all``"""
+    # Spawned workers import only this module, not the app, its threads or its open connections
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def fit_all(tasks, workers=1, executor=None):
+    """Fit every task, in ``executor`` or a new process pool when ``workers`` is above one.
+
+    Yields results in task order.
+    """
+    if workers <= 1 or len(tasks) < 2:
+        yield from map(fit_series, tasks)
+        return
+    chunksize = max(len(tasks) // (workers * 4), 1)
+    if executor is not None:
+        yield from executor.map(fit_series, tasks, chunksize=chunksize)
+        return
+    with fitting_pool(workers) as executor:
+        yield from executor.map(fit_series, tasks, chunksize=chunksize)
+
+
+class ForecastRun:
+    """Counters for one refit run"""
+
+    def __init__(self):
+        self.series = 0
+        self.stale = 0
+        self.fitted = 0
+        self.skipped = 0
+        self.removed = 0
+        self.models = {}
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            'series': self.series,
+            'stale': self.stale,
+            'fitted': self.fitted,
+            'skipped': self.skipped,
+            'removed': self.removed,
+            'models': dict(sorted(self.models.items())),
+            'elapsed': round(self.elapsed, 3)
+        }
+
+
+class ForecastMaintainer:
+    """Keeps per-(market, commodity) price forecasts in step with the raw table.
+
+    Each series' fingerprint (raw row count, last day and price total) is
+    stored with its fit, so a refit only loads and fits the series whose
+    raw rows changed since, and drops the forecasts of series that are
+    gone. Fits use the last ``history_days`` before each series' latest
+    report and run in ``workers`` processes, one pool shared by every
+    chunk of a refit. Writes go through the caller's session, one chunk
+    of series at a time.
+    """
+
+    def __init__(self, session, model, series_model, forecast_model, horizon=7, history_days=120, season=7,
+                 confidence=0.8, min_observations=7, workers=1, chunk_size=400):
+        self.session = session
+        self.model = model
+        self.series_model = series_model
+        self.forecast_model = forecast_model
+        self.horizon = horizon
+        self.history_days = history_days
+        self.season = season
+        self.confidence = confidence
+        self.min_observations = min_observations
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def fingerprints(self):
+        """{(market_id, commodity_id): (raw rows, last day, price total)} of the raw table.
+
+        Rows, not reported days, are counted: a new variety or grade on a day
+        already reported changes the series too.
+        """
+        model = self.model
+        statement = select(
+            model.market_id, model.commodity_id, func.count(model.id), func.max(model.date), func.sum(model.modal_price)
+        ).where(model.modal_price.isnot(None), model.date.isnot(None)).group_by(model.market_id, model.commodity_id)
+        return {
+            (market_id, commodity_id): (count, last_date, total or 0.0)
+            for market_id, commodity_id, count, last_date, total in self.session.execute(statement)
+        }
+
+    def _stored(self):
+        series = self.series_model
+        statement = select(series.market_id, series.commodity_id, series.observations, series.last_date, series.price_total)
+        return {(row[0], row[1]): tuple(row[2:]) for row in self.session.execute(statement)}
+
+    @staticmethod
+    def _changed(current, stored):
+        if stored is None:
+            return True
+        count, last_date, total = current
+        return count != stored[0] or last_date != stored[1] or abs(total - (stored[2] or 0.0)) > 1e-6 * max(abs(total), 1.0)
+
+    def _history(self, chunk, fingerprints):
+        """{series: [(date ordinal, price per kg), ...]} within each series' history window"""
+        model = self.model
+        since = {key: fingerprints[key][1] - timedelta(days=self.history_days - 1) for key in chunk}
+        statement = select(model.market_id, model.commodity_id, model.date, model.price).where(and_(
+            tuple_(model.market_id, model.commodity_id).in_(chunk),
+            model.date >= min(since.values()),
+            model.modal_price.isnot(None)
+        )).order_by(model.market_id, model.commodity_id, model.date)
+        history = {key: [] for key in chunk}
+        for market_id, commodity_id, day, price in self.session.execute(statement):
+            key = (market_id, commodity_id)
+            if day >= since[key]:
+                history[key].append((day.toordinal(), price))
+        return history
+
+    def _remove(self, keys):
+        for chunk_start in range(0, len(keys), self.chunk_size):
+            chunk = keys[chunk_start:chunk_start + self.chunk_size]
+            for target in (self.forecast_model, self.series_model):
+                self.session.execute(delete(target).where(tuple_(target.market_id, target.commodity_id).in_(chunk)))
+
+    def refit(self, full=False, commit=None):
+        """Refit the series with new or changed data (every series with ``full``) and store the forecasts"""
+        started = time.perf_counter()
+        run = ForecastRun()
+        fingerprints = self.fingerprints()
+        stored = self._stored()
+        run.series = len(fingerprints)
+        stale = sorted(key for key, current in fingerprints.items() if full or self._changed(current, stored.get(key)))
+        gone = sorted(key for key in stored if key not in fingerprints)
+        run.stale = len(stale)
+        if gone:
+            self._remove(gone)
+            run.removed = len(gone)
+            if commit is not None:
+                commit()
+
+        # Started once per refit: each spawned worker pays for its own interpreter and numpy import
+        with ExitStack() as stack:
+            executor = None
+            if self.workers > 1 and len(stale) > 1:
+                executor = stack.enter_context(fitting_pool(self.workers))
+            for chunk_start in range(0, len(stale), self.chunk_size):
+                chunk = stale[chunk_start:chunk_start + self.chunk_size]
+                history = self._history(chunk, fingerprints)
+                tasks = [
+                    (key, history[key], self.horizon, self.season, self.confidence, self.min_observations)
+                    for key in chunk
+                ]
+                fitted_at = datetime.utcnow()
+                series_rows, forecast_rows = [], []
+                for (market_id, commodity_id), result in fit_all(tasks, self.workers, executor):
+                    count, last_date, total = fingerprints[(market_id, commodity_id)]
+                    series_rows.append({
+                        'market_id': market_id,
+                        'commodity_id': commodity_id,
+                        'observations': count,
+                        'last_date': last_date,
+                        'price_total': total,
+                        'model': result['model'] if result else None,
+                        'rmse': result['rmse'] if result else None,
+                        'fitted_at': fitted_at
+                    })
+                    if result is None:
+                        run.skipped += 1
+                        continue
+                    run.fitted += 1
+                    run.models[result['model']] = run.models.get(result['model'], 0) + 1
+                    forecast_rows.extend({
+                        'market_id': market_id,
+                        'commodity_id': commodity_id,
+                        'target_date': date.fromordinal(ordinal),
+                        'forecast': value,
+                        'lower': lower,
+                        'upper': upper
+                    } for ordinal, value, lower, upper in result['points'])
+
+                self._remove(chunk)
+                self.session.execute(insert(self.series_model), series_rows)
+                if forecast_rows:
+                    self.session.execute(insert(self.forecast_model), forecast_rows)
+                if commit is not None:
+                    commit()
+                logger.info(f"Refitted {len(chunk)} forecast series ({chunk_start + len(chunk)}/{len(stale)})")
+
+        run.elapsed = time.perf_counter() - started
+        return run
@@ -0,0 +1,34 @@
+import multiprocessing
+import os
+
+# SERVING_MODE=async runs gevent workers: sockets, requests and the upstream
+# client's threads become cooperative, so one process keeps serving while
+# hundreds of requests wait on the upstream. SERVING_MODE=sync keeps the
+# classic one-request-per-worker model.
+serving_mode = os.environ.get('SERVING_MODE', 'sync')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+
+if serving_mode == 'async':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('ASYNC_WORKER_CONNECTIONS', 1000))
+elif serving_mode == 'sync':
+    worker_class = 'sync'
+else:
+    raise ValueError(f"Unknown SERVING_MODE: {serving_mode}")
+
+# Every worker keeps its own metrics; they snapshot them here and /metrics sums
+# the snapshots, so a scrape sees the same totals whichever worker answers.
+# Cleared at startup, since the snapshots of exited workers are kept.
+metrics_dir = os.environ.setdefault(
+    'METRICS_MULTIPROC_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+)
+
+
+def on_starting(server):
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.startswith('metrics-'):
+            os.remove(os.path.join(metrics_dir, name))
@@ -0,0 +1,159 @@
+import logging
+import time
+
+from sqlalchemy import and_, inspect, select, text, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+logger = logging.getLogger(__name__)
+
+# Natural key of a market price observation; the market id implies state and district. Markets
+# report several varieties and grades of a commodity per day, each its own observation
+RECORD_KEY = ('commodity_id', 'market_id', 'date', 'variety', 'grade')
+RECORD_KEY_INDEX = 'uq_market_data_observation'
+# Earlier record key indexes, dropped before the current one is created
+LEGACY_RECORD_KEY_INDEXES = ('uq_market_data_record',)
+# Key columns stored as '' rather than NULL, since NULLs never conflict in a unique index
+TEXT_KEY_COLUMNS = ('variety', 'grade')
+
+
+class IngestStats:
+    """Counters for one or more upsert batches"""
+
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.batches = 0
+        self.elapsed = 0.0
+
+    @property
+    def written(self):
+        return self.inserted + self.updated
+
+    @property
+    def rows_per_second(self):
+        return self.received / self.elapsed if self.elapsed else 0.0
+
+    def merge(self, other):
+        self.received += other.received
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.batches += other.batches
+        self.elapsed += other.elapsed
+        return self
+
+    def as_dict(self):
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'batches': self.batches,
+            'elapsed': round(self.elapsed, 4),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+    def __repr__(self):
+        return f"IngestStats({self.as_dict()})"
+
+
+def dialect_insert(dialect_name):
+    """The INSERT construct with ON CONFLICT support for the given dialect"""
+    if dialect_name == 'postgresql':
+        return postgresql.insert
+    if dialect_name == 'sqlite':
+        return sqlite.insert
+    raise ValueError(f"Bulk upsert is not supported on {dialect_name}")
+
+
+def ensure_record_key(engine, table):
+    """Create the unique index on the record key, collapsing existing duplicates first.
+
+    Older indexes on a narrower key are dropped, and NULL varieties and
+    grades become '' so they take part in the key.
+    """
+    index = next(ix for ix in table.indexes if ix.name == RECORD_KEY_INDEX)
+    with engine.begin() as conn:
+        existing = {ix['name'] for ix in inspect(conn).get_indexes(table.name)}
+        if RECORD_KEY_INDEX in existing:
+            return
+        for name in LEGACY_RECORD_KEY_INDEXES:
+            if name in existing:
+                conn.execute(text(f"DROP INDEX {name}"))
+        for column in TEXT_KEY_COLUMNS:
+            conn.execute(text(f"UPDATE {table.name} SET {column} = '' WHERE {column} IS NULL"))
+        key_columns = ', '.join(RECORD_KEY)
+        result = conn.execute(text(
+            f"DELETE FROM {table.name} WHERE id NOT IN "
+            f"(SELECT MAX(id) FROM {table.name} GROUP BY {key_columns})"
+        ))
+        if result.rowcount:
+            logger.info(f"Removed {result.rowcount} duplicate rows from {table.name}")
+        index.create(conn)
+
+
+def upsert_market_records(session, table, rows, on_changed=None):
+    """Write one page of rows with a single INSERT ... ON CONFLICT DO UPDATE.
+
+    ``rows`` are dicts holding the record key columns plus the value columns
+    to store. Rows whose stored values already match are skipped. The caller
+    owns the transaction and commits once per page; ``on_changed`` is
+    called with the inserted and updated rows inside that transaction.
+    """
+    stats = IngestStats()
+    started = time.perf_counter()
+
+    # Later duplicates of a key within the page win, as the row-by-row path did
+    pending = {}
+    for row in rows:
+        pending[tuple(row[column] for column in RECORD_KEY)] = row
+    stats.received = len(pending)
+    stats.batches = 1
+    if not pending:
+        return stats
+
+    value_names = [column for column in next(iter(pending.values())) if column not in RECORD_KEY]
+    key_columns = [table.c[column] for column in RECORD_KEY]
+    value_columns = [table.c[column] for column in value_names]
+    existing = {}
+    date_position = RECORD_KEY.index('date')
+    dates = {key[date_position] for key in pending}
+    for chunk in _chunks(list(pending), 400):
+        query = select(*key_columns, *value_columns).where(
+            and_(table.c.date.in_(dates), tuple_(*key_columns).in_(chunk))
+        )
+        for record in session.execute(query):
+            existing[tuple(record[:len(RECORD_KEY)])] = tuple(record[len(RECORD_KEY):])
+
+    changed = []
+    for key, row in pending.items():
+        if key not in existing:
+            stats.inserted += 1
+        elif existing[key] != tuple(row[column] for column in value_names):
+            stats.updated += 1
+        else:
+            stats.unchanged += 1
+            continue
+        changed.append(row)
+
+    if changed:
+        insert = dialect_insert(session.get_bind().dialect.name)
+        statement = insert(table)
+        update_columns = {column: statement.excluded[column] for column in value_names}
+        statement = statement.on_conflict_do_update(
+            index_elements=list(RECORD_KEY),
+            set_=update_columns
+        )
+        session.execute(statement, changed)
+        if on_changed is not None:
+            on_changed(changed)
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
@@ -0,0 +1,139 @@
+"""Load test comparing the sync and async (gevent) serving modes.
+
+A local stub stands in for data.gov.in and answers every request after
+``--delay`` seconds. The app runs under gunicorn once per mode against a
+scratch database with live fallback on and caching off, so every request
+to the upstream-bound routes waits on the stub. Results are printed as
+one JSON document.
+
+    python loadtest.py --requests 200 --concurrency 100 --delay 0.5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from synthetic import StubUpstream, SyntheticMarket
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Routes that fall back to the upstream while the local store is empty
+ROUTES = ('/dashboard',)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * fraction), len(values) - 1)], 4)
+
+
+def wait_until_up(url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not come up at {url}")
+
+
+def run_mode(mode, args, upstream_url, scratch):
+    env = dict(
+        os.environ,
+        SERVING_MODE=mode,
+        PORT=str(args.port),
+        WEB_CONCURRENCY=str(args.workers),
+        WEB_TIMEOUT='120',
+        DATABASE_URL=f"sqlite:///{os.path.join(scratch, f'{mode}.db')}",
+        MARKET_CACHE_SHARED_PATH=os.path.join(scratch, f'{mode}_cache.db'),
+        MARKET_API_URL=upstream_url,
+        MARKET_LIVE_FALLBACK='1',
+        MARKET_CACHE_TTL='0',
+        MARKET_CACHE_NEGATIVE_TTL='0',
+        MARKET_LOOKBACK_DAYS='1',
+        MARKET_RATE_LIMIT='0',
+        MARKET_RETRIES='0'
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '--log-level', 'warning'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_up(f"{base}/api/health")
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def hit(index):
+            # A distinct area per request so nothing is shared through the cache
+            url = f"{base}{ROUTES[index % len(ROUTES)]}?state=Load{index}&district=Test"
+            started = time.perf_counter()
+            try:
+                ok = requests.get(url, timeout=args.timeout).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors[0] += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(hit, range(args.requests)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'errors': errors[0],
+        'elapsed': round(elapsed, 3),
+        'requests_per_second': round(args.requests / elapsed, 2),
+        'p50': percentile(latencies, 0.50),
+        'p90': percentile(latencies, 0.90),
+        'p99': percentile(latencies, 0.99),
+        'max': round(max(latencies), 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='sync,async', help='Comma separated serving modes to compare')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.5, help='Seconds the stub upstream takes per call')
+    parser.add_argument('--workers', type=int, default=1, help='Gunicorn worker processes per mode')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    # No days of history: every upstream call is an empty page after the delay
+    with StubUpstream(SyntheticMarket(days=0), delay=args.delay) as upstream, \
+            tempfile.TemporaryDirectory() as scratch:
+        results = [run_mode(mode, args, upstream.url, scratch) for mode in args.modes.split(',')]
+
+    report = {'delay': args.delay, 'results': results}
+    by_mode = {result['mode']: result for result in results}
+    if 'sync' in by_mode and 'async' in by_mode:
+        report['async_speedup'] = round(
+            by_mode['async']['requests_per_second'] / by_mode['sync']['requests_per_second'], 2
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
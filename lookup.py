@@ -0,0 +1,103 @@
+import threading
+import time
+from bisect import bisect_left
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Immutable in-memory autocomplete index over named entries.
+
+    Every entry is a dict with at least ``name``. Prefix lookups bisect a
+    sorted list of lowercased names; longer queries also match anywhere in
+    the name through a trigram posting list, ranked after prefix matches.
+    """
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda entry: (entry['name'].lower(), entry.get('id') or 0))
+        self._keys = [entry['name'].lower() for entry in self.entries]
+        self._postings = {}
+        for position, key in enumerate(self._keys):
+            for gram in _trigrams(key):
+                self._postings.setdefault(gram, set()).add(position)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query='', limit=None, where=None):
+        """Entries whose name starts with ``query``, then those containing it.
+
+        ``where`` is an optional predicate applied to each candidate entry.
+        """
+        query = query.strip().lower()
+        if not query:
+            matches = [entry for entry in self.entries if where is None or where(entry)]
+            return matches[:limit] if limit else matches
+
+        results = []
+        seen = set()
+        position = bisect_left(self._keys, query)
+        while position < len(self._keys) and self._keys[position].startswith(query):
+            entry = self.entries[position]
+            if where is None or where(entry):
+                results.append(entry)
+                if limit and len(results) >= limit:
+                    return results
+            seen.add(position)
+            position += 1
+
+        if len(query) >= 3:
+            # Only the query's inner trigrams: it may sit anywhere in the name
+            grams = sorted({query[index:index + 3] for index in range(len(query) - 2)},
+                           key=lambda gram: len(self._postings.get(gram, ())))
+            candidates = set(self._postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                candidates &= self._postings.get(gram, set())
+                if not candidates:
+                    break
+            for position in sorted(candidates - seen):
+                entry = self.entries[position]
+                if query in self._keys[position] and (where is None or where(entry)):
+                    results.append(entry)
+                    if limit and len(results) >= limit:
+                        break
+        return results
+
+
+class MaterializedLookup:
+    """A NameIndex rebuilt from the database whenever its source table changes.
+
+    ``version()`` is a cheap query such as the table's MAX(id); it runs at
+    most once per ``check_interval`` seconds, and ``load()`` only when the
+    version moved, so most lookups never touch the database.
+    """
+
+    def __init__(self, load, version, check_interval=1.0, clock=time.monotonic):
+        self.load = load
+        self.version = version
+        self.check_interval = check_interval
+        self.clock = clock
+        self._index = None
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = self.clock()
+        if self._index is not None and now - self._checked_at < self.check_interval:
+            return self._index
+        with self._lock:
+            if self._index is None or now - self._checked_at >= self.check_interval:
+                version = self.version()
+                if self._index is None or version != self._version:
+                    self._index = NameIndex(self.load())
+                    self._version = version
+                self._checked_at = now
+            return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
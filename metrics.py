@@ -0,0 +1,397 @@
+import glob
+import json
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as FoldedStacks
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cached page up to a slow upstream call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements per request or per ingested page; an N+1 shows up in the top buckets
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return repr(value)
+    return str(int(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class _Metric:
+    """Samples of one metric family, one value per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _labels(self, key, **extra):
+        return {**dict(zip(self.labels, key)), **extra}
+
+    def snapshot(self):
+        """{label values: value}, copied under the lock"""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def combine(value, other):
+        return value + other
+
+    def samples(self, values=None):
+        """Samples of ``values`` as returned by ``snapshot``, this process's own by default"""
+        values = self.snapshot() if values is None else values
+        for key, value in sorted(values.items()):
+            yield from self._samples(key, value)
+
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        yield self.name, self._labels(key), value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative ``le`` buckets, with their sum and count"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._values.items()}
+
+    @staticmethod
+    def combine(value, other):
+        return [[a + b for a, b in zip(value[0], other[0])], value[1] + other[1], value[2] + other[2]]
+
+    def _samples(self, key, value):
+        counts, total, count = value
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield f"{self.name}_bucket", self._labels(key, le=_format_value(float(bound))), cumulative
+        yield f"{self.name}_bucket", self._labels(key, le='+Inf'), count
+        yield f"{self.name}_sum", self._labels(key), total
+        yield f"{self.name}_count", self._labels(key), count
+
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text exposition format.
+
+    Counters and histograms are updated as events happen. Collectors are
+    called at scrape time for values that already live elsewhere (cache
+    counters, circuit state); each returns ``(name, kind, help, samples)``
+    families, with samples as ``(labels, value)`` pairs.
+
+    With ``multiprocess_dir`` set, every process that calls ``start_writer``
+    writes a snapshot of its counters and histograms there every
+    ``flush_interval`` seconds, and a scrape sums the snapshots of all of
+    them, so the totals do not depend on which worker answers. Snapshots of
+    exited processes are kept so totals never go down; clear the directory
+    when the server starts. Collector values stay per process and carry a
+    ``pid`` label.
+    """
+
+    def __init__(self, multiprocess_dir=None, flush_interval=5.0):
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._metrics = []
+        self._collectors = []
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def _snapshot_path(self):
+        return os.path.join(self.multiprocess_dir, f"metrics-{os.getpid()}.json")
+
+    def write_snapshot(self):
+        """Replace this process's snapshot file with its current counters and histograms"""
+        path = self._snapshot_path()
+        snapshot = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()]
+                    for metric in self._metrics}
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    def start_writer(self):
+        """Write this process's snapshots in a daemon thread; idempotent, and restarts after a fork"""
+        if not self.multiprocess_dir or self._writer_pid == os.getpid():
+            return
+        with self._writer_lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            threading.Thread(target=self._write_forever, name='metrics-writer', daemon=True).start()
+
+    def _write_forever(self):
+        while True:
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                logger.warning(f"Writing the metrics snapshot failed: {str(e)}")
+            time.sleep(self.flush_interval)
+
+    def _other_processes(self):
+        """{metric name: {label values: value}} summed over the snapshots of every other process"""
+        merged = {}
+        combine = {metric.name: metric.combine for metric in self._metrics}
+        own = self._snapshot_path()
+        for path in glob.glob(os.path.join(self.multiprocess_dir, 'metrics-*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics snapshot {path}: {str(e)}")
+                continue
+            for name, values in snapshot.items():
+                if name not in combine:
+                    continue
+                totals = merged.setdefault(name, {})
+                for key, value in values:
+                    key = tuple(key)
+                    totals[key] = value if key not in totals else combine[name](totals[key], value)
+        return merged
+
+    def families(self):
+        others = self._other_processes() if self.multiprocess_dir else {}
+        for metric in self._metrics:
+            # This process's own values are read live rather than from its last snapshot
+            values = metric.snapshot()
+            for key, value in others.get(metric.name, {}).items():
+                values[key] = value if key not in values else metric.combine(values[key], value)
+            yield metric.name, metric.kind, metric.help, list(metric.samples(values))
+        extra = {'pid': os.getpid()} if self.multiprocess_dir else {}
+        for collector in self._collectors:
+            try:
+                for name, kind, help, samples in collector():
+                    yield name, kind, help, [(name, {**labels, **extra}, value) for labels, value in samples]
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+
+    def render(self):
+        lines = []
+        for name, kind, help, samples in self.families():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class QueryTally:
+    """Statements executed and seconds spent in the database within one scope"""
+
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+class QueryTracker:
+    """Counts every statement an engine executes, overall and per open scope.
+
+    Scopes nest and follow the current context (thread or greenlet), so a
+    request's tally includes the queries of an ingestion page it triggers
+    while the page keeps its own.
+    """
+
+    def __init__(self):
+        self.total = QueryTally()
+        self._lock = threading.Lock()
+        self._scopes = ContextVar('query_scopes', default=())
+
+    def install(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _started(conn, cursor, statement, parameters, context, executemany):
+            context._query_started = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _finished(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, '_query_started', None)
+            if started is not None:
+                self.record(time.perf_counter() - started)
+
+        return engine
+
+    def record(self, seconds):
+        with self._lock:
+            self.total.queries += 1
+            self.total.seconds += seconds
+        for tally in self._scopes.get():
+            tally.queries += 1
+            tally.seconds += seconds
+
+    def begin(self):
+        """Open a scope; pass the returned token to ``end``"""
+        tally = QueryTally()
+        return tally, self._scopes.set(self._scopes.get() + (tally,))
+
+    def end(self, token):
+        tally, context_token = token
+        self._scopes.reset(context_token)
+        return tally
+
+    @contextmanager
+    def scope(self):
+        token = self.begin()
+        try:
+            yield token[0]
+        finally:
+            self.end(token)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests and keeps those of the slow ones.
+
+    While at least one request is being profiled, a daemon thread reads
+    the stack of each profiled thread every ``interval`` seconds. A request
+    that took ``threshold`` seconds or more has its samples written to
+    ``output_dir`` as folded stacks ("outer;inner count" per line), the
+    input format of flamegraph.pl and speedscope. Stacks are per OS
+    thread, so under gevent only the running greenlet is seen.
+    """
+
+    def __init__(self, threshold, interval=0.005, output_dir='profiles', max_depth=64):
+        self.threshold = threshold
+        self.interval = interval
+        self.output_dir = output_dir
+        self.max_depth = max_depth
+        self.dumps = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+
+    def begin(self):
+        """Start sampling the calling thread; pass the returned token to ``end``"""
+        token = (threading.get_ident(), FoldedStacks())
+        with self._lock:
+            self._active[id(token)] = token
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+            self._wake.notify()
+        return token
+
+    def end(self, token, elapsed, label):
+        """Stop sampling; returns the path of the dumped stacks when the request was slow"""
+        with self._lock:
+            self._active.pop(id(token), None)
+        stacks = token[1]
+        if elapsed < self.threshold or not stacks:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'request'
+        path = os.path.join(
+            self.output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{slug}-{elapsed * 1000:.0f}ms.folded"
+        )
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.dumps += 1
+        logger.warning(f"Slow request {label} took {elapsed:.3f}s; stacks written to {path}")
+        return path
+
+    def _run(self):
+        current = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wake.wait()
+                # Sampled under the lock so ``end`` never reads a tally that is still changing
+                frames = sys._current_frames()
+                for ident, stacks in self._active.values():
+                    frame = frames.get(ident)
+                    if frame is None or ident == current:
+                        continue
+                    names = []
+                    while frame is not None and len(names) < self.max_depth:
+                        names.append(_frame_name(frame))
+                        frame = frame.f_back
+                    stacks[';'.join(reversed(names))] += 1
+                del frames
+            time.sleep(self.interval)
@@ -0,0 +1,111 @@
+import logging
+import time
+
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+# Legacy rows store the arrival date as dd/mm/YYYY text
+LEGACY_DATE_PATTERN = '__/__/____'
+
+
+def _iso_from_legacy(column):
+    return f"substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2)"
+
+
+def migrate_market_dates(engine, table_name='market_data', batch_size=5000, pause=0.0, max_passes=5):
+    """Rewrite dd/mm/YYYY dates as ISO dates in small id-range transactions.
+
+    Each batch commits on its own so readers and the ingestion job keep
+    running while the table is converted; rows written in the old format
+    during a pass are picked up by the next one. A legacy row whose
+    converted key already exists is a duplicate and is removed. Returns the
+    number of rows converted.
+    """
+    converted = 0
+    removed = 0
+    started = time.perf_counter()
+    for _ in range(max_passes):
+        with engine.connect() as conn:
+            low, high = conn.execute(text(
+                f"SELECT MIN(id), MAX(id) FROM {table_name} WHERE date LIKE :pattern"
+            ), {'pattern': LEGACY_DATE_PATTERN}).fetchone()
+        if low is None:
+            break
+
+        for batch_start in range(low, high + 1, batch_size):
+            params = {'start': batch_start, 'end': batch_start + batch_size, 'pattern': LEGACY_DATE_PATTERN}
+            with engine.begin() as conn:
+                removed += conn.execute(text(
+                    f"DELETE FROM {table_name} WHERE id >= :start AND id < :end AND date LIKE :pattern "
+                    f"AND EXISTS (SELECT 1 FROM {table_name} AS current "
+                    f"WHERE current.date = {_iso_from_legacy(table_name + '.date')} "
+                    f"AND current.commodity IS {table_name}.commodity "
+                    f"AND current.market IS {table_name}.market "
+                    f"AND current.state IS {table_name}.state "
+                    f"AND current.district IS {table_name}.district)"
+                ), params).rowcount
+                converted += conn.execute(text(
+                    f"UPDATE {table_name} SET date = {_iso_from_legacy('date')} "
+                    f"WHERE id >= :start AND id < :end AND date LIKE :pattern"
+                ), params).rowcount
+            if pause:
+                time.sleep(pause)
+
+    if converted or removed:
+        logger.info(
+            f"Converted {converted} dates in {table_name} in {time.perf_counter() - started:.2f}s"
+            + (f", removed {removed} duplicate rows" if removed else "")
+        )
+    return converted
+
+
+def ensure_indexes(engine, table):
+    """Create any index declared on the model that an older database is missing"""
+    for index in table.indexes:
+        index.create(engine, checkfirst=True)
+
+
+def detach_legacy_table(engine, table_name, legacy_name, marker_column):
+    """Rename an old-layout table out of the way so the new layout can be created.
+
+    The old layout is recognised by ``marker_column``. Its indexes are
+    dropped because SQLite index names are global and the new table reuses
+    them. Returns True when a table was detached.
+    """
+    inspector = inspect(engine)
+    if table_name not in inspector.get_table_names():
+        return False
+    if marker_column not in {column['name'] for column in inspector.get_columns(table_name)}:
+        return False
+    with engine.begin() as conn:
+        for index in inspector.get_indexes(table_name):
+            conn.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+        conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy_name}"))
+    logger.info(f"Moved old-layout table {table_name} to {legacy_name}")
+    return True
+
+
+def iter_table_batches(engine, table_name, batch_size=5000):
+    """Yield the rows of a table as lists of dicts in id order"""
+    last_id = None
+    while True:
+        with engine.connect() as conn:
+            if last_id is None:
+                result = conn.execute(text(
+                    f"SELECT * FROM {table_name} ORDER BY id LIMIT :limit"
+                ), {'limit': batch_size})
+            else:
+                result = conn.execute(text(
+                    f"SELECT * FROM {table_name} WHERE id > :last ORDER BY id LIMIT :limit"
+                ), {'last': last_id, 'limit': batch_size})
+            rows = [dict(row._mapping) for row in result]
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+
+
+def drop_table(engine, table_name):
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
@@ -0,0 +1,167 @@
+import csv
+import gzip
+import logging
+import os
+import time
+
+from sqlalchemy import Date, bindparam, select, text
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet archives are optional
+    pyarrow = None
+
+
+class ChunkReport:
+    """Timing for one DELETE chunk"""
+
+    def __init__(self, rows, archived, elapsed, lock_held):
+        self.rows = rows
+        self.archived = archived
+        self.elapsed = elapsed
+        self.lock_held = lock_held
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'archived': self.archived,
+            'elapsed': round(self.elapsed, 4),
+            'lock_held': round(self.lock_held, 4),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+
+class RetentionReport:
+    """Summary of one retention run"""
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.chunks = []
+        self.archive_files = []
+
+    @property
+    def rows(self):
+        return sum(chunk.rows for chunk in self.chunks)
+
+    def as_dict(self):
+        elapsed = sum(chunk.elapsed for chunk in self.chunks)
+        return {
+            'cutoff': self.cutoff.isoformat(),
+            'rows': self.rows,
+            'chunks': len(self.chunks),
+            'elapsed': round(elapsed, 4),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else 0.0,
+            'max_lock_held': round(max((chunk.lock_held for chunk in self.chunks), default=0.0), 4),
+            'archive_files': self.archive_files
+        }
+
+
+class _ArchiveWriter:
+    """Appends expired rows to per-month partitions under the archive directory"""
+
+    def __init__(self, directory, fmt):
+        if fmt == 'parquet' and pyarrow is None:
+            raise ValueError("Parquet archives need pyarrow to be installed")
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown archive format: {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.files = []
+
+    def write(self, columns, rows, run_id, chunk_number):
+        partitions = {}
+        date_index = columns.index('date')
+        for row in rows:
+            partitions.setdefault(str(row[date_index])[:7], []).append(row)
+
+        for month, month_rows in partitions.items():
+            folder = os.path.join(self.directory, f"month={month}")
+            os.makedirs(folder, exist_ok=True)
+            if self.fmt == 'csv':
+                path = os.path.join(folder, f"market_data-{run_id}.csv.gz")
+                new_file = not os.path.exists(path)
+                with gzip.open(path, 'at', newline='') as handle:
+                    writer = csv.writer(handle)
+                    if new_file:
+                        writer.writerow(columns)
+                    writer.writerows(month_rows)
+            else:
+                path = os.path.join(folder, f"market_data-{run_id}-{chunk_number:05d}.parquet")
+                table = pyarrow.table({
+                    column: [str(row[index]) if column == 'date' else row[index] for row in month_rows]
+                    for index, column in enumerate(columns)
+                })
+                pyarrow.parquet.write_table(table, path, compression='zstd')
+            if path not in self.files:
+                self.files.append(path)
+
+
+def _dated(sql):
+    return text(sql).bindparams(bindparam('cutoff', type_=Date()))
+
+
+def purge_before(engine, table_name, cutoff, chunk_size=5000, archive_dir=None,
+                 archive_format='csv', archive_source=None, pause=0.0):
+    """Delete rows dated before ``cutoff`` in bounded chunks.
+
+    Every chunk is one short transaction running a single DELETE over an id
+    range of expired rows, so the write lock is released between
+    chunks. With ``archive_dir`` set, each chunk is first copied to
+    compressed monthly partitions (CSV by default, Parquet with pyarrow).
+    ``archive_source`` is a selectable with ``id`` and ``date`` columns that
+    decides what is archived, e.g. the table joined to its lookup tables.
+    """
+    report = RetentionReport(cutoff)
+    archive = _ArchiveWriter(archive_dir, archive_format) if archive_dir else None
+    run_id = time.strftime('%Y%m%d%H%M%S')
+
+    while True:
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            ids = [row[0] for row in conn.execute(_dated(
+                f"SELECT id FROM {table_name} WHERE date < :cutoff ORDER BY id LIMIT :limit"
+            ), {'cutoff': cutoff, 'limit': chunk_size})]
+        if not ids:
+            break
+
+        archived = 0
+        if archive is not None:
+            if archive_source is not None:
+                statement = select(archive_source).where(
+                    archive_source.c.date < cutoff,
+                    archive_source.c.id.between(ids[0], ids[-1])
+                )
+                params = {}
+            else:
+                statement = _dated(f"SELECT * FROM {table_name} WHERE date < :cutoff AND id BETWEEN :low AND :high")
+                params = {'cutoff': cutoff, 'low': ids[0], 'high': ids[-1]}
+            with engine.connect() as conn:
+                result = conn.execute(statement, params)
+                columns = list(result.keys())
+                rows = result.fetchall()
+            archive.write(columns, rows, run_id, len(report.chunks))
+            archived = len(rows)
+
+        lock_started = time.perf_counter()
+        with engine.begin() as conn:
+            deleted = conn.execute(_dated(
+                f"DELETE FROM {table_name} WHERE date < :cutoff AND id BETWEEN :low AND :high"
+            ), {'cutoff': cutoff, 'low': ids[0], 'high': ids[-1]}).rowcount
+        finished = time.perf_counter()
+
+        chunk = ChunkReport(deleted, archived, finished - started, finished - lock_started)
+        report.chunks.append(chunk)
+        logger.info(f"Retention chunk on {table_name}: {chunk.as_dict()}")
+        if pause:
+            time.sleep(pause)
+
+    if archive is not None:
+        report.archive_files = archive.files
+    return report
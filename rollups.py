@@ -0,0 +1,182 @@
+import logging
+import time
+from datetime import timedelta
+
+from sqlalchemy import and_, delete, func, insert, select, tuple_
+
+logger = logging.getLogger(__name__)
+
+GRAINS = ('day', 'week', 'month')
+# Columns identifying one price series in both the raw and the rollup table
+SERIES = ('market_id', 'commodity_id')
+
+
+def period_start(grain, day):
+    """First day of the period of the given grain that contains ``day``"""
+    if grain == 'day':
+        return day
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    raise ValueError(f"Unknown rollup grain: {grain}")
+
+
+def period_end(grain, start):
+    if grain == 'day':
+        return start
+    if grain == 'week':
+        return start + timedelta(days=6)
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+class RollupMaintainer:
+    """Keeps per-(series, period) price rollups in step with the raw table.
+
+    A refresh recomputes every day, week and month group touched by the
+    given raw keys from the raw rows themselves, so inserts, updates and
+    deletes are all handled the same way. It runs inside the caller's
+    transaction.
+    """
+
+    def __init__(self, session, model, rollup_model, series=SERIES, chunk_size=400):
+        self.session = session
+        self.model = model
+        self.rollup = rollup_model
+        self.series = tuple(series)
+        self.chunk_size = chunk_size
+
+    def refresh(self, keys):
+        """Recompute the rollups touched by raw keys of the series columns followed by the date"""
+        width = len(self.series)
+        touched = set()
+        by_series = {}
+        for key in keys:
+            series, day = tuple(key[:width]), key[width]
+            if day is None:
+                continue
+            for grain in GRAINS:
+                touched.add((grain, period_start(grain, day)) + series)
+            by_series.setdefault(series, []).append(day)
+        if not touched:
+            return 0
+
+        groups = {}
+        series_columns = [getattr(self.model, name) for name in self.series]
+        series_list = list(by_series)
+        for chunk_start in range(0, len(series_list), self.chunk_size):
+            chunk = series_list[chunk_start:chunk_start + self.chunk_size]
+            days = [day for series in chunk for day in by_series[series]]
+            low = min(period_start(grain, min(days)) for grain in GRAINS)
+            high = max(period_end(grain, period_start(grain, max(days))) for grain in GRAINS)
+            statement = select(*series_columns, self.model.date, self.model.price).where(and_(
+                tuple_(*series_columns).in_(chunk),
+                self.model.date >= low,
+                self.model.date <= high
+            ))
+            for row in self.session.execute(statement):
+                series, day, price = tuple(row[:width]), row[width], row[width + 1]
+                if price is None:
+                    continue
+                for grain in GRAINS:
+                    group_key = (grain, period_start(grain, day)) + series
+                    if group_key in touched:
+                        self._accumulate(groups, group_key, day, price)
+
+        rollup_key = [self.rollup.grain, self.rollup.period_start] + [getattr(self.rollup, name) for name in self.series]
+        touched_list = list(touched)
+        for chunk_start in range(0, len(touched_list), self.chunk_size):
+            chunk = touched_list[chunk_start:chunk_start + self.chunk_size]
+            self.session.execute(delete(self.rollup).where(tuple_(*rollup_key).in_(chunk)))
+
+        if groups:
+            self.session.execute(insert(self.rollup), [
+                self._row(group_key, values, self.series) for group_key, values in groups.items()
+            ])
+        return len(groups)
+
+    @staticmethod
+    def _accumulate(groups, group_key, day, price):
+        values = groups.get(group_key)
+        if values is None:
+            groups[group_key] = [1, price, price, price, day, price]
+            return
+        values[0] += 1
+        values[1] += price
+        values[2] = min(values[2], price)
+        values[3] = max(values[3], price)
+        if day >= values[4]:
+            values[4] = day
+            values[5] = price
+
+    @staticmethod
+    def _row(group_key, values, series):
+        count, total, low, high, last_date, last_price = values
+        row = {'grain': group_key[0], 'period_start': group_key[1]}
+        row.update(zip(series, group_key[2:]))
+        row.update({
+            'record_count': count,
+            'price_sum': total,
+            'min_price': low,
+            'max_price': high,
+            'avg_price': total / count,
+            'last_date': last_date,
+            'last_price': last_price
+        })
+        return row
+
+    def prune_before(self, cutoff):
+        """Drop the rollups of periods the raw table no longer holds after a purge of rows before ``cutoff``.
+
+        Periods that end before the cutoff are deleted. The week and month
+        around the cutoff are recomputed from the rows left, so they match
+        what any later refresh of them would write. Returns the number of
+        rollups deleted.
+        """
+        rollup = self.rollup
+        removed = 0
+        straddling = set()
+        for grain in GRAINS:
+            start = period_start(grain, cutoff)
+            removed += self.session.execute(
+                delete(self.rollup).where(rollup.grain == grain, rollup.period_start < start)
+            ).rowcount
+            if start < cutoff:
+                straddling.update(self.session.execute(
+                    select(*[getattr(rollup, name) for name in self.series])
+                    .where(rollup.grain == grain, rollup.period_start == start)
+                ).all())
+        self.refresh([tuple(series) + (cutoff,) for series in straddling])
+        return removed
+
+    def rebuild(self, start=None, end=None, commit=None):
+        """Recompute all rollups for raw rows in the window, one month at a time"""
+        model = self.model
+        bounds = select(func.min(model.date), func.max(model.date))
+        if start is not None:
+            bounds = bounds.where(model.date >= start)
+        if end is not None:
+            bounds = bounds.where(model.date <= end)
+        low, high = self.session.execute(bounds).one()
+        if low is None:
+            return 0
+
+        started = time.perf_counter()
+        groups = 0
+        month = period_start('month', low)
+        while month <= high:
+            month_end = period_end('month', month)
+            keys = self.session.execute(
+                select(*[getattr(model, name) for name in self.series], model.date).where(
+                    model.date >= max(month, low), model.date <= min(month_end, high)
+                ).distinct()
+            ).all()
+            groups += self.refresh(keys)
+            if commit is not None:
+                commit()
+            logger.info(f"Rebuilt rollups for {month:%Y-%m}: {len(keys)} series-days")
+            month = month_end + timedelta(days=1)
+
+        logger.info(f"Rollup rebuild wrote {groups} groups in {time.perf_counter() - started:.2f}s")
+        return groups
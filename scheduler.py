@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(attempt, base=1.0, cap=300.0, jitter=0.5):
+    """Exponential backoff for the given attempt number with proportional jitter"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay * (1 - jitter + random.random() * jitter)
+
+
+def retry_with_backoff(func, attempts=4, base=1.0, cap=300.0, retry_on=(Exception,), sleep=time.sleep):
+    """Call ``func`` until it succeeds, sleeping with jittered backoff between attempts"""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt, base, cap)
+            logger.warning(f"Attempt {attempt + 1} failed ({str(e)}), retrying in {delay:.1f}s")
+            sleep(delay)
+
+
+def next_daily_run(timestamp, hour):
+    """Epoch seconds of the first local ``hour``:00 after ``timestamp``"""
+    moment = datetime.fromtimestamp(timestamp)
+    target = moment.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if target <= moment:
+        target += timedelta(days=1)
+    return target.timestamp()
+
+
+class Job:
+    """A named task that runs every ``interval`` seconds, or daily at ``hour`` when one is given"""
+
+    def __init__(self, name, interval, func, run_at_start=True, hour=None):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.hour = hour
+        self.next_run = 0.0 if run_at_start else None
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_duration = None
+        self.last_error = None
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error
+        }
+
+
+class IngestionScheduler:
+    """Single-threaded interval scheduler for ingestion and maintenance jobs.
+
+    A failing job is retried after an exponential backoff (capped at its
+    normal interval) instead of waiting for its next regular slot. Every
+    run is reported to ``on_run(job, started_at, duration, error)``.
+    """
+
+    def __init__(self, jitter=0.1, min_retry=30.0, on_run=None, clock=time.time):
+        self.jobs = []
+        self.jitter = jitter
+        self.min_retry = min_retry
+        self.on_run = on_run
+        self.clock = clock
+        self._stop = threading.Event()
+
+    def add_job(self, name, interval, func, run_at_start=True, hour=None):
+        job = Job(name, interval, func, run_at_start, hour)
+        if job.next_run is None:
+            job.next_run = self._next_run(job, self.clock())
+        self.jobs.append(job)
+        return job
+
+    def _jittered(self, seconds):
+        return seconds * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _next_run(self, job, after):
+        if job.hour is not None:
+            return next_daily_run(after, job.hour)
+        return after + self._jittered(job.interval)
+
+    def run_job(self, job):
+        started_at = self.clock()
+        started = time.perf_counter()
+        error = None
+        try:
+            job.func()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Job {job.name} failed: {error}")
+        job.last_duration = round(time.perf_counter() - started, 3)
+        job.runs += 1
+        job.last_error = error
+
+        if error is None:
+            job.consecutive_failures = 0
+            job.next_run = self._next_run(job, started_at)
+            logger.info(f"Job {job.name} finished in {job.last_duration}s")
+        else:
+            job.failures += 1
+            job.consecutive_failures += 1
+            retry = backoff_delay(job.consecutive_failures - 1, self.min_retry, job.interval, self.jitter)
+            job.next_run = started_at + retry
+            logger.info(f"Job {job.name} will retry in {retry:.0f}s")
+
+        if self.on_run is not None:
+            try:
+                self.on_run(job, started_at, job.last_duration, error)
+            except Exception as e:
+                logger.error(f"Could not record run of {job.name}: {str(e)}")
+
+    def run_pending(self):
+        """Run every job that is due and return how many ran"""
+        now = self.clock()
+        due = [job for job in self.jobs if job.next_run <= now]
+        for job in due:
+            if self._stop.is_set():
+                break
+            self.run_job(job)
+        return len(due)
+
+    def run_all(self):
+        for job in self.jobs:
+            self.run_job(job)
+
+    def run_forever(self, poll_interval=1.0):
+        logger.info(f"Scheduler started with jobs: {', '.join(job.name for job in self.jobs)}")
+        while not self._stop.is_set():
+            self.run_pending()
+            next_run = min((job.next_run for job in self.jobs), default=self.clock() + poll_interval)
+            self._stop.wait(max(min(next_run - self.clock(), poll_interval * 60), poll_interval))
+        logger.info("Scheduler stopped")
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,130 @@
+import logging
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+# Bind key of the optional read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+
+def is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(url, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=3600, busy_timeout=5000):
+    """SQLAlchemy engine options for a database URL.
+
+    SQLite files get a bounded connection pool and the driver's busy
+    timeout, so writers queue for the lock instead of failing with
+    "database is locked". Server databases also get a recycled,
+    pre-pinged pool. In-memory SQLite keeps Flask-SQLAlchemy's defaults.
+    """
+    backend = make_url(url).get_backend_name()
+    if backend == 'sqlite':
+        if not is_sqlite_file(url):
+            return {}
+        return {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'connect_args': {'timeout': busy_timeout / 1000}
+        }
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': True
+    }
+
+
+def sqlite_pragmas(journal_mode='WAL', synchronous='NORMAL', cache_size_kb=20000, mmap_size=268435456,
+                   busy_timeout=5000, read_only=False):
+    """PRAGMA statements run on every new SQLite connection, in order.
+
+    WAL lets readers carry on while a single writer commits, and
+    synchronous=NORMAL is durable under WAL except for the last commits
+    before a power loss. ``cache_size_kb`` and ``mmap_size`` size the page
+    cache and the memory map per connection. A read-only connection skips
+    the pragmas that write to the database.
+    """
+    pragmas = []
+    if not read_only:
+        if journal_mode:
+            pragmas.append(('journal_mode', journal_mode))
+        if synchronous:
+            pragmas.append(('synchronous', synchronous))
+    pragmas.append(('busy_timeout', int(busy_timeout)))
+    if cache_size_kb:
+        # Negative sizes are in KiB rather than pages
+        pragmas.append(('cache_size', -int(cache_size_kb)))
+    if mmap_size is not None:
+        pragmas.append(('mmap_size', int(mmap_size)))
+    pragmas.append(('temp_store', 'MEMORY'))
+    return pragmas
+
+
+def apply_pragmas(connection, pragmas):
+    """Run the pragmas on a DB-API sqlite3 connection"""
+    cursor = connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def install_pragmas(engine, pragmas):
+    """Apply the pragmas to every connection a SQLite engine opens; other backends are left alone"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+    return True
+
+
+def describe_engine(engine):
+    """Backend, pool and effective SQLite settings of an engine, for health output"""
+    info = {
+        'backend': engine.dialect.name,
+        'database': engine.url.render_as_string(hide_password=True),
+        'pool': engine.pool.status()
+    }
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            info['pragmas'] = {
+                name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size')
+            }
+    return info
+
+
+class RoutingSession(Session):
+    """Session that sends the plain SELECTs of GET requests to the read replica when one is configured.
+
+    Everything else, and every statement after the session's first write
+    or flush, goes to the primary so a request always reads its own
+    writes. Sessions are scoped to the app context, so each request
+    starts on the replica again; form posts, migrations, CLI commands and
+    background jobs only ever use the primary. Without a replica bind
+    this behaves exactly like Flask-SQLAlchemy's session.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get('wrote') and has_request_context() \
+                and request.method in ('GET', 'HEAD'):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                if isinstance(clause, Select) and not self._flushing:
+                    return replica
+                self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,289 @@
+import math
+from bisect import bisect_right, insort
+from collections.abc import Mapping
+
+_MASK64 = (1 << 64) - 1
+
+
+class RunningStats:
+    """Count, mean, variance, min and max in one pass (Welford's algorithm)"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def add_summary(self, count, total, minimum, maximum, m2=0.0):
+        """Fold in a pre-aggregated group (Chan et al.); ``m2`` is its sum of squared deviations.
+
+        Rollups that do not keep ``m2`` contribute only their spread around
+        each other to the variance.
+        """
+        if not count:
+            return
+        mean = total / count
+        combined = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / combined
+        self.mean += delta * count / combined
+        self.count = combined
+        if minimum is not None and (self.min is None or minimum < self.min):
+            self.min = minimum
+        if maximum is not None and (self.max is None or maximum > self.max):
+            self.max = maximum
+
+    def merge(self, other):
+        self.add_summary(other.count, other.mean * other.count, other.min, other.max, other.m2)
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance; zero until there are two values"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile in constant memory (the P² algorithm).
+
+    Five markers track the minimum, the maximum, the quantile and the two
+    points halfway to it; each new value nudges them along a parabola.
+    Exact while fewer than six values have been seen.
+    """
+
+    __slots__ = ('p', 'count', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        self.count += 1
+        heights = self.heights
+        if self.count <= 5:
+            insort(heights, value)
+            return
+
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = bisect_right(heights, value) - 1
+        positions = self.positions
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+        for index in range(5):
+            self.desired[index] += self.increments[index]
+
+        for index in (1, 2, 3):
+            offset = self.desired[index] - positions[index]
+            if (offset >= 1 and positions[index + 1] - positions[index] > 1) or \
+                    (offset <= -1 and positions[index - 1] - positions[index] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = heights[index] + step * (heights[index + step] - heights[index]) / \
+                        (positions[index + step] - positions[index])
+                heights[index] = height
+                positions[index] += step
+
+    def _parabolic(self, index, step):
+        q, n = self.heights, self.positions
+        return q[index] + step / (n[index + 1] - n[index - 1]) * (
+            (n[index] - n[index - 1] + step) * (q[index + 1] - q[index]) / (n[index + 1] - n[index])
+            + (n[index + 1] - n[index] - step) * (q[index] - q[index - 1]) / (n[index] - n[index - 1])
+        )
+
+    def value(self):
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            # Linear interpolation between the closest ranks
+            rank = self.p * (len(self.heights) - 1)
+            low = int(rank)
+            high = min(low + 1, len(self.heights) - 1)
+            return self.heights[low] + (self.heights[high] - self.heights[low]) * (rank - low)
+        return self.heights[2]
+
+
+def _hash64(value):
+    # splitmix64 finaliser: spreads Python's hash (identity for small ints) over all 64 bits
+    h = (hash(value) + 0x9E3779B97F4A7C15) & _MASK64
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return h ^ (h >> 31)
+
+
+class DistinctCounter:
+    """Exact distinct count up to ``threshold`` values, then a HyperLogLog estimate.
+
+    Past the threshold the values are dropped for ``2 ** precision`` one-byte
+    registers (about 3% error at the default precision), so memory stays
+    bounded however many distinct values stream past.
+    """
+
+    __slots__ = ('threshold', 'precision', 'values', 'registers')
+
+    def __init__(self, threshold=256, precision=10):
+        self.threshold = threshold
+        self.precision = precision
+        self.values = set()
+        self.registers = None
+
+    def add(self, value):
+        if self.registers is None:
+            self.values.add(value)
+            if len(self.values) > self.threshold:
+                self.registers = bytearray(1 << self.precision)
+                for seen in self.values:
+                    self._add_hash(_hash64(seen))
+                self.values = None
+            return
+        self._add_hash(_hash64(value))
+
+    def _add_hash(self, h):
+        width = 64 - self.precision
+        index = h >> width
+        rank = width - (h & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        if self.registers is None:
+            return len(self.values)
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+def _field(row, name):
+    if isinstance(row, Mapping):
+        return row.get(name)
+    return getattr(row, name)
+
+
+class GroupStats:
+    """Accumulators for one group: rows seen, value statistics, quantiles and distinct counts"""
+
+    __slots__ = ('rows', 'stats', 'quantiles', 'distinct')
+
+    def __init__(self, quantiles, distinct):
+        self.rows = 0
+        self.stats = RunningStats()
+        self.quantiles = [P2Quantile(p) for p in quantiles]
+        self.distinct = {name: DistinctCounter() for name in distinct}
+
+    def as_dict(self):
+        return {
+            'count': self.rows,
+            'mean': self.stats.mean if self.stats.count else None,
+            'min': self.stats.min,
+            'max': self.stats.max,
+            'variance': self.stats.variance,
+            'std': self.stats.std,
+            'quantiles': {quantile.p: quantile.value() for quantile in self.quantiles},
+            'distinct': {name: counter.count() for name, counter in self.distinct.items()}
+        }
+
+
+class StreamingAggregator:
+    """Per-group and overall statistics computed in a single pass over any iterable of rows.
+
+    Rows may be dicts, SQLAlchemy rows or objects, from a streamed DB
+    cursor or a generator of API pages. ``key`` names the fields that form
+    a group (empty for totals only), ``value`` the measured field (rows
+    where it is None still count), and ``distinct`` the fields whose
+    distinct values are counted per group. Memory grows with the number
+    of groups, never with the number of rows.
+    """
+
+    def __init__(self, key=(), value='price', distinct=(), quantiles=(0.5, 0.9)):
+        self.key = tuple(key)
+        self.value = value
+        self.distinct = tuple(distinct)
+        self.quantiles = tuple(quantiles)
+        self.total = self._new_group()
+        self._groups = {}
+
+    def _new_group(self):
+        return GroupStats(self.quantiles, self.distinct)
+
+    def _targets(self, row):
+        if not self.key:
+            return (self.total,)
+        group_key = tuple(_field(row, name) for name in self.key)
+        group = self._groups.get(group_key)
+        if group is None:
+            group = self._groups[group_key] = self._new_group()
+        return self.total, group
+
+    def add(self, row):
+        value = _field(row, self.value)
+        distinct_values = [(name, _field(row, name)) for name in self.distinct]
+        for group in self._targets(row):
+            group.rows += 1
+            if value is not None:
+                group.stats.add(value)
+                for quantile in group.quantiles:
+                    quantile.add(value)
+            for name, distinct_value in distinct_values:
+                if distinct_value is not None:
+                    group.distinct[name].add(distinct_value)
+
+    def add_summary(self, row, count, total, minimum, maximum):
+        """Fold in a row that is itself an aggregate (e.g. a rollup) of ``count`` raw rows.
+
+        Quantiles are not updated, since the individual values are unknown.
+        """
+        distinct_values = [(name, _field(row, name)) for name in self.distinct]
+        for group in self._targets(row):
+            group.rows += count or 0
+            group.stats.add_summary(count, total, minimum, maximum)
+            for name, distinct_value in distinct_values:
+                if distinct_value is not None:
+                    group.distinct[name].add(distinct_value)
+
+    def consume(self, rows):
+        for row in rows:
+            self.add(row)
+        return self
+
+    def groups(self):
+        """{group key tuple: stats dict} in key order"""
+        return {key: self._groups[key].as_dict() for key in sorted(self._groups, key=_sort_key)}
+
+    def summary(self):
+        return self.total.as_dict()
+
+
+def _sort_key(key):
+    # None sorts first without comparing against other types
+    return tuple((part is not None, part) for part in key)
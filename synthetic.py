@@ -0,0 +1,209 @@
+"""Synthetic data.gov.in market price records and a local stub of the resource.
+
+The generator is deterministic: the same parameters always produce the
+same records in the same order, so benchmark runs are comparable.
+"""
+import json
+import math
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice, product
+from urllib.parse import parse_qs, urlsplit
+
+COMMODITY_NAMES = (
+    'Tomato', 'Onion', 'Potato', 'Brinjal', 'Cabbage', 'Cauliflower', 'Carrot', 'Beans',
+    'Green Chilli', 'Lemon', 'Banana', 'Coconut', 'Ginger', 'Garlic', 'Rice', 'Wheat',
+    'Maize', 'Groundnut', 'Turmeric', 'Tapioca'
+)
+# (variety, price factor) pairs; every commodity is reported in the first ``varieties`` of them
+VARIETIES = (('Local', 1.0), ('Hybrid', 1.12), ('Other', 0.9), ('Desi', 1.25))
+
+
+def _unit(*parts):
+    """Deterministic pseudo-random number in [0, 1) for the given parts"""
+    return zlib.crc32('|'.join(str(part) for part in parts).encode()) / 2 ** 32
+
+
+class SyntheticMarket:
+    """Every market of every district reports every variety of every commodity on every day up to ``end``.
+
+    Names carry their indices ("State 01", "District 01-02", "Market
+    01-02-03"); modal prices per quintal follow a per-commodity base, a
+    variety factor, a per-market premium, a monthly cycle and seeded noise.
+    """
+
+    def __init__(self, states=3, districts=4, markets=5, commodities=20, days=30, end=None, seed=1, varieties=2):
+        self.states = states
+        self.districts = districts
+        self.markets = markets
+        self.commodities = commodities
+        self.varieties = min(max(varieties, 1), len(VARIETIES))
+        self.days = days
+        self.end = end or date.today()
+        self.seed = seed
+        self.dates = [self.end - timedelta(days=offset) for offset in range(days)]
+        self._date_index = {day.strftime('%d/%m/%Y'): index for index, day in enumerate(self.dates)}
+        self._state_index = {self.state_name(s): s for s in range(states)}
+        self._district_index = {
+            self.district_name(s, d): (s, d) for s in range(states) for d in range(districts)
+        }
+        self._commodity_index = {self.commodity_name(c): c for c in range(commodities)}
+
+    @property
+    def records_per_day(self):
+        return self.states * self.districts * self.markets * self.commodities * self.varieties
+
+    @property
+    def total(self):
+        return self.records_per_day * self.days
+
+    @staticmethod
+    def state_name(s):
+        return f"State {s + 1:02d}"
+
+    @staticmethod
+    def district_name(s, d):
+        return f"District {s + 1:02d}-{d + 1:02d}"
+
+    @staticmethod
+    def market_name(s, d, m):
+        return f"Market {s + 1:02d}-{d + 1:02d}-{m + 1:02d}"
+
+    @staticmethod
+    def commodity_name(c):
+        return COMMODITY_NAMES[c] if c < len(COMMODITY_NAMES) else f"Commodity {c + 1:03d}"
+
+    def record(self, day, s, d, m, c, v=0):
+        """The raw upstream record of one market, commodity, variety and day index"""
+        arrival = self.dates[day]
+        variety, factor = VARIETIES[v]
+        base = (800 + 6000 * _unit(self.seed, 'commodity', c)) * factor
+        premium = 0.85 + 0.3 * _unit(self.seed, 'market', s, d, m)
+        cycle = 1 + 0.08 * math.sin(2 * math.pi * arrival.toordinal() / 30)
+        noise = 0.95 + 0.1 * _unit(self.seed, s, d, m, c, v, arrival.toordinal())
+        modal = round(base * premium * cycle * noise)
+        return {
+            'State': self.state_name(s),
+            'District': self.district_name(s, d),
+            'Market': self.market_name(s, d, m),
+            'Commodity': self.commodity_name(c),
+            'Variety': variety,
+            'Grade': 'FAQ',
+            'Arrival_Date': arrival.strftime('%d/%m/%Y'),
+            'Min_Price': str(round(modal * 0.85)),
+            'Max_Price': str(round(modal * 1.15)),
+            'Modal_Price': str(modal),
+            'Commodity_Code': str(c + 1)
+        }
+
+    def _matching(self, arrival_date=None, state=None, district=None, commodity=None):
+        """Index ranges selected by the resource's equality filters"""
+        def pick(index, value, default):
+            if value is None:
+                return default
+            found = index.get(value)
+            return [] if found is None else [found]
+
+        days = pick(self._date_index, arrival_date, range(self.days))
+        states = pick(self._state_index, state, range(self.states))
+        if district is None:
+            regions = [(s, d) for s in states for d in range(self.districts)]
+        else:
+            found = self._district_index.get(district)
+            regions = [found] if found is not None and found[0] in states else []
+        commodities = pick(self._commodity_index, commodity, range(self.commodities))
+        return days, regions, commodities
+
+    def count(self, **filters):
+        days, regions, commodities = self._matching(**filters)
+        return len(days) * len(regions) * self.markets * len(commodities) * self.varieties
+
+    def iter_records(self, offset=0, limit=None, **filters):
+        """Matching records in a stable order, newest day first"""
+        days, regions, commodities = self._matching(**filters)
+        keys = product(days, regions, range(self.markets), commodities, range(self.varieties))
+        stop = None if limit is None else offset + limit
+        for day, (s, d), m, c, v in islice(keys, offset, stop):
+            yield self.record(day, s, d, m, c, v)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        stub = self.server.stub
+        query = {name: values[-1] for name, values in parse_qs(urlsplit(self.path).query).items()}
+        if stub.delay:
+            time.sleep(stub.delay)
+        filters = {
+            'arrival_date': query.get('filters[Arrival_Date]'),
+            'state': query.get('filters[State]'),
+            'district': query.get('filters[District]'),
+            'commodity': query.get('filters[Commodity]')
+        }
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', 10))
+        records = list(stub.market.iter_records(offset, limit, **filters))
+        fields = [name for name in query.get('fields', '').split(',') if name]
+        if fields:
+            records = [{name: record[name] for name in fields if name in record} for record in records]
+        body = json.dumps({
+            'status': 'ok',
+            'total': stub.market.count(**filters),
+            'count': len(records),
+            'offset': offset,
+            'limit': limit,
+            'records': records
+        }).encode()
+        with stub.lock:
+            stub.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubUpstream:
+    """The data.gov.in resource served from a SyntheticMarket on a local port.
+
+    Honours ``filters[Arrival_Date|State|District|Commodity]``, ``offset``,
+    ``limit`` and ``fields`` like the real resource, optionally after
+    ``delay`` seconds per request.
+    """
+
+    def __init__(self, market, delay=0.0, host='127.0.0.1', port=0):
+        self.market = market
+        self.delay = delay
+        self.requests = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/resource"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
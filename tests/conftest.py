@@ -0,0 +1,73 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# The app reads its configuration at import time, so the scratch database goes in first
+_scratch = tempfile.mkdtemp(prefix='market-tests-')
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(_scratch, 'market.db')}",
+    'MARKET_CACHE_SHARED_PATH': os.path.join(_scratch, 'market_cache.db'),
+    'MARKET_STATE': 'State 01',
+    'MARKET_DISTRICT': 'District 01-01',
+    'MARKET_RATE_LIMIT': '0',
+    'MARKET_RETRIES': '0',
+    'MARKET_LIVE_FALLBACK': '0',
+    'METRICS_MULTIPROC_DIR': '',
+    'PROFILE_SLOW_REQUESTS': '0'
+})
+
+import pytest
+
+from synthetic import StubUpstream, SyntheticMarket
+
+
+@pytest.fixture(scope='session')
+def market_app():
+    import app as market_app
+    return market_app
+
+
+@pytest.fixture(scope='session')
+def synthetic_market():
+    return SyntheticMarket(states=1, districts=2, markets=3, commodities=4, days=10, varieties=2)
+
+
+@pytest.fixture(scope='session')
+def upstream(market_app, synthetic_market):
+    with StubUpstream(synthetic_market) as stub:
+        market_app.upstream_client.base_url = stub.url
+        yield stub
+
+
+@pytest.fixture
+def app_context(market_app):
+    with market_app.app.app_context():
+        yield market_app
+
+
+@pytest.fixture
+def seeded(app_context, upstream, synthetic_market):
+    """Every day of the synthetic market ingested into emptied tables, with every cache cleared"""
+    market_app = app_context
+    upstream.market = synthetic_market
+    for model in (market_app.PriceForecast, market_app.ForecastSeries, market_app.PriceSpread,
+                  market_app.PriceRollup, market_app.IngestCheckpoint, market_app.IngestRun, market_app.MarketData):
+        model.query.delete()
+    market_app.db.session.commit()
+    for cache in (market_app.page_cache, market_app.fragment_cache, market_app.analytics_cache,
+                  market_app.response_cache):
+        cache.clear()
+    market_app.commodity_lookup.invalidate()
+    market_app.market_lookup.invalidate()
+
+    api = market_app.MarketAPI(cache=False)
+    for day in synthetic_market.dates:
+        api.ingest_date(day.strftime('%d/%m/%Y'))
+    return market_app
+
+
+@pytest.fixture
+def client(market_app):
+    return market_app.app.test_client()
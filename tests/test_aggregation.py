@@ -0,0 +1,42 @@
+import pytest
+
+from streaming import StreamingAggregator
+
+QUANTILE_FIELDS = ('p50_price', 'p90_price')
+
+
+@pytest.fixture
+def aggregator(seeded):
+    return seeded.PriceAggregator(seeded.db.session, seeded.market_data_source())
+
+
+def test_stream_keeps_the_sql_aggregates(aggregator):
+    groups, summary = aggregator.stream(('commodity',), quantiles=(0.5, 0.9))
+
+    without_quantiles = [
+        {key: value for key, value in group.items() if key not in QUANTILE_FIELDS} for group in groups
+    ]
+    assert without_quantiles == aggregator.group(('commodity',))
+    assert {key: value for key, value in summary.items() if key not in QUANTILE_FIELDS} == aggregator.summary()
+
+
+def test_stream_adds_the_quantiles_per_group(aggregator):
+    groups, summary = aggregator.stream(('commodity',), quantiles=(0.5, 0.9))
+
+    for group in groups + [summary]:
+        assert group['min_price'] <= group['p50_price'] <= group['p90_price'] <= group['max_price']
+        assert group['std_price'] > 0
+
+
+def test_sql_variance_matches_a_streamed_pass(seeded, aggregator):
+    source = seeded.market_data_source()
+    streamed = StreamingAggregator(('commodity',), 'price', quantiles=())
+    streamed.consume(seeded.db.session.execute(seeded.select(source.c.price, source.c.commodity)))
+    by_key = streamed.groups()
+
+    groups, summary = aggregator.stream(('commodity',))
+
+    assert not any(field in summary for field in QUANTILE_FIELDS)
+    for group in groups:
+        assert group['variance'] == pytest.approx(by_key[(group['commodity'],)]['variance'])
+    assert summary['std_price'] == pytest.approx(streamed.summary()['std'])
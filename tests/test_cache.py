@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from cache import ResponseCache
+
+
+def test_concurrent_misses_share_one_load():
+    cache = ResponseCache(ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return {'records': [{'price': 1}]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load(('01/01/2024',), loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats.as_dict()['collapsed'] < 7:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [{'records': [{'price': 1}]}] * 8
+    assert cache.stats.as_dict()['collapsed'] == 7
+
+
+def test_followers_see_the_leaders_error():
+    cache = ResponseCache(ttl=60)
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            cache.get_or_load(('key',), failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while not cache.stats.as_dict()['collapsed']:
+        threading.Event().wait(0.01)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ['upstream down', 'upstream down']
+    assert cache.stats.as_dict()['load_errors'] == 1
+
+
+def test_empty_responses_are_cached_for_the_negative_ttl():
+    cache = ResponseCache(ttl=60, negative_ttl=60)
+    calls = []
+    load = lambda: calls.append(1) or {'records': []}
+
+    cache.get_or_load(('empty',), load)
+    cache.get_or_load(('empty',), load)
+
+    assert len(calls) == 1
+    assert cache.stats.as_dict()['negative_hits'] == 1
+
+
+@pytest.mark.parametrize('response', [{'records': []}, {'error': 'rate limited'}])
+def test_empty_responses_expire_and_errors_are_never_cached(response):
+    cache = ResponseCache(ttl=60, negative_ttl=0)
+    calls = []
+
+    for _ in range(2):
+        cache.get_or_load(('key',), lambda: calls.append(1) or response)
+
+    assert len(calls) == 2
+
+
+def test_shared_hit_keeps_the_shared_entrys_remaining_ttl(tmp_path):
+    writer = ResponseCache(ttl=300, shared_path=str(tmp_path / 'cache.db'))
+    writer.get_or_load(('01/01/2024',), lambda: {'records': [{'price': 1}]})
+    key = ResponseCache.make_key(('01/01/2024',))
+    conn = writer.shared._connection()
+    conn.execute('UPDATE cache_entries SET expires_at = ? WHERE key = ?', (time.time() + 5, key))
+    conn.commit()
+
+    reader = ResponseCache(ttl=300, shared_path=str(tmp_path / 'cache.db'))
+    assert reader.get_or_load(('01/01/2024',), lambda: pytest.fail('shared hit expected')) == {
+        'records': [{'price': 1}]
+    }
+
+    _, expires_at = reader.local._entries[key]
+    assert expires_at - time.monotonic() <= 5
@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+
+def test_unchanged_dashboard_revalidates_with_304(seeded, client):
+    path = '/dashboard'
+    first = client.get(path)
+    etag = first.headers['ETag']
+
+    again = client.get(path, headers={'If-None-Match': etag})
+
+    assert again.status_code == 304
+    assert again.get_data() == b''
+
+
+def test_cached_dashboard_is_rebuilt_on_a_new_day(seeded, client, monkeypatch):
+    client.get('/dashboard')
+    client.get('/dashboard')
+    misses = seeded.page_cache.stats.as_dict()['misses']
+
+    class Tomorrow(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(days=1)
+
+    monkeypatch.setattr(seeded, 'datetime', Tomorrow)
+    assert client.get('/dashboard').status_code == 200
+    assert seeded.page_cache.stats.as_dict()['misses'] == misses + 1
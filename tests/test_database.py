@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'prices.db')
+    database.init_db(conn)
+    yield conn
+    conn.close()
+
+
+def stored(conn):
+    return conn.execute('SELECT state, district, market, commodity, price, date FROM market_prices').fetchall()
+
+
+def test_reloading_records_replaces_their_prices(conn):
+    record = {'State': 'S', 'District': 'D', 'Market': 'M', 'Commodity': 'Onion',
+              'Arrival_Date': '01/06/2024', 'Modal_x0020_Price': '2000'}
+    database.insert_market_data_batch([record], conn=conn)
+    database.insert_market_data_batch([dict(record, Modal_x0020_Price='2500')], conn=conn)
+
+    assert stored(conn) == [('S', 'D', 'M', 'Onion', 25.0, '2024-06-01')]
+
+
+def test_single_inserts_store_iso_dates_on_the_same_key(conn):
+    database.insert_market_data_batch([{
+        'state': 'S', 'district': 'D', 'market': 'M', 'commodity': 'Onion', 'price': 20.0, 'date': '2024-06-01'
+    }], conn=conn)
+    database.insert_market_data({
+        'state': 'S', 'district': 'D', 'market': 'M', 'commodity': 'Onion', 'price': 21.0, 'date': '01/06/2024'
+    }, conn=conn)
+
+    assert stored(conn) == [('S', 'D', 'M', 'Onion', 21.0, '2024-06-01')]
+
+
+def test_older_tables_get_iso_dates_and_one_row_per_observation(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'old.db')
+    conn.execute('CREATE TABLE market_prices (id INTEGER PRIMARY KEY AUTOINCREMENT, state TEXT, district TEXT, '
+                 'market TEXT, commodity TEXT, price REAL, date TEXT)')
+    conn.executemany(
+        'INSERT INTO market_prices (state, district, market, commodity, price, date) VALUES (?, ?, ?, ?, ?, ?)',
+        [('S', 'D', 'M', 'Onion', 20.0, '01/06/2024'), ('S', 'D', 'M', 'Onion', 22.0, '2024-06-01')]
+    )
+    conn.commit()
+
+    database.init_db(conn)
+
+    assert stored(conn) == [('S', 'D', 'M', 'Onion', 22.0, '2024-06-01')]
+    conn.close()
@@ -0,0 +1,24 @@
+def test_moving_a_row_refreshes_both_markets(seeded, client, synthetic_market):
+    MarketData, PriceRollup, PriceSpread = seeded.MarketData, seeded.PriceRollup, seeded.PriceSpread
+    row = MarketData.query.filter(MarketData.date == synthetic_market.dates[0]).first()
+    row_id, old_market_id, commodity_id, day = row.id, row.market_id, row.commodity_id, row.date
+    old_day_rollup = PriceRollup.query.filter_by(
+        grain='day', period_start=day, market_id=old_market_id, commodity_id=commodity_id
+    ).one().record_count
+    version = seeded.data_version()[0]
+
+    response = client.post(f'/edit-market-data/{row_id}', data={
+        'market': 'Market Moved', 'commodity': row.commodity, 'price': '12.5'
+    })
+
+    assert response.status_code == 302
+    seeded.db.session.expire_all()
+    moved = seeded.db.session.get(MarketData, row_id)
+    assert moved.market_id != old_market_id
+    assert PriceRollup.query.filter_by(
+        grain='day', period_start=day, market_id=old_market_id, commodity_id=commodity_id
+    ).one().record_count == old_day_rollup - 1
+    assert PriceRollup.query.filter_by(grain='day', period_start=day, market_id=moved.market_id).one().avg_price == 12.5
+    spread = PriceSpread.query.filter_by(commodity_id=commodity_id, date=day).one()
+    assert moved.market_id in (spread.buy_market_id, spread.sell_market_id)
+    assert seeded.data_version()[0] > version
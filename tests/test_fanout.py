@@ -0,0 +1,55 @@
+from sqlalchemy.exc import OperationalError
+
+
+def test_unfinished_run_is_resumed_and_a_finished_one_is_not(seeded, monkeypatch, synthetic_market):
+    store = seeded.store_market_records
+    failing = {'District 01-02'}
+
+    def locked(records):
+        if any(record['district'] in failing for record in records):
+            raise OperationalError('INSERT', {}, Exception('database is locked'))
+        return store(records)
+
+    monkeypatch.setattr(seeded, 'store_market_records', locked)
+    monkeypatch.setitem(seeded.app.config, 'INGEST_RETRIES', 1)
+
+    first = seeded.ingest_all_regions(days=1)
+    assert len(first.failed) == 1
+    assert seeded.ingest_run_id() == first.run_id
+
+    failing.clear()
+    resumed = seeded.ingest_all_regions(days=1)
+    assert resumed.run_id == first.run_id
+    assert (resumed.skipped, resumed.completed, resumed.failed) == (first.completed, 1, [])
+
+    fresh = seeded.ingest_all_regions(days=1)
+    assert fresh.run_id != first.run_id
+    assert (fresh.skipped, fresh.completed) == (0, synthetic_market.districts)
+
+
+def test_failed_writes_fail_the_region(seeded, monkeypatch, synthetic_market):
+    def locked(records):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(seeded, 'store_market_records', locked)
+    monkeypatch.setitem(seeded.app.config, 'INGEST_RETRIES', 1)
+
+    report = seeded.ingest_all_regions('regions-locked', days=1)
+
+    assert report.completed == 0
+    assert len(report.failed) == synthetic_market.districts
+    statuses = {checkpoint.status for checkpoint in seeded.IngestCheckpoint.query.filter_by(run_id='regions-locked')}
+    assert statuses == {'failed'}
+
+
+def test_interactive_fetch_still_serves_records_when_storing_fails(seeded, monkeypatch, synthetic_market):
+    def locked(records):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(seeded, 'store_market_records', locked)
+    day = synthetic_market.dates[0].strftime('%d/%m/%Y')
+
+    data = seeded.MarketAPI(cache=False).fetch_data_for_date(day, 'State 01', 'District 01-01')
+
+    assert data['count'] == synthetic_market.records_per_day // synthetic_market.districts
+    assert 'error' not in data
@@ -0,0 +1,32 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import forecast
+
+
+def test_a_refit_starts_one_pool_for_all_chunks(seeded, monkeypatch):
+    pools = []
+
+    def fitting_pool(workers):
+        pools.append(workers)
+        return ThreadPoolExecutor(workers)
+
+    monkeypatch.setattr(forecast, 'fitting_pool', fitting_pool)
+    maintainer = seeded.forecast_maintainer(workers=2)
+    maintainer.chunk_size = 5
+
+    run = maintainer.refit(full=True, commit=seeded.db.session.commit)
+
+    assert run.stale > maintainer.chunk_size
+    assert run.fitted == run.stale
+    assert pools == [2]
+
+
+def test_fingerprints_count_raw_rows(seeded):
+    maintainer = seeded.forecast_maintainer(workers=1)
+    market_data = seeded.MarketData
+
+    for (market_id, commodity_id), (rows, _, _) in maintainer.fingerprints().items():
+        assert rows == market_data.query.filter(
+            market_data.market_id == market_id, market_data.commodity_id == commodity_id,
+            market_data.modal_price.isnot(None), market_data.date.isnot(None)
+        ).count()
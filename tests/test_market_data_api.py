@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+
+def test_cursor_round_trip(market_app):
+    cursor = market_app.encode_cursor(date(2024, 3, 9), 1234)
+
+    assert market_app.decode_cursor(cursor) == (date(2024, 3, 9), 1234)
+    with pytest.raises(ValueError):
+        market_app.decode_cursor('not-a-cursor')
+
+
+def test_keyset_pages_cover_every_row_once(seeded, client, synthetic_market):
+    # The configured district's share of the synthetic market
+    expected = synthetic_market.records_per_day // synthetic_market.districts * synthetic_market.days
+    seen = []
+    cursor = None
+    while True:
+        query = '/api/market-data?limit=25&fields=id,date' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(query).get_json()
+        seen.extend(record['id'] for record in page['records'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(seen) == expected
+    assert len(set(seen)) == expected
+
+
+def test_invalid_cursor_is_a_client_error(seeded, client):
+    response = client.get('/api/market-data?cursor=bogus')
+
+    assert response.status_code == 400
+    assert 'Invalid cursor' in response.get_json()['error']
+
+
+def test_unchanged_pages_revalidate_with_304(seeded, client):
+    path = '/api/market-data?limit=10'
+    first = client.get(path)
+    etag = first.headers['ETag']
+
+    again = client.get(path, headers={'If-None-Match': etag})
+
+    assert again.status_code == 304
+    assert again.get_data() == b''
@@ -0,0 +1,17 @@
+import forecast
+
+
+def test_varieties_are_separate_observations(seeded, synthetic_market):
+    MarketData = seeded.MarketData
+    day = synthetic_market.dates[0]
+    rows = MarketData.query.filter(MarketData.date == day).all()
+
+    assert len(rows) == synthetic_market.records_per_day
+    assert len({row.variety for row in rows}) == synthetic_market.varieties
+
+
+def test_same_day_varieties_are_averaged():
+    first, values = forecast.calendar_series([(10, 4.0), (10, 6.0), (12, 8.0)])
+
+    assert first == 10
+    assert values.tolist() == [5.0, 5.0, 8.0]
@@ -0,0 +1,51 @@
+import json
+import os
+
+from metrics import MetricsRegistry
+
+
+def registry_in(directory):
+    registry = MetricsRegistry(str(directory))
+    requests = registry.counter('http_requests_total', 'Responses', ('route',))
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    registry.register_collector(lambda: [('cache_entries', 'gauge', 'Entries', [({'cache': 'pages'}, 3)])])
+    return registry, requests, latency
+
+
+def test_scrapes_sum_the_snapshots_of_every_worker(tmp_path):
+    registry, requests, latency = registry_in(tmp_path)
+    requests.inc(route='/dashboard')
+    latency.observe(0.05)
+    # Another worker's snapshot, as its writer thread would leave it
+    (tmp_path / 'metrics-1.json').write_text(json.dumps({
+        'http_requests_total': [[['/dashboard'], 4], [['/reports'], 2]],
+        'latency_seconds': [[[], [[1, 2], 3.5, 4]]]
+    }))
+
+    text = registry.render()
+
+    assert 'http_requests_total{route="/dashboard"} 5' in text
+    assert 'http_requests_total{route="/reports"} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{le="1"} 4' in text
+    assert 'latency_seconds_count 5' in text
+    assert f'cache_entries{{cache="pages",pid="{os.getpid()}"}} 3' in text
+
+
+def test_own_snapshot_is_not_counted_twice(tmp_path):
+    registry, requests, _ = registry_in(tmp_path)
+    requests.inc(3, route='/dashboard')
+    registry.write_snapshot()
+
+    assert 'http_requests_total{route="/dashboard"} 3' in registry.render()
+
+
+def test_without_a_directory_metrics_are_per_process():
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', 'Jobs').inc()
+    registry.register_collector(lambda: [('up', 'gauge', 'Up', [({}, 1)])])
+
+    text = registry.render()
+
+    assert 'jobs_total 1' in text
+    assert 'up 1' in text
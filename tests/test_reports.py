@@ -0,0 +1,16 @@
+import export
+
+
+def test_report_export_url_is_escaped_in_the_script(seeded, client):
+    body = client.get("/reports?state=x';alert(1);//").get_data(as_text=True)
+
+    assert "x';alert(1)" not in body
+    assert "x\\u0027;alert(1)" in body
+
+
+def test_parquet_is_offered_only_when_pyarrow_is_installed(seeded, client, monkeypatch):
+    monkeypatch.setattr(export, 'pyarrow', None)
+    assert 'value="parquet"' not in client.get('/reports').get_data(as_text=True)
+
+    monkeypatch.setattr(export, 'pyarrow', object())
+    assert 'value="parquet"' in client.get('/reports').get_data(as_text=True)
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+
+def rollup_rows(market_app):
+    return sorted(
+        (rollup.grain, rollup.period_start, rollup.market_id, rollup.commodity_id, rollup.record_count,
+         round(rollup.price_sum, 6))
+        for rollup in market_app.PriceRollup.query.all()
+    )
+
+
+def test_retention_keeps_rollups_equal_to_a_rebuild(seeded, monkeypatch):
+    monkeypatch.setitem(seeded.app.config, 'RETENTION_DAYS', 4)
+
+    report = seeded.cleanup_old_market_data()
+    assert report.rows > 0
+    after_purge = rollup_rows(seeded)
+
+    seeded.PriceRollup.query.delete()
+    seeded.RollupMaintainer(seeded.db.session, seeded.MarketData, seeded.PriceRollup).rebuild()
+
+    assert after_purge == rollup_rows(seeded)
+    oldest_spread = seeded.db.session.query(seeded.db.func.min(seeded.PriceSpread.date)).scalar()
+    assert oldest_spread >= report.cutoff
+    assert oldest_spread - report.cutoff < timedelta(days=1)
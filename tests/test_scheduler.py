@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from scheduler import IngestionScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_failing_job_is_retried_before_its_interval():
+    clock = Clock()
+    runs = []
+    scheduler = IngestionScheduler(jitter=0, min_retry=30, on_run=lambda job, *args: runs.append(args[-1]), clock=clock)
+    job = scheduler.add_job('ingest', 3600, lambda: 1 / 0)
+
+    scheduler.run_pending()
+
+    assert job.failures == 1
+    assert job.next_run == clock.now + 30
+    assert runs == ['division by zero']
+
+
+def test_slice_ingestion_raises_when_its_writes_fail(seeded, monkeypatch):
+    def locked(records):
+        raise OperationalError('INSERT', {}, Exception('database is locked'))
+
+    monkeypatch.setattr(seeded, 'store_market_records', locked)
+    monkeypatch.setitem(seeded.app.config, 'INGEST_SLICES', 'State 01:District 01-01')
+    monkeypatch.setitem(seeded.app.config, 'INGEST_DAYS', 1)
+    monkeypatch.setitem(seeded.app.config, 'INGEST_RETRIES', 1)
+
+    with pytest.raises(RuntimeError, match='Ingestion failed for State 01/District 01-01'):
+        seeded.ingest_configured_slices()
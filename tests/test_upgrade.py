@@ -0,0 +1,45 @@
+def test_requests_are_refused_until_the_database_is_upgraded(market_app, client, monkeypatch):
+    pending = ['old market_data layout']
+    monkeypatch.setattr(market_app, 'database_upgrades', list(pending))
+    monkeypatch.setattr(market_app, 'pending_upgrades', lambda: list(pending))
+
+    refused = client.get('/dashboard')
+    assert refused.status_code == 503
+    assert 'old market_data layout' in refused.get_json()['error']
+
+    pending.clear()
+    assert client.get('/dashboard').status_code != 503
+    assert market_app.database_upgrades == []
+
+
+def test_current_database_needs_no_upgrade(seeded):
+    assert seeded.pending_upgrades() == []
+
+
+def test_upgrade_copies_the_legacy_layout_and_builds_its_rollups_once(seeded, monkeypatch):
+    from sqlalchemy import inspect, text
+
+    refreshed = []
+    monkeypatch.setattr(seeded, 'refresh_rollups', lambda rows: refreshed.append(rows))
+    with seeded.db.engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE market_data_legacy (id INTEGER PRIMARY KEY, state TEXT, district TEXT, "
+            "market TEXT, commodity TEXT, date TEXT, price FLOAT)"
+        ))
+        conn.execute(text(
+            "INSERT INTO market_data_legacy (state, district, market, commodity, date, price) VALUES "
+            "('State 01', 'District 01-01', 'Legacy Mandi', 'Legacy Gram', '02/01/2020', 41.5), "
+            "('State 01', 'District 01-01', 'Legacy Mandi', 'Legacy Gram', '2020-01-03', 42.5)"
+        ))
+
+    seeded.upgrade_database(batch_size=1)
+
+    assert 'market_data_legacy' not in inspect(seeded.db.engine).get_table_names()
+    assert refreshed == []
+    market = seeded.Market.query.filter_by(name='Legacy Mandi').one()
+    copied = seeded.MarketData.query.filter_by(market_id=market.id).order_by(seeded.MarketData.date).all()
+    assert [(row.date.isoformat(), row.modal_price) for row in copied] == [
+        ('2020-01-02', 4150.0), ('2020-01-03', 4250.0)
+    ]
+    assert seeded.PriceRollup.query.filter_by(market_id=market.id, grain='day').count() == 2
+    assert seeded.pending_upgrades() == []
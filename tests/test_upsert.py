@@ -0,0 +1,28 @@
+from synthetic import SyntheticMarket
+
+
+def ingest_newest_day(market_app, synthetic_market):
+    return market_app.MarketAPI(cache=False).ingest_date(synthetic_market.dates[0].strftime('%d/%m/%Y'))
+
+
+def test_reingest_counts_unchanged_rows_and_keeps_the_data_version(seeded, synthetic_market):
+    version = seeded.data_version()[0]
+
+    stats = ingest_newest_day(seeded, synthetic_market)
+
+    assert stats.received == synthetic_market.records_per_day
+    assert (stats.inserted, stats.updated, stats.unchanged) == (0, 0, synthetic_market.records_per_day)
+    assert seeded.data_version()[0] == version
+
+
+def test_changed_prices_count_as_updates(seeded, synthetic_market, upstream):
+    repriced = SyntheticMarket(synthetic_market.states, synthetic_market.districts, synthetic_market.markets,
+                               synthetic_market.commodities, days=synthetic_market.days, end=synthetic_market.end,
+                               seed=synthetic_market.seed + 1, varieties=synthetic_market.varieties)
+    upstream.market = repriced
+    version = seeded.data_version()[0]
+
+    stats = ingest_newest_day(seeded, repriced)
+
+    assert (stats.inserted, stats.updated, stats.unchanged) == (0, repriced.records_per_day, 0)
+    assert seeded.data_version()[0] > version
@@ -0,0 +1,108 @@
+import pytest
+import requests
+
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Response:
+    def __init__(self, status_code, retry_after=None):
+        self.status_code = status_code
+        self.headers = {'Retry-After': retry_after} if retry_after else {}
+
+
+def client_with(responses, clock=None, retries=0, backoff_cap=8.0):
+    """Client whose session answers with (or raises) the given items in turn"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock or Clock())
+    sleeps = []
+    client = UpstreamClient('http://upstream.test', retries=retries, backoff_cap=backoff_cap, breaker=breaker,
+                            sleep=sleeps.append)
+    items = iter(responses)
+
+    def get(*args, **kwargs):
+        item = next(items)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    client.session.get = get
+    return client, sleeps
+
+
+def test_breaker_opens_after_the_threshold_and_short_circuits():
+    clock = Clock()
+    client, _ = client_with([Response(503), Response(503)], clock)
+
+    client.get()
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    client.get()
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get()
+
+
+def test_half_open_admits_one_trial_and_closes_on_success():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 31
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_trial_reopens_the_circuit():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 31
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.ChunkedEncodingError('truncated'),
+    requests.exceptions.InvalidURL('bad url'),
+    ValueError('unexpected')
+])
+def test_any_error_during_a_trial_settles_the_breaker(error):
+    clock = Clock()
+    client, _ = client_with([Response(503), Response(503), error, Response(200)], clock)
+    client.get()
+    client.get()
+    clock.now = 31
+
+    with pytest.raises(type(error)):
+        client.get()
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 62
+    assert client.get().status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_after_is_waited_in_full():
+    client, sleeps = client_with([Response(429, '5'), Response(200)], retries=1)
+
+    assert client.get().status_code == 200
+    assert sleeps == [5.0]
+
+
+def test_retry_after_beyond_the_cap_ends_the_retries():
+    client, sleeps = client_with([Response(503, '120'), Response(200)], retries=3)
+
+    assert client.get().status_code == 503
+    assert sleeps == []
+    assert client.metrics.as_dict()['failures'] == 1
@@ -0,0 +1,218 @@
+import logging
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from scheduler import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt: rate limited or a transient server failure
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Raised without calling the upstream while its circuit is open"""
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures until it has had time to recover.
+
+    After ``failure_threshold`` consecutive failed calls the circuit opens and
+    every call fails fast. Once ``reset_timeout`` seconds have passed a
+    single trial call is let through (half-open); its outcome closes the
+    circuit again or reopens it for another timeout.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.opened_count = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Whether a call may go out now; in half-open state only one trial call is allowed"""
+        with self._lock:
+            state = self._state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("Upstream circuit closed")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                self.opened_count += 1
+                logger.warning(f"Upstream circuit opened after {self.failures} consecutive failures")
+            self._trial_running = False
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'state': self._state(),
+                'consecutive_failures': self.failures,
+                'times_opened': self.opened_count
+            }
+
+
+class ClientMetrics:
+    """Thread-safe call counters and latency percentiles over the most recent calls"""
+
+    FIELDS = ('requests', 'attempts', 'successes', 'failures', 'retries', 'short_circuited')
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+        self._statuses = {}
+        self._latencies = deque(maxlen=window)
+
+    def incr(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def observe(self, latency, status):
+        with self._lock:
+            self._latencies.append(latency)
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            data = dict(self._counts)
+            data['statuses'] = {str(status): count for status, count in self._statuses.items()}
+            latencies = sorted(self._latencies)
+        data['latency'] = {
+            'samples': len(latencies),
+            'p50': round(latencies[len(latencies) // 2], 4) if latencies else None,
+            'p95': round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)], 4) if latencies else None,
+            'max': round(latencies[-1], 4) if latencies else None
+        }
+        return data
+
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header given as seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client for one upstream with retries and a circuit breaker.
+
+    Connection errors, timeouts and ``RETRY_STATUSES`` are retried up to
+    ``retries`` times with jittered exponential backoff, waiting at least
+    as long as a Retry-After header asks. A Retry-After beyond
+    ``backoff_cap`` ends the retries instead. A call that still fails, or
+    raises any other error, counts against the circuit breaker. ``limiter``
+    is any object whose ``acquire(url)`` blocks until a request may be sent.
+    """
+
+    def __init__(self, base_url, timeout=(3.05, 10), retries=3, backoff_base=0.5, backoff_cap=8.0,
+                 breaker=None, limiter=None, pool_size=32, sleep=time.sleep):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter
+        self.metrics = ClientMetrics()
+        self.sleep = sleep
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, params=None, headers=None):
+        """GET the base URL, returning the last response, which may still be an error status"""
+        self.metrics.incr('requests')
+        if not self.breaker.allow():
+            self.metrics.incr('short_circuited')
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(self.base_url)
+            self.metrics.incr('attempts')
+            started = time.perf_counter()
+            try:
+                response = self.session.get(self.base_url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.metrics.observe(time.perf_counter() - started, type(e).__name__)
+                if attempt >= self.retries:
+                    self._failed()
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                logger.warning(f"Upstream request failed ({str(e)}), retrying in {delay:.1f}s")
+            except Exception as e:
+                # Not retried, but still settles a half-open trial so the breaker can admit the next one
+                self.metrics.observe(time.perf_counter() - started, type(e).__name__)
+                self._failed()
+                raise
+            else:
+                self.metrics.observe(time.perf_counter() - started, response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    self.metrics.incr('successes')
+                    return response
+                retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                if attempt >= self.retries or (retry_after is not None and retry_after > self.backoff_cap):
+                    self._failed()
+                    return response
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                logger.warning(f"Upstream answered {response.status_code}, retrying in {delay:.1f}s")
+            attempt += 1
+            self.metrics.incr('retries')
+            self.sleep(delay)
+
+    def _failed(self):
+        self.metrics.incr('failures')
+        self.breaker.record_failure()
+
+    def info(self):
+        return {'circuit': self.breaker.as_dict(), **self.metrics.as_dict()}